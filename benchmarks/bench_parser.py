@@ -0,0 +1,41 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from mcp_popchain import php_ast
+from mcp_popchain.analyzer import read_php_files
+
+
+def _run(files, rounds: int, fresh: bool) -> float:
+    php_ast.reset_parser_cache()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for f in files:
+            if fresh:
+                # pre-cache behaviour: import, build and configure a parser for every file
+                php_ast.reset_parser_cache()
+            php_ast.analyze(f.text)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description="per-file tree-sitter parser overhead")
+    ap.add_argument("root", nargs="?", default=os.path.join(os.path.dirname(__file__), "..", "fixtures"))
+    ap.add_argument("--rounds", type=int, default=2000)
+    args = ap.parse_args()
+    files = read_php_files(args.root, [])
+    if not files:
+        print("no php files under", args.root)
+        return
+    calls = len(files) * args.rounds
+    print(f"ast available: {php_ast.available()}")
+    for label, fresh in (("uncached", True), ("cached", False)):
+        t = _run(files, args.rounds, fresh)
+        print(f"{label:>9}: {t * 1e6 / calls:8.1f} us/file ({calls} calls, {t:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
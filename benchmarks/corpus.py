@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import random
+from typing import Dict
+
+
+MAGIC = ["__destruct", "__wakeup", "__toString", "__get", "__call", "__invoke"]
+SINKS = ["system", "exec", "eval", "file_put_contents", "include"]
+VENDORS = ["monolog", "guzzlehttp", "symfony", "laravel", "topthink", "yiisoft", "league", "psr"]
+
+
+def _method(rng: random.Random, name: str, sink_density: float) -> str:
+    lines = []
+    kind = rng.randrange(4)
+    if kind == 0:
+        lines.append('$msg = "value: " . $this->p0;')
+    elif kind == 1:
+        lines.append("$this->p1->handle($this->p2);")
+    elif kind == 2:
+        lines.append("return ($this->p1)($this->p0);")
+    else:
+        lines.append("$x = $this->p2->data;")
+    if rng.random() < sink_density:
+        lines.append(f"{rng.choice(SINKS)}($this->p0);")
+    args = "$name, $args" if name == "__call" else ("$name" if name == "__get" else "")
+    body = "\n        ".join(lines)
+    return f"    public function {name}({args})\n    {{\n        {body}\n    }}\n"
+
+
+def render_file(rng: random.Random, ns: str, idx: int, classes_per_file: int, magic_density: float, sink_density: float, parent: str = "") -> str:
+    out = [f"<?php\n\nnamespace {ns};\n\n"]
+    for k in range(classes_per_file):
+        name = f"Class{idx}_{k}"
+        head = f" extends {parent}" if parent else ""
+        out.append(f"class {name}{head}\n{{\n")
+        for p in range(3):
+            out.append(f"    protected $p{p};\n")
+        out.append("\n    public function __construct($a = null)\n    {\n        $this->p0 = $a;\n    }\n\n")
+        for m in MAGIC:
+            if rng.random() < magic_density:
+                out.append(_method(rng, m, sink_density))
+        out.append("    public function helper($v)\n    {\n        return strtolower((string) $v) . '/* } */';\n    }\n}\n\n")
+    return "".join(out)
+
+
+def generate(root: str, files: int, classes_per_file: int = 1, magic_density: float = 0.3, sink_density: float = 0.1, vendor_ratio: float = 0.8, depth: int = 3, seed: int = 1) -> Dict[str, int]:
+    rng = random.Random(seed)
+    n_vendor = int(files * vendor_ratio)
+    vendor_classes = []
+    classmap = []
+    for i in range(files):
+        parent = ""
+        if i < n_vendor:
+            vendor = VENDORS[i % len(VENDORS)]
+            parts = ["vendor", vendor, f"pkg{i % 17}", "src"] + [f"D{(i >> (2 * d)) % 4}" for d in range(depth)]
+            ns = "\\".join([vendor.capitalize(), f"Pkg{i % 17}"] + parts[4:])
+        else:
+            parts = ["app", f"M{i % 10}"]
+            ns = f"App\\M{i % 10}"
+            # app classes extend vendor classes, which is what a lazy scan has to follow
+            if vendor_classes:
+                parent = "\\" + vendor_classes[i % len(vendor_classes)]
+        d = os.path.join(root, *parts)
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"Class{i}.php"), "w", encoding="utf-8") as f:
+            f.write(render_file(rng, ns, i, classes_per_file, magic_density, sink_density, parent))
+        if i < n_vendor:
+            vendor_classes.append(f"{ns}\\Class{i}_0")
+            rel = "/".join(parts[1:] + [f"Class{i}.php"])
+            classmap.extend(f"    '{ns}\\Class{i}_{k}' => $vendorDir . '/{rel}',\n".replace("\\", "\\\\") for k in range(classes_per_file))
+    os.makedirs(os.path.join(root, "vendor", "composer"), exist_ok=True)
+    with open(os.path.join(root, "vendor", "composer", "autoload_classmap.php"), "w", encoding="utf-8") as f:
+        f.write("<?php\n\n$vendorDir = dirname(__DIR__);\n$baseDir = dirname($vendorDir);\n\nreturn array(\n" + "".join(classmap) + ");\n")
+    with open(os.path.join(root, "composer.json"), "w", encoding="utf-8") as f:
+        json.dump({"require": {"monolog/monolog": "^2.0", "laravel/framework": "^8.0"}}, f)
+    return {"files": files, "vendor_files": n_vendor}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="generate a synthetic PHP repository")
+    ap.add_argument("root")
+    ap.add_argument("--files", type=int, default=1000)
+    ap.add_argument("--classes-per-file", type=int, default=1)
+    ap.add_argument("--magic-density", type=float, default=0.3)
+    ap.add_argument("--sink-density", type=float, default=0.1)
+    ap.add_argument("--vendor-ratio", type=float, default=0.8)
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    a = ap.parse_args()
+    print(generate(a.root, a.files, a.classes_per_file, a.magic_density, a.sink_density, a.vendor_ratio, a.depth, a.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import generate
+from mcp_popchain import php_ast
+from mcp_popchain.analyzer import analyze_php_repo
+from mcp_popchain.gadgets import sniff_trampolines
+from mcp_popchain.models import SinkSpec, SourceSpec
+from mcp_popchain.payload import php_serialize_object
+from mcp_popchain.solver import build_chain, build_trampoline_chain
+
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+REPEAT = 1
+
+
+def measure(fn: Callable[[], Any], memory: bool) -> Dict[str, Any]:
+    wall = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        wall = min(wall, time.perf_counter() - start)
+    res: Dict[str, Any] = {"wall_s": round(wall, 6)}
+    if memory:
+        tracemalloc.start()
+        fn()
+        res["peak_mem_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return res
+
+
+def _analyze(root: str, ast: bool, lazy: bool = False):
+    def run():
+        php_ast.reset_parser_cache()
+        if not ast:
+            php_ast._UNAVAILABLE = True
+        try:
+            return analyze_php_repo(root, [], lazy=lazy)
+        finally:
+            php_ast.reset_parser_cache()
+    return run
+
+
+def bench_size(root: str, files: int, memory: bool) -> List[Dict[str, Any]]:
+    rows: List[Dict[str, Any]] = []
+    backends = [("regex", False)] + ([("ast", True)] if php_ast.available() else [])
+    for label, ast in backends:
+        res = measure(_analyze(root, ast), memory)
+        res.update(bench=f"analyze_php_repo[{label}]", files=files, files_per_s=round(files / max(res["wall_s"], 1e-9), 1))
+        rows.append(res)
+    res = measure(_analyze(root, False, lazy=True), memory)
+    res.update(bench="analyze_php_repo[regex,lazy]", files=files, files_scanned=_analyze(root, False, lazy=True)().files_scanned)
+    rows.append(res)
+    summary = _analyze(root, False)()
+    classes = summary.classes
+    src = SourceSpec(entry="unserialize", controllable_properties={})
+    cases = [
+        ("build_chain", lambda: build_chain(classes, src, SinkSpec(name="system"))),
+        ("build_trampoline_chain", lambda: build_trampoline_chain(classes)),
+        ("sniff_trampolines", lambda: sniff_trampolines(classes)),
+        ("php_serialize_object", lambda: [php_serialize_object(c.name, {p: "id" for p in c.properties}) for c in classes]),
+    ]
+    for name, fn in cases:
+        res = measure(fn, memory)
+        res.update(bench=name, files=files, classes=len(classes))
+        rows.append(res)
+    return rows
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    old = {(r["bench"], r["files"]): r for r in base.get("results", [])}
+    print(f"{'bench':<32}{'files':>8}{'old s':>12}{'new s':>12}{'ratio':>8}")
+    for r in current["results"]:
+        o = old.get((r["bench"], r["files"]))
+        if not o:
+            continue
+        ratio = r["wall_s"] / max(o["wall_s"], 1e-9)
+        print(f"{r['bench']:<32}{r['files']:>8}{o['wall_s']:>12.4f}{r['wall_s']:>12.4f}{ratio:>8.2f}")
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="analyzer / solver / payload benchmarks on synthetic corpora")
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    ap.add_argument("--workdir", default=None, help="keep generated corpora here and reuse them between runs")
+    ap.add_argument("--classes-per-file", type=int, default=1)
+    ap.add_argument("--magic-density", type=float, default=0.3)
+    ap.add_argument("--sink-density", type=float, default=0.1)
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--repeat", type=int, default=1, help="report the best of N timed runs")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--output", default="bench_report.json")
+    ap.add_argument("--compare", default=None, help="previous report to diff against")
+    a = ap.parse_args(argv)
+    global REPEAT
+    REPEAT = max(1, a.repeat)
+    workdir = a.workdir or tempfile.mkdtemp(prefix="popchain-bench-")
+    params = [a.classes_per_file, a.magic_density, a.sink_density, a.depth, a.seed]
+    report: Dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ast_available": php_ast.available(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": dict(zip(["classes_per_file", "magic_density", "sink_density", "depth", "seed"], params)),
+        },
+        "results": [],
+    }
+    try:
+        for size in a.sizes:
+            root = os.path.join(workdir, f"corpus-{size}-" + "-".join(str(p) for p in params))
+            if not os.path.isdir(root):
+                generate(root, size, a.classes_per_file, a.magic_density, a.sink_density, depth=a.depth, seed=a.seed)
+            for row in bench_size(root, size, not a.no_memory):
+                print(json.dumps(row))
+                report["results"].append(row)
+    finally:
+        if a.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(a.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if a.compare:
+        compare(report, a.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+<?php
+class Start {
+    public $obj;
+    function __destruct() {
+        echo "closing " . $this->obj;
+    }
+}
+
+class Middle {
+    public $handler;
+    function __toString() {
+        $this->handler->flush();
+        return "";
+    }
+}
+
+class Finish {
+    public $cmd;
+    function __call($name, $args) {
+        system($this->cmd);
+    }
+}
+?>
@@ -1,12 +1,20 @@
 import os
 import re
-from typing import List
-from .php_ast import analyze as ast_analyze
-from .models import AnalysisSummary, ClassInfo, MagicMethodInfo, SinkInfo, ComposerPackage
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .php_ast import analyze as ast_analyze, available as ast_available
+from .autoload import LazyLoader, dependencies, load_autoload_map
+from .cache import AnalysisCache, cache_file_for, file_signature
+from .hierarchy import MAGIC_METHODS, parse_use, qualify
+from .taint import split_args, text_flows
+from .compact import ClassStore, SinkRow
+from .models import AnalysisSummary, ClassInfo, ComposerPackage
 import json
 
 
-MAGIC_METHODS = {"__wakeup", "__destruct", "__toString", "__call", "__invoke"}
+ANALYZER_VERSION = "6"
 SINKS = [
     "system",
     "exec",
@@ -22,7 +30,36 @@ SINKS = [
     "require",
     "require_once",
     "file_put_contents",
+    "call_user_func",
+    "call_user_func_array",
 ]
+# functions that coerce their arguments to string, so an object held in a property reaches __toString
+STRING_CONTEXT_FUNCS = {
+    "preg_match",
+    "preg_replace",
+    "printf",
+    "sprintf",
+    "strlen",
+    "strtolower",
+    "strtoupper",
+    "trim",
+    "str_replace",
+    "str_contains",
+    "strpos",
+    "explode",
+    "implode",
+    "htmlspecialchars",
+    "addslashes",
+    "md5",
+    "sha1",
+    "urlencode",
+    "file_exists",
+    "is_file",
+    "is_dir",
+    "in_array",
+}
+MINIFIED_MIN_SIZE = 4096
+MINIFIED_AVG_LINE = 500
 
 
 class PHPFile:
@@ -31,91 +68,501 @@ class PHPFile:
         self.text = text
 
 
-def read_php_files(root: str, includes: List[str]) -> List[PHPFile]:
-    files: List[PHPFile] = []
-    for base, _, names in os.walk(root):
+def iter_php_paths(root: str, includes: List[str], exclude_dirs: Iterable[str] = ()) -> Iterator[str]:
+    skip = {os.path.normpath(d) for d in exclude_dirs}
+    for base, dirs, names in os.walk(root):
+        if skip:
+            dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(base, d)) not in skip]
         for n in names:
             if not n.lower().endswith(".php"):
                 continue
             p = os.path.join(base, n)
             if includes and not any(inc in p for inc in includes):
                 continue
-            try:
-                with open(p, "r", encoding="utf-8", errors="ignore") as f:
-                    files.append(PHPFile(p, f.read()))
-            except Exception:
-                pass
-    return files
+            yield p
+
+
+def is_binary_or_minified(text: str) -> bool:
+    if "\x00" in text:
+        return True
+    if len(text) < MINIFIED_MIN_SIZE:
+        return False
+    return len(text) / (text.count("\n") + 1) > MINIFIED_AVG_LINE
+
+
+def read_php_file(path: str, max_file_size: Optional[int] = None, skip_minified: bool = False) -> Optional[PHPFile]:
+    try:
+        if max_file_size is not None and os.path.getsize(path) > max_file_size:
+            return None
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    except Exception:
+        return None
+    if skip_minified and is_binary_or_minified(text):
+        return None
+    return PHPFile(path, text)
+
+
+def iter_php_files(root: str, includes: List[str], max_file_size: Optional[int] = None, skip_minified: bool = False) -> Iterator[PHPFile]:
+    for p in iter_php_paths(root, includes):
+        f = read_php_file(p, max_file_size, skip_minified)
+        if f is not None:
+            yield f
+
+
+def read_php_files(root: str, includes: List[str]) -> List[PHPFile]:
+    return list(iter_php_files(root, includes))
+
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<skip>//[^\n]*|\#[^\n]*|/\*.*?\*/
+        |'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"
+        |<<<[ \t]*['"]?(?P<hd>[A-Za-z_]\w*)['"]?\r?\n.*?\n[ \t]*(?P=hd)\b)
+    |(?P<open>\{)
+    |(?P<close>\})
+    |(?P<semi>;)
+    |(?P<ns>(?<![\w$>:\\])namespace\s+(?P<nsname>[A-Za-z_\\][\w\\]*)\s*(?=[;{]))
+    |(?P<cls>(?<![\w$>:])(?P<ckind>class|trait|interface)\s+(?P<cname>[A-Za-z_]\w*)(?P<chead>[^{;]*))
+    |(?P<use>(?<![\w$>:])use\s+(?P<traits>[\w\\][\w\\\s,]*?)\s*(?=[;{]))
+    |(?P<fn>(?<![\w$>:])function\s+&?\s*(?P<fname>[A-Za-z_]\w*)\s*\()
+    |(?P<prop>(?<![\w$>:])(?:public|protected|private|var)(?:\s+(?:static|readonly))*(?:\s+\??[A-Za-z_\\][\w\\|]*)?\s+\$(?P<pname>[A-Za-z_]\w*))
+    |(?P<inv>\(\s*\$this\s*\??->\s*(?P<iname>[A-Za-z_]\w*)\s*\)\s*\()
+    |(?P<this>\$this\s*\??->\s*(?P<uname>[A-Za-z_]\w*)(?:(?P<ucall>\s*\()|\s*\??->\s*(?P<sub>[A-Za-z_]\w*)(?P<subcall>\s*\()?)?)
+    |(?P<echo>(?<![\w$>:])(?:echo|print)\b)
+    |(?P<static>(?<![\w$>:])(?P<scope>\\?[A-Za-z_][\w\\]*)\s*::\s*(?P<sname>[A-Za-z_]\w*)\s*\()
+    |(?P<call>(?<![\w$>:])(?!(?:return|if|elseif|while|for|foreach|switch|match|catch|array|list|isset|empty|unset|new|fn|and|or|xor|clone|throw|yield)\b)\\?(?P<callee>[A-Za-z_]\w*)\s*\(|(?<![\w$>:])(?P<incl>(?:include|require)(?:_once)?)\b)
+    """,
+    re.VERBOSE | re.DOTALL | re.IGNORECASE,
+)
+_INTERP_RE = re.compile(r"\$this->([A-Za-z_]\w*)")
+_HEAD_RE = re.compile(r"\b(extends|implements)\s+([\w\\\s,]+?)\s*(?=\bimplements\b|$)", re.IGNORECASE)
+_DYN_ARG_RE = re.compile(r"\s*\$this\s*\??->\s*([A-Za-z_]\w*)\s*[,)]")
+_MORE_PROPS_RE = re.compile(r",\s*\$([A-Za-z_]\w*)")
+_DYNAMIC_CALLS = {"call_user_func", "call_user_func_array"}
+_SINK_NAMES = {s.lower(): s for s in SINKS}
+_STRING_FUNCS = {s.lower() for s in STRING_CONTEXT_FUNCS}
+
+
+def _line_starts(text: str) -> List[int]:
+    starts = [0]
+    pos = text.find("\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    return starts
+
+
+def _adjacent_char(text: str, pos: int, step: int) -> str:
+    while 0 <= pos < len(text) and text[pos] in " \t\r\n":
+        pos += step
+    return text[pos] if 0 <= pos < len(text) else ""
+
+
+def _triggers(found: Dict[str, set]) -> Dict[str, List[str]]:
+    return {k: sorted(v) for k, v in found.items() if v}
+
+
+def _sink_row(name: str, line: int, flows) -> SinkRow:
+    if flows is None:
+        return (name, line, None, None)
+    return (name, line, [f[0] for f in flows], [f[1] for f in flows])
+
+
+def _split_names(s: str) -> List[str]:
+    return [x.strip() for x in s.split(",") if x.strip()]
+
+
+def _class_head(kind: str, head: str) -> Tuple[Optional[str], List[str]]:
+    parent: Optional[str] = None
+    interfaces: List[str] = []
+    for m in _HEAD_RE.finditer(head.strip()):
+        names = _split_names(m.group(2))
+        if m.group(1).lower() == "implements" or kind == "interface":
+            interfaces.extend(names)
+        elif names:
+            parent = names[0]
+    return parent, interfaces
 
 
 def find_classes(file: PHPFile) -> List[ClassInfo]:
+    # one pass over the token stream; methods, properties and sinks belong to the class/method whose braces enclose them
+    text = file.text
+    starts = _line_starts(text)
+    store = ClassStore()
     classes: List[ClassInfo] = []
-    class_pattern = re.compile(r"class\s+([A-Za-z_][A-Za-z0-9_]*)", re.MULTILINE)
-    method_pattern = re.compile(r"function\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(", re.MULTILINE)
-    prop_pattern = re.compile(r"public\s+\$([A-Za-z_][A-Za-z0-9_]*)|protected\s+\$([A-Za-z_][A-Za-z0-9_]*)|private\s+\$([A-Za-z_][A-Za-z0-9_]*)")
-    sink_patterns = [(s, re.compile(r"\b" + re.escape(s) + r"\s*\(", re.IGNORECASE)) for s in SINKS]
-    for m in class_pattern.finditer(file.text):
-        cname = m.group(1)
-        methods: List[MagicMethodInfo] = []
-        properties: List[str] = []
-        for pm in prop_pattern.finditer(file.text):
-            for g in pm.groups():
-                if g:
-                    properties.append(g)
-        for mm in method_pattern.finditer(file.text):
-            mname = mm.group(1)
-            if mname in MAGIC_METHODS:
-                line = file.text.count("\n", 0, mm.start()) + 1
-                sinks: List[SinkInfo] = []
-                calls: List[str] = []
-                for sname, sp in sink_patterns:
-                    for sm in sp.finditer(file.text):
-                        sline = file.text.count("\n", 0, sm.start()) + 1
-                        sinks.append(SinkInfo(name=sname, file=file.path, line=sline))
-                        calls.append(sname)
-                methods.append(
-                    MagicMethodInfo(
-                        name=mname,
+    depth = 0
+    namespace: Optional[str] = None
+    imports: Dict[str, str] = {}
+    pending_class: Optional[dict] = None
+    pending_method: Optional[Tuple[str, int, str]] = None
+    cls: Optional[dict] = None
+    meth: Optional[dict] = None
+    for tok in _TOKEN_RE.finditer(text):
+        kind = tok.lastgroup
+        if kind == "skip":
+            if meth is not None and tok.group()[0] in "\"<":
+                interp = _INTERP_RE.findall(tok.group())
+                meth["uses"].update(interp)
+                meth["triggers"]["__toString"].update(interp)
+            continue
+        if kind == "open":
+            depth += 1
+            if pending_class is not None:
+                cls = pending_class
+                cls["depth"] = depth
+                pending_class = None
+            elif pending_method is not None and cls is not None:
+                meth = {
+                    "name": pending_method[0],
+                    "line": pending_method[1],
+                    "params": pending_method[2],
+                    "body": tok.end(),
+                    "depth": depth,
+                    "sinks": [],
+                    "uses": set(),
+                    "invokes": set(),
+                    "triggers": {"__toString": set(), "__get": set(), "__call": set(), "__invoke": set()},
+                    "static_calls": [],
+                    "self_calls": [],
+                    "property_calls": {},
+                    "str_until": -1,
+                }
+                pending_method = None
+        elif kind == "close":
+            if meth is not None and depth == meth["depth"]:
+                # every method is kept: ordinary ones carry the call graph between magic methods and sinks
+                raw = meth["sinks"]
+                flows = text_flows(meth["params"], text[meth["body"]:tok.start()], [args for _, _, args in raw])
+                sinks = [_sink_row(name, line, f) for (name, line, _), f in zip(raw, flows)]
+                cls["methods"].append(
+                    dict(
+                        name=meth["name"],
                         file=file.path,
-                        line=line,
+                        line=meth["line"],
                         sinks=sinks,
-                        calls=list(sorted(set(calls))),
+                        calls=sorted({x[0] for x in sinks}),
+                        uses_properties=sorted(meth["uses"]),
+                        invokes_properties=sorted(meth["invokes"]),
+                        triggers=_triggers(meth["triggers"]),
+                        static_calls=list(dict.fromkeys(meth["static_calls"])),
+                        self_calls=list(dict.fromkeys(meth["self_calls"])),
+                        property_calls={k: list(dict.fromkeys(v)) for k, v in meth["property_calls"].items()},
                     )
                 )
-        classes.append(ClassInfo(name=cname, file=file.path, methods=methods, properties=properties))
+                meth = None
+            elif cls is not None and depth == cls["depth"]:
+                for row in cls["methods"]:
+                    store.add_method(**row)
+                classes.append(
+                    store.add_class(
+                        name=cls["name"],
+                        file=file.path,
+                        properties=cls["properties"],
+                        kind=cls["kind"],
+                        namespace=cls["namespace"],
+                        parent=cls["parent"],
+                        interfaces=cls["interfaces"],
+                        traits=cls["traits"],
+                        imports=cls["imports"],
+                    )
+                )
+                cls = None
+            depth -= 1
+        elif kind == "semi":
+            pending_method = None
+        elif kind == "ns":
+            if cls is None:
+                namespace = tok.group("nsname").strip("\\")
+                imports = {}
+        elif kind == "cls":
+            if cls is None:
+                ckind = tok.group("ckind").lower()
+                parent, interfaces = _class_head(ckind, tok.group("chead"))
+                pending_class = {
+                    "name": tok.group("cname"),
+                    "kind": ckind,
+                    "namespace": namespace,
+                    "parent": parent,
+                    "interfaces": interfaces,
+                    "traits": [],
+                    "imports": dict(imports),
+                    "methods": [],
+                    "properties": [],
+                }
+        elif kind == "fn":
+            if cls is not None and meth is None and depth == cls["depth"]:
+                params, _ = split_args(text, tok.end())
+                pending_method = (tok.group("fname"), bisect_right(starts, tok.start()), ",".join(params))
+        elif cls is None:
+            if kind == "use":
+                end = text.find(";", tok.start())
+                imports.update(parse_use(text[tok.start():end if end != -1 else len(text)]))
+            continue
+        elif kind == "prop":
+            if meth is None and depth == cls["depth"]:
+                cls["properties"].append(tok.group("pname"))
+                end = text.find(";", tok.end())
+                cls["properties"].extend(_MORE_PROPS_RE.findall(text, tok.end(), end if end != -1 else len(text)))
+        elif kind == "use":
+            if meth is None and depth == cls["depth"]:
+                cls["traits"].extend(_split_names(tok.group("traits")))
+        elif meth is None:
+            continue
+        elif kind == "inv":
+            meth["invokes"].add(tok.group("iname"))
+            meth["triggers"]["__invoke"].add(tok.group("iname"))
+        elif kind == "this":
+            if tok.group("ucall"):
+                meth["self_calls"].append(tok.group("uname"))
+                continue
+            prop = tok.group("uname")
+            meth["uses"].add(prop)
+            trig = meth["triggers"]
+            if tok.group("subcall"):
+                trig["__call"].add(prop)
+                meth["property_calls"].setdefault(prop, []).append(tok.group("sub"))
+            elif tok.group("sub"):
+                trig["__get"].add(prop)
+            elif tok.start() < meth["str_until"] or _adjacent_char(text, tok.start() - 1, -1) == "." or _adjacent_char(text, tok.end(), 1) == ".":
+                trig["__toString"].add(prop)
+        elif kind == "echo":
+            meth["str_until"] = text.find(";", tok.end())
+        elif kind == "static":
+            meth["static_calls"].append(tok.group("scope") + "::" + tok.group("sname"))
+        elif kind == "call":
+            callee = (tok.group("callee") or tok.group("incl")).lower()
+            sname = _SINK_NAMES.get(callee)
+            if sname:
+                if tok.group("callee"):
+                    args, _ = split_args(text, tok.end())
+                else:
+                    end = text.find(";", tok.end())
+                    args = [text[tok.end():end if end != -1 else len(text)]]
+                meth["sinks"].append((sname, bisect_right(starts, tok.start()), args))
+                if callee in _DYNAMIC_CALLS:
+                    dyn = _DYN_ARG_RE.match(text, tok.end())
+                    if dyn:
+                        meth["invokes"].add(dyn.group(1))
+                        meth["triggers"]["__invoke"].add(dyn.group(1))
+            elif callee in _STRING_FUNCS:
+                meth["str_until"] = text.find(";", tok.end())
     return classes
 
 
 def find_classes_ast(file: PHPFile) -> List[ClassInfo]:
-    res = ast_analyze(file.text)
+    res = ast_analyze(file.text, STRING_CONTEXT_FUNCS, SINKS)
     if res is None:
         return []
+    store = ClassStore()
     out: List[ClassInfo] = []
     for c in res:
-        methods: List[MagicMethodInfo] = []
         for m in c["methods"]:
-            mname = m["name"]
-            if mname in MAGIC_METHODS:
-                calls = [x for x in m.get("calls", []) if x.lower() in {s.lower() for s in SINKS}]
-                sinks = [SinkInfo(name=x, file=file.path, line=m["line"]) for x in calls]
-                methods.append(MagicMethodInfo(name=mname, file=file.path, line=m["line"], sinks=sinks, calls=list(sorted(set(calls))), uses_properties=m.get("uses", []), invokes_properties=m.get("invokes", [])))
-        out.append(ClassInfo(name=c["name"], file=file.path, methods=methods, properties=c.get("properties", [])))
+            sites = [(name, line) for name, line in m.get("call_sites", []) if name.lower() in _SINK_NAMES]
+            sinks = [
+                _sink_row(_SINK_NAMES[name.lower()], line, flows)
+                for (name, line), flows in zip(sites, m.get("sink_flows") or [None] * len(sites))
+            ]
+            store.add_method(
+                name=m["name"],
+                file=file.path,
+                line=m["line"],
+                sinks=sinks,
+                calls=sorted({x[0] for x in sinks}),
+                uses_properties=m.get("uses", []),
+                invokes_properties=m.get("invokes", []),
+                triggers=m.get("triggers", {}),
+                static_calls=m.get("static_calls", []),
+                self_calls=m.get("self_calls", []),
+                property_calls=m.get("property_calls", {}),
+            )
+        out.append(
+            store.add_class(
+                name=c["name"],
+                file=file.path,
+                properties=c.get("properties", []),
+                kind=c.get("kind", "class"),
+                namespace=c.get("namespace"),
+                parent=c.get("parent"),
+                interfaces=c.get("interfaces", []),
+                traits=c.get("traits", []),
+                imports=c.get("imports", {}),
+            )
+        )
     return out
 
 
-def analyze_php_repo(root: str, includes: List[str]) -> AnalysisSummary:
-    files = read_php_files(root, includes)
-    classes: List[ClassInfo] = []
-    sinks: List[SinkInfo] = []
+def scan_file(file: PHPFile) -> List[ClassInfo]:
+    cs = find_classes_ast(file)
+    if not cs:
+        cs = find_classes(file)
+    return cs
+
+
+def _scan_path(path: str, max_file_size: Optional[int] = None, skip_minified: bool = False) -> Optional[List[ClassInfo]]:
+    # runs inside pool workers: read and parse there so file text never crosses the process boundary
+    f = read_php_file(path, max_file_size, skip_minified)
+    if f is None:
+        return None
+    return scan_file(f)
+
+
+def _scan_parallel(paths: List[str], workers: int, scan) -> Iterator[Optional[List[ClassInfo]]]:
+    chunksize = max(1, min(64, len(paths) // (workers * 8) or 1))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() yields in submission order, so the merged summary is identical to the serial one
+        yield from pool.map(scan, paths, chunksize=chunksize)
+
+
+def analyzer_version() -> str:
+    return f"{ANALYZER_VERSION}:{'ast' if ast_available() else 'regex'}"
+
+
+def iter_class_infos(
+    root: str,
+    includes: List[str],
+    workers: int = 0,
+    cache_dir: Optional[str] = None,
+    max_file_size: Optional[int] = None,
+    skip_minified: bool = False,
+    exclude_dirs: Iterable[str] = (),
+) -> Iterator[Tuple[str, List[ClassInfo]]]:
+    exclude_dirs = list(exclude_dirs)
+    paths = list(iter_php_paths(root, includes, exclude_dirs))
+    cache = None
+    sigs: List[Optional[Tuple[int, int]]] = [None] * len(paths)
+    fresh = [False] * len(paths)
+    if cache_dir:
+        policy = [max_file_size, skip_minified, sorted(os.path.relpath(d, root) for d in exclude_dirs)]
+        cache = AnalysisCache(cache_file_for(cache_dir, root, includes + [repr(policy)]), analyzer_version())
+        for i, p in enumerate(paths):
+            sigs[i] = file_signature(p)
+            fresh[i] = cache.is_fresh(p, sigs[i])
+    todo = [p for p, hit in zip(paths, fresh) if not hit]
+    scan = partial(_scan_path, max_file_size=max_file_size, skip_minified=skip_minified)
+    if workers < 0:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(todo) > 1:
+        scanned = _scan_parallel(todo, workers, scan)
+    else:
+        scanned = (scan(p) for p in todo)
+    try:
+        for i, p in enumerate(paths):
+            if fresh[i]:
+                cs = cache.lookup(p, sigs[i])
+                if cs is None:
+                    # a fresh entry that did not decode: rescan the file here
+                    fresh[i] = False
+                    cs = scan(p)
+            else:
+                cs = next(scanned)
+            if cs is None:
+                continue
+            if cache is not None and not fresh[i]:
+                cache.store(p, sigs[i], cs)
+            yield p, cs
+    finally:
+        if cache is not None:
+            cache.save()
+
+
+def _add_classes(summary: AnalysisSummary, cs: List[ClassInfo]) -> None:
+    summary.files_scanned += 1
+    if summary._store is not None:
+        # per-file results are copied into the summary's one store, sharing its string table
+        cs = summary._store.extend(cs)
+    summary.classes.extend(cs)
+    for c in cs:
+        for mm in c.methods:
+            summary.sinks.extend(mm.sinks)
+
+
+def analyze_php_repo(
+    root: str,
+    includes: List[str],
+    workers: int = 0,
+    cache_dir: Optional[str] = None,
+    max_file_size: Optional[int] = None,
+    skip_minified: bool = False,
+    lazy: bool = False,
+    exclude_dirs: Iterable[str] = (),
+) -> AnalysisSummary:
+    # lazy=True scans everything outside vendor/ and then only the vendor files the composer
+    # autoload rules map the app's parents / traits to; load_classes() pulls in more later.
+    # exclude_dirs are skipped entirely (e.g. a vendor/ tree loaded from a snapshot instead)
+    summary = AnalysisSummary(classes=[], sinks=[], files_scanned=0)
+    summary._store = ClassStore()
+    loader: Optional[LazyLoader] = None
+    exclude: List[str] = list(exclude_dirs)
+    if lazy:
+        loader = LazyLoader(load_autoload_map(root), partial(_scan_path, max_file_size=max_file_size, skip_minified=skip_minified))
+        exclude.append(os.path.join(root, "vendor"))
+    for path, cs in iter_class_infos(root, includes, workers, cache_dir, max_file_size, skip_minified, exclude):
+        _add_classes(summary, cs)
+        if loader is not None:
+            loader.add_scanned(path, cs)
+    if loader is not None:
+        for _, cs in loader.load([d for c in summary.classes for d in dependencies(c)]):
+            _add_classes(summary, cs)
+        summary._loader = loader
+    summary.packages = read_composer_packages(root)
+    return summary
+
+
+def load_classes(summary: AnalysisSummary, names: Iterable[str]) -> int:
+    # parses the vendor files defining `names` (FQCNs, or namespace prefixes ending in "\") into a
+    # lazily built summary; returns how many files were added
+    loader = summary._loader
+    if loader is None:
+        raise ValueError("summary was not built with lazy=True, all classes are already loaded")
+    with loader.lock:
+        loaded = loader.load(names)
+        for _, cs in loaded:
+            _add_classes(summary, cs)
+        if loaded:
+            summary._index = None
+    return len(loaded)
+
+
+def expand_lazy(summary: AnalysisSummary) -> int:
+    # loads the vendor classes a gadget query can reach into a lazily built summary: every
+    # autoloadable class declaring a magic method (any of them can be an unserialize() entry or a
+    # trigger target), then, to a fixpoint, the classes declaring a method called through
+    # $this->p->m() (the call graph's hub for m) or named by A::m(). Called by get_index();
+    # returns how many files were added
+    loader = summary._loader
+    if loader is None:
+        return 0
+    with loader.lock:
+        added = 0
+        new = list(summary.classes)
+        wanted = {m.lower() for m in MAGIC_METHODS}
+        while new:
+            scopes: List[str] = []
+            for c in new:
+                for m in c.methods:
+                    for names in m.property_calls.values():
+                        wanted.update(n.lower() for n in names)
+                    for call in m.static_calls:
+                        scope = call.rpartition("::")[0]
+                        if scope.lower() not in ("self", "parent", "static"):
+                            scopes.append(qualify(scope, c.namespace, c.imports))
+            todo = wanted - loader.expanded
+            loader.expanded |= todo
+            start = len(summary.classes)
+            loaded = loader.load(scopes, loader.declaring(todo))
+            for _, cs in loaded:
+                _add_classes(summary, cs)
+            added += len(loaded)
+            new = summary.classes[start:]
+            wanted = set()
+        if added:
+            summary._index = None
+    return added
+
+
+def read_composer_packages(root: str) -> List[ComposerPackage]:
     packages: List[ComposerPackage] = []
-    for f in files:
-        cs = find_classes_ast(f)
-        if not cs:
-            cs = find_classes(f)
-        classes.extend(cs)
-        for c in cs:
-            for mm in c.methods:
-                sinks.extend(mm.sinks)
     comp_path = os.path.join(root, "composer.json")
     if os.path.exists(comp_path):
         try:
@@ -140,4 +587,4 @@ def analyze_php_repo(root: str, includes: List[str]) -> AnalysisSummary:
                             packages.append(ComposerPackage(name=name, version=ver))
         except Exception:
             pass
-    return AnalysisSummary(classes=classes, sinks=sinks, files_scanned=len(files), packages=packages)
+    return packages
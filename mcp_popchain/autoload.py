@@ -0,0 +1,236 @@
+import json
+import os
+from collections import deque
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from .hierarchy import fqcn, qualify
+from .models import ClassInfo
+
+
+# `'Monolog\\' => array($vendorDir . '/monolog/monolog/src/Monolog'),` in vendor/composer/autoload_*.php
+_ENTRY_RE = re.compile(r"'((?:[^'\\]|\\.)*)'\s*=>\s*(array\s*\(.*?\)|\[.*?\]|[^,\n]+)", re.DOTALL)
+_PATH_RE = re.compile(r"\$(vendorDir|baseDir)\s*\.\s*'((?:[^'\\]|\\.)*)'")
+_UNESCAPE_RE = re.compile(r"\\(['\\])")
+# method declarations, for finding the files a hub method name can dispatch to without parsing
+_DECL_RE = re.compile(rb"\bfunction\s+&?\s*([A-Za-z_]\w*)\s*\(", re.IGNORECASE)
+
+
+def _unquote(s: str) -> str:
+    return _UNESCAPE_RE.sub(r"\1", s)
+
+
+def _as_list(v) -> List[str]:
+    return [v] if isinstance(v, str) else [x for x in (v or []) if isinstance(x, str)]
+
+
+class AutoloadMap:
+    # composer autoload rules; lookups follow composer's own order: classmap, PSR-4, then PSR-0
+    def __init__(self):
+        self.psr4: Dict[str, List[str]] = {}
+        self.psr0: Dict[str, List[str]] = {}
+        self.classmap: Dict[str, str] = {}
+        self._prefixes: Optional[List[str]] = None
+
+    def add_psr4(self, prefix: str, dirs: Iterable[str]) -> None:
+        bucket = self.psr4.setdefault(prefix, [])
+        bucket.extend(os.path.normpath(d) for d in dirs if os.path.normpath(d) not in bucket)
+        self._prefixes = None
+
+    def add_psr0(self, prefix: str, dirs: Iterable[str]) -> None:
+        bucket = self.psr0.setdefault(prefix, [])
+        bucket.extend(os.path.normpath(d) for d in dirs if os.path.normpath(d) not in bucket)
+
+    def add_class(self, name: str, path: str) -> None:
+        self.classmap.setdefault(name.lstrip("\\").lower(), os.path.normpath(path))
+
+    def _psr4_prefixes(self) -> List[str]:
+        if self._prefixes is None:
+            self._prefixes = sorted(self.psr4, key=len, reverse=True)
+        return self._prefixes
+
+    def find_file(self, name: str) -> Optional[str]:
+        name = name.lstrip("\\")
+        path = self.classmap.get(name.lower())
+        if path is not None:
+            return path if os.path.isfile(path) else None
+        for prefix in self._psr4_prefixes():
+            if not name.startswith(prefix):
+                continue
+            rel = name[len(prefix):].replace("\\", os.sep) + ".php"
+            for d in self.psr4[prefix]:
+                cand = os.path.join(d, rel)
+                if os.path.isfile(cand):
+                    return cand
+        ns, _, short = name.rpartition("\\")
+        rel = (ns.replace("\\", os.sep) + os.sep if ns else "") + short.replace("_", os.sep) + ".php"
+        for prefix, dirs in self.psr0.items():
+            if name.startswith(prefix):
+                for d in dirs:
+                    cand = os.path.join(d, rel)
+                    if os.path.isfile(cand):
+                        return cand
+        return None
+
+    def files_under(self, prefix: str) -> List[str]:
+        # every autoloadable file for a namespace prefix such as "Monolog\\Handler\\"
+        prefix = prefix.lstrip("\\")
+        low = prefix.lower()
+        out = [p for name, p in self.classmap.items() if name.startswith(low)]
+        for p4, dirs in self.psr4.items():
+            if prefix.startswith(p4):
+                sub = prefix[len(p4):].replace("\\", os.sep)
+                roots = [os.path.join(d, sub) for d in dirs]
+            elif p4.startswith(prefix):
+                roots = dirs
+            else:
+                continue
+            for r in roots:
+                for dirpath, _, files in os.walk(r):
+                    out.extend(os.path.join(dirpath, f) for f in files if f.endswith(".php"))
+        return sorted(set(os.path.normpath(p) for p in out if os.path.isfile(p)))
+
+    def all_files(self) -> List[str]:
+        # every file the rules can autoload: the classmap plus the PSR-4 / PSR-0 directories
+        out = list(self.classmap.values())
+        for dirs in list(self.psr4.values()) + list(self.psr0.values()):
+            for r in dirs:
+                for dirpath, _, files in os.walk(r):
+                    out.extend(os.path.join(dirpath, f) for f in files if f.endswith(".php"))
+        return sorted(set(os.path.normpath(p) for p in out if os.path.isfile(p)))
+
+
+def _read_php_map(path: str, vendor: str, base: str) -> List[Tuple[str, List[str]]]:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            text = f.read()
+    except OSError:
+        return []
+    out = []
+    for m in _ENTRY_RE.finditer(text):
+        dirs = [(vendor if var == "vendorDir" else base) + _unquote(rel) for var, rel in _PATH_RE.findall(m.group(2))]
+        if dirs:
+            out.append((_unquote(m.group(1)), dirs))
+    return out
+
+
+def _add_rules(amap: AutoloadMap, autoload: dict, base: str) -> None:
+    for prefix, dirs in (autoload.get("psr-4") or {}).items():
+        amap.add_psr4(prefix, [os.path.join(base, d) for d in _as_list(dirs)])
+    for prefix, dirs in (autoload.get("psr-0") or {}).items():
+        amap.add_psr0(prefix, [os.path.join(base, d) for d in _as_list(dirs)])
+
+
+def _load_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def load_autoload_map(root: str) -> AutoloadMap:
+    # the generated vendor/composer/autoload_*.php files are authoritative; without them (vendor
+    # copied in by hand, no dump-autoload) the rules come from installed.json and composer.json
+    amap = AutoloadMap()
+    vendor = os.path.join(root, "vendor")
+    composer_dir = os.path.join(vendor, "composer")
+    generated = False
+    for fname, add in (("autoload_psr4.php", amap.add_psr4), ("autoload_namespaces.php", amap.add_psr0)):
+        path = os.path.join(composer_dir, fname)
+        if os.path.isfile(path):
+            generated = True
+            for prefix, dirs in _read_php_map(path, vendor, root):
+                add(prefix, dirs)
+    cm_path = os.path.join(composer_dir, "autoload_classmap.php")
+    if os.path.isfile(cm_path):
+        for name, paths in _read_php_map(cm_path, vendor, root):
+            amap.add_class(name, paths[0])
+    if not generated:
+        data = _load_json(os.path.join(composer_dir, "installed.json"))
+        pkgs = data.get("packages") if isinstance(data, dict) else data
+        for p in pkgs if isinstance(pkgs, list) else []:
+            if not isinstance(p, dict) or not p.get("name"):
+                continue
+            base = os.path.join(composer_dir, p["install-path"]) if p.get("install-path") else os.path.join(vendor, p["name"])
+            _add_rules(amap, p.get("autoload") or {}, base)
+    data = _load_json(os.path.join(root, "composer.json"))
+    if isinstance(data, dict):
+        for sec in ("autoload", "autoload-dev"):
+            _add_rules(amap, data.get(sec) or {}, root)
+    return amap
+
+
+def dependencies(c: ClassInfo) -> List[str]:
+    # classes that must be loaded before c's effective methods are known
+    refs = ([c.parent] if c.parent else []) + list(c.traits)
+    return [qualify(r, c.namespace, c.imports) for r in refs]
+
+
+class LazyLoader:
+    # parses vendor classes on demand: each missing FQCN maps to at most one file through the
+    # autoload rules, and every loaded class pulls in its own parent and traits
+    def __init__(self, amap: AutoloadMap, scan: Callable[[str], Optional[List[ClassInfo]]]):
+        self.amap = amap
+        self.scan = scan
+        self.paths: Set[str] = set()
+        self.known: Set[str] = set()
+        self.missing: Set[str] = set()
+        # lowercased method names whose declaring files have been loaded (analyzer.expand_lazy)
+        self.expanded: Set[str] = set()
+        self._declared: Optional[Dict[str, List[str]]] = None
+        self.lock = threading.Lock()
+
+    def declaring(self, methods: Iterable[str]) -> List[str]:
+        # autoloadable files not loaded yet that declare one of `methods` (lowercased names); the
+        # name -> files index is built once from a regex pass over the raw files
+        if self._declared is None:
+            self._declared = {}
+            for path in self.amap.all_files():
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                for name in {n.decode("ascii", "ignore").lower() for n in _DECL_RE.findall(data)}:
+                    self._declared.setdefault(name, []).append(path)
+        out = {p for m in methods for p in self._declared.get(m, ())}
+        return sorted(p for p in out if p not in self.paths)
+
+    def add_scanned(self, path: str, classes: List[ClassInfo]) -> None:
+        self.paths.add(os.path.normpath(path))
+        self.known.update(fqcn(c).lower() for c in classes)
+
+    def load(self, names: Iterable[str], paths: Iterable[str] = ()) -> List[Tuple[str, List[ClassInfo]]]:
+        # `names` are FQCNs or namespace prefixes ending in "\", `paths` files to parse as they
+        # are; returns the newly scanned files
+        out: List[Tuple[str, List[ClassInfo]]] = []
+        queue = deque(names)
+        pending = list(paths)
+        while queue or pending:
+            if not pending:
+                name = queue.popleft().lstrip("\\")
+                if name.endswith("\\"):
+                    pending = self.amap.files_under(name)
+                else:
+                    key = name.lower()
+                    if key in self.known or key in self.missing:
+                        continue
+                    path = self.amap.find_file(name)
+                    if path is None:
+                        self.missing.add(key)
+                    pending = [path] if path else []
+            paths, pending = pending, []
+            for path in paths:
+                path = os.path.normpath(path)
+                if path in self.paths:
+                    continue
+                self.paths.add(path)
+                cs = self.scan(path)
+                if cs is None:
+                    continue
+                out.append((path, cs))
+                for c in cs:
+                    self.known.add(fqcn(c).lower())
+                    queue.extend(dependencies(c))
+        return out
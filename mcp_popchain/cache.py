@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+from .compact import ClassStore
+from .models import ClassInfo
+
+
+CACHE_FORMAT = 2
+
+
+def cache_file_for(cache_dir: str, root: str, includes: List[str]) -> str:
+    key = json.dumps([os.path.abspath(root), sorted(includes)])
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f"popchain-{digest}.json")
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class AnalysisCache:
+    # only entries looked up or stored during the current scan are saved, so deleted files drop out
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self._old: Dict[str, Any] = {}
+        self._new: Dict[str, Any] = {}
+        self._dirty = False
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == CACHE_FORMAT and data.get("version") == version:
+                self._old = data.get("files") or {}
+        except Exception:
+            pass
+
+    def is_fresh(self, path: str, sig: Optional[Tuple[int, int]]) -> bool:
+        ent = self._old.get(path)
+        return ent is not None and sig is not None and ent[0] == sig[0] and ent[1] == sig[1]
+
+    def lookup(self, path: str, sig: Optional[Tuple[int, int]]) -> Optional[List[ClassInfo]]:
+        if not self.is_fresh(path, sig):
+            return None
+        ent = self._old[path]
+        try:
+            classes = ClassStore.load(ent[2]).classes
+        except Exception:
+            # an entry that passes the signature check but does not decode is dropped; the caller
+            # rescans the file and stores it again
+            del self._old[path]
+            return None
+        self._new[path] = ent
+        return classes
+
+    def store(self, path: str, sig: Optional[Tuple[int, int]], classes: List[ClassInfo]) -> None:
+        if sig is None:
+            return
+        # one column dump per file, strings interned within it
+        store = ClassStore()
+        store.extend(classes)
+        self._new[path] = [sig[0], sig[1], store.dump()]
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty and len(self._new) == len(self._old):
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"format": CACHE_FORMAT, "version": self.version, "files": self._new}, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
@@ -0,0 +1,250 @@
+import weakref
+from collections import deque
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from .hierarchy import MethodRef, fqcn
+from .index import SummaryIndex
+from .models import ClassInfo
+
+
+# (kind, property, method name) on an edge: "self" $this->m() / self:: / parent:: / static::,
+# "call" $this->p->m() (into the hub node for m), "any" from that hub to every class with an
+# effective m, "static" A::m()
+Edge = Tuple[str, Optional[str], str]
+_SAME_OBJECT = {"self", "parent", "static"}
+_EMPTY: FrozenSet[str] = frozenset()
+
+
+def _condense(n: int, succ: List[List[int]]) -> List[int]:
+    # iterative Tarjan: node -> SCC id, ids numbered in reverse topological order (an SCC's
+    # successors always have smaller ids), so folding ids in increasing order is bottom-up
+    comp = [-1] * n
+    low = [0] * n
+    order = [-1] * n
+    stack: List[int] = []
+    on_stack = [False] * n
+    counter = 0
+    ncomp = 0
+    for root in range(n):
+        if order[root] != -1:
+            continue
+        work = [(root, 0)]
+        while work:
+            v, i = work[-1]
+            if i == 0:
+                order[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            if i < len(succ[v]):
+                work[-1] = (v, i + 1)
+                w = succ[v][i]
+                if order[w] == -1:
+                    work.append((w, 0))
+                elif on_stack[w]:
+                    low[v] = min(low[v], order[w])
+                continue
+            work.pop()
+            if work:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == order[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp[w] = ncomp
+                    if w == v:
+                        break
+                ncomp += 1
+    return comp
+
+
+def _fold(n: int, succ: List[List[int]], local: List[FrozenSet[str]], extra: Optional[List[List[FrozenSet[str]]]] = None) -> List[FrozenSet[str]]:
+    # bottom-up union over the SCC condensation: every member of a cycle gets the same summary.
+    # Equal sets are interned so a large graph holds a handful of distinct frozensets
+    comp = _condense(n, succ)
+    members: List[List[int]] = [[] for _ in range(max(comp, default=-1) + 1)]
+    for v, c in enumerate(comp):
+        members[c].append(v)
+    interned: Dict[FrozenSet[str], FrozenSet[str]] = {}
+    summary: List[FrozenSet[str]] = [_EMPTY] * len(members)
+    for c, vs in enumerate(members):
+        acc = set()
+        for v in vs:
+            acc |= local[v]
+            if extra is not None:
+                for s in extra[v]:
+                    acc |= s
+            for w in succ[v]:
+                if comp[w] != c:
+                    acc |= summary[comp[w]]
+        fs = frozenset(acc)
+        summary[c] = interned.setdefault(fs, fs)
+    return [summary[comp[v]] for v in range(n)]
+
+
+class CallGraph:
+    # inter-procedural call graph over (concrete class, effective method) pairs. $this->m() and
+    # self:: / parent:: / static:: calls resolve through the receiver's class (late static binding
+    # included), A::m() through the class table, $this->p->m() to every concrete class with an
+    # effective m (the object in $this->p is whatever the payload puts there) through one shared
+    # hub node per method name, so edges stay linear in call sites. Per node the graph
+    # keeps, bottom-up over its strongly connected components, the sinks reachable from it and
+    # the receiver's properties involved on the way, so both queries are a list lookup. Method
+    # names are case-insensitive in PHP, so nodes are keyed by the lowercased name.
+    def __init__(self, index: SummaryIndex):
+        self.index = index
+        table = index.table
+        # hubs have no method and no receiver
+        self.nodes: List[Optional[MethodRef]] = []
+        self.receivers: List[Optional[ClassInfo]] = []
+        self.ids: Dict[Tuple[int, str], int] = {}
+        by_name: Dict[str, List[int]] = {}
+        for c in table.concrete():
+            for name, ref in table.methods(c).items():
+                nid = len(self.nodes)
+                self.nodes.append(ref)
+                self.receivers.append(c)
+                self.ids[(id(c), name.lower())] = nid
+                by_name.setdefault(name.lower(), []).append(nid)
+        self.edges: List[List[Tuple[int, Edge]]] = [[] for _ in self.nodes]
+        hubs: Dict[str, int] = {}
+        for nid, ref in enumerate(self.nodes):
+            if ref is None:
+                continue
+            owner, m = ref
+            c = self.receivers[nid]
+            out = self.edges[nid]
+            for name in dict.fromkeys(m.self_calls):
+                target = self.ids.get((id(c), name.lower()))
+                if target is not None:
+                    out.append((target, ("self", None, name)))
+            for prop, names in m.property_calls.items():
+                for name in dict.fromkeys(names):
+                    targets = by_name.get(name.lower())
+                    if not targets:
+                        continue
+                    hub = hubs.get(name.lower())
+                    if hub is None:
+                        hub = hubs[name.lower()] = len(self.nodes)
+                        self.nodes.append(None)
+                        self.receivers.append(None)
+                        self.edges.append([(t, ("any", None, name)) for t in targets])
+                    out.append((hub, ("call", prop, name)))
+            for call in m.static_calls:
+                scope, _, name = call.rpartition("::")
+                kind = scope.lower()
+                if kind in _SAME_OBJECT:
+                    # static:: binds to the receiver, self:: to the declaring class, parent:: above it
+                    base = c if kind == "static" else (table.parent_of(owner) if kind == "parent" else owner)
+                    ref = self._resolve(base, name) if base is not None else None
+                    if ref is None:
+                        continue
+                    eff = self._resolve(c, name)
+                    target = self.ids[(id(c), name.lower())] if eff is not None and eff[1] is ref[1] else self._extra(c, ref, name)
+                    out.append((target, ("self", None, name)))
+                else:
+                    callee = table.lookup(scope, owner.namespace, owner.imports)
+                    target = self.ids.get((id(callee), name.lower())) if callee is not None else None
+                    if target is not None:
+                        out.append((target, ("static", None, name)))
+        n = len(self.nodes)
+        succ = [[t for t, _ in out] for out in self.edges]
+        # sinks: through every edge; properties: only along edges that keep the same receiver, plus
+        # the property a call edge goes through
+        self_succ = [[t for t, e in out if e[0] == "self"] for out in self.edges]
+        local_sinks = [frozenset(s.name for s in ref[1].sinks) if ref else _EMPTY for ref in self.nodes]
+        local_props = [
+            frozenset(ref[1].uses_properties) | frozenset(ref[1].invokes_properties) | frozenset(ref[1].property_calls)
+            if ref else _EMPTY
+            for ref in self.nodes
+        ]
+        via = [[frozenset((e[1],)) for _, e in out if e[0] == "call"] for out in self.edges]
+        self._sinks = _fold(n, succ, local_sinks)
+        self._props = _fold(n, self_succ, local_props, via)
+        self._reaching: Dict[str, List[MethodRef]] = {}
+
+    def _extra(self, c: ClassInfo, ref: MethodRef, name: str) -> int:
+        # a node for an overridden method still reachable on c through parent:: / self::; the
+        # constructor loop reaches it too, so its own calls are resolved like any other node's
+        key = (id(c), f"{fqcn(ref[0])}::{name.lower()}")
+        nid = self.ids.get(key)
+        if nid is None:
+            nid = self.ids[key] = len(self.nodes)
+            self.nodes.append(ref)
+            self.receivers.append(c)
+            self.edges.append([])
+        return nid
+
+    def _resolve(self, c: ClassInfo, name: str) -> Optional[MethodRef]:
+        # ClassTable.resolve with PHP's case-insensitive method names
+        ref = self.index.table.resolve(c, name)
+        if ref is None:
+            low = name.lower()
+            ref = next((r for n, r in self.index.table.methods(c).items() if n.lower() == low), None)
+        return ref
+
+    def sinks(self, c: ClassInfo, method: str) -> FrozenSet[str]:
+        # every sink reachable from c->method(), directly or through any chain of calls
+        nid = self.ids.get((id(c), method.lower()))
+        return self._sinks[nid] if nid is not None else _EMPTY
+
+    def properties(self, c: ClassInfo, method: str) -> FrozenSet[str]:
+        # the properties of c that c->method() and the methods it calls on $this read, invoke or
+        # call through
+        nid = self.ids.get((id(c), method.lower()))
+        return self._props[nid] if nid is not None else _EMPTY
+
+    def reaching(self, sink: str) -> List[MethodRef]:
+        # magic methods of concrete classes with the sink reachable, in index order
+        hit = self._reaching.get(sink)
+        if hit is None:
+            hit = []
+            for c in self.index.table.concrete():
+                for name, (_, m) in self.index.table.magic(c).items():
+                    if sink in self.sinks(c, name):
+                        hit.append((c, m))
+            hit.sort(key=lambda r: self.index.order[(id(r[0]), id(r[1]))])
+            self._reaching[sink] = hit
+        return hit
+
+    def path(self, c: ClassInfo, method: str, sink: str) -> Optional[List[Tuple[ClassInfo, str, Optional[Edge]]]]:
+        # a shortest call path from c->method() to a method calling the sink, as (receiver class,
+        # method as declared, edge taken to get there); only nodes whose summary contains the sink
+        # are explored
+        start = self.ids.get((id(c), method.lower()))
+        if start is None or sink not in self._sinks[start]:
+            return None
+        prev: Dict[int, Tuple[int, Edge]] = {}
+        queue = deque([start])
+        seen = {start}
+        while queue:
+            nid = queue.popleft()
+            ref = self.nodes[nid]
+            if ref is not None and any(s.name == sink for s in ref[1].sinks):
+                hops: List[Tuple[ClassInfo, str, Optional[Edge]]] = []
+                while nid != start:
+                    p, e = prev[nid]
+                    if self.nodes[p] is None:
+                        # through a hub: report the call edge that entered it
+                        p, e = prev[p]
+                    hops.append((self.receivers[nid], self.nodes[nid][1].name, e))
+                    nid = p
+                hops.append((c, method, None))
+                return hops[::-1]
+            for t, e in self.edges[nid]:
+                if t not in seen and sink in self._sinks[t]:
+                    seen.add(t)
+                    prev[t] = (nid, e)
+                    queue.append(t)
+        return None
+
+
+_GRAPHS: "weakref.WeakKeyDictionary[SummaryIndex, CallGraph]" = weakref.WeakKeyDictionary()
+
+
+def get_call_graph(index: SummaryIndex) -> CallGraph:
+    # built once per summary index, on first use
+    g = _GRAPHS.get(index)
+    if g is None:
+        g = _GRAPHS[index] = CallGraph(index)
+    return g
@@ -0,0 +1,479 @@
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from pydantic_core import core_schema
+from .models import AnalysisSummary, ClassInfo, MagicMethodInfo, SinkInfo
+
+
+# Columnar storage for analysis results. Every string (file paths, class / method / property /
+# sink names) is interned once per store and referenced by an integer id, line numbers live in
+# typed arrays, and list fields are tuples of ids. The scanners, the cache, the process pool and
+# everything downstream (class table, indexes, call graph, solver, gadget sniffer, simulator) work
+# on the slotted views below, which expose the same attributes as ClassInfo / MagicMethodInfo /
+# SinkInfo; pydantic models are only built when a result leaves the MCP server: AnalysisSummary
+# declares both types and a view serializes through to_model().
+
+_NONE = -1
+Ids = Tuple[int, ...]
+# (name, line, per-argument properties or None, per-argument parameter indices or None)
+SinkRow = Tuple[str, int, Optional[Sequence[Sequence[str]]], Optional[Sequence[Sequence[int]]]]
+
+_COLUMNS = (
+    "strings",
+    "c_name", "c_file", "c_kind", "c_ns", "c_parent", "c_props", "c_ifaces", "c_traits", "c_imports", "c_mstart",
+    "m_name", "m_file", "m_line", "m_calls", "m_uses", "m_invokes", "m_triggers", "m_static", "m_self", "m_pcalls", "m_sstart",
+    "s_name", "s_file", "s_line", "s_args", "s_params",
+)
+
+
+class ClassStore:
+    __slots__ = _COLUMNS + ("ids", "classes", "methods", "sinks")
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.c_name = array("i")
+        self.c_file = array("i")
+        self.c_kind = array("i")
+        self.c_ns = array("i")
+        self.c_parent = array("i")
+        self.c_props: List[Ids] = []
+        self.c_ifaces: List[Ids] = []
+        self.c_traits: List[Ids] = []
+        self.c_imports: List[Tuple[Tuple[int, int], ...]] = []
+        # method range of class i is [c_mstart[i], c_mstart[i + 1]); sink ranges likewise
+        self.c_mstart = array("i", [0])
+        self.m_name = array("i")
+        self.m_file = array("i")
+        self.m_line = array("i")
+        self.m_calls: List[Ids] = []
+        self.m_uses: List[Ids] = []
+        self.m_invokes: List[Ids] = []
+        self.m_triggers: List[Tuple[Tuple[int, Ids], ...]] = []
+        self.m_static: List[Ids] = []
+        self.m_self: List[Ids] = []
+        self.m_pcalls: List[Tuple[Tuple[int, Ids], ...]] = []
+        self.m_sstart = array("i", [0])
+        self.s_name = array("i")
+        self.s_file = array("i")
+        self.s_line = array("i")
+        self.s_args: List[Optional[Tuple[Ids, ...]]] = []
+        self.s_params: List[Optional[Tuple[Tuple[int, ...], ...]]] = []
+        # one view per row, created once so identity-keyed caches downstream stay valid
+        self.classes: List[ClassView] = []
+        self.methods: List[MethodView] = []
+        self.sinks: List[SinkView] = []
+
+    # --- building ------------------------------------------------------------------------
+
+    def intern(self, s: Optional[str]) -> int:
+        if s is None:
+            return _NONE
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def _ids(self, seq: Iterable[str]) -> Ids:
+        if not seq:
+            return ()
+        ids = self.ids
+        return tuple([ids[s] if s in ids else self.intern(s) for s in seq])
+
+    def _groups(self, d: Optional[Dict[str, Iterable[str]]]) -> Tuple[Tuple[int, Ids], ...]:
+        return tuple([(self.intern(k), self._ids(v)) for k, v in d.items()]) if d else ()
+
+    def add_method(
+        self,
+        name: str,
+        file: str,
+        line: int,
+        sinks: Sequence[SinkRow] = (),
+        calls: Sequence[str] = (),
+        uses_properties: Sequence[str] = (),
+        invokes_properties: Sequence[str] = (),
+        triggers: Optional[Dict[str, List[str]]] = None,
+        static_calls: Sequence[str] = (),
+        self_calls: Sequence[str] = (),
+        property_calls: Optional[Dict[str, List[str]]] = None,
+    ) -> "MethodView":
+        # methods belong to the next add_class() call; sinks are taken from `file`
+        fid = self.intern(file)
+        for sname, sline, args, params in sinks:
+            self.s_name.append(self.intern(sname))
+            self.s_file.append(fid)
+            self.s_line.append(sline)
+            self.s_args.append(None if args is None else tuple(self._ids(a) for a in args))
+            self.s_params.append(None if params is None else tuple(tuple(p) for p in params))
+            self.sinks.append(SinkView(self, len(self.sinks)))
+        self.m_name.append(self.intern(name))
+        self.m_file.append(fid)
+        self.m_line.append(line)
+        self.m_calls.append(self._ids(calls))
+        self.m_uses.append(self._ids(uses_properties))
+        self.m_invokes.append(self._ids(invokes_properties))
+        self.m_triggers.append(self._groups(triggers))
+        self.m_static.append(self._ids(static_calls))
+        self.m_self.append(self._ids(self_calls))
+        self.m_pcalls.append(self._groups(property_calls))
+        self.m_sstart.append(len(self.s_name))
+        view = MethodView(self, len(self.methods))
+        self.methods.append(view)
+        return view
+
+    def add_class(
+        self,
+        name: str,
+        file: str,
+        properties: Sequence[str] = (),
+        kind: str = "class",
+        namespace: Optional[str] = None,
+        parent: Optional[str] = None,
+        interfaces: Sequence[str] = (),
+        traits: Sequence[str] = (),
+        imports: Optional[Dict[str, str]] = None,
+    ) -> "ClassView":
+        # closes a class over every method added since the previous one
+        self.c_name.append(self.intern(name))
+        self.c_file.append(self.intern(file))
+        self.c_kind.append(self.intern(kind))
+        self.c_ns.append(self.intern(namespace))
+        self.c_parent.append(self.intern(parent))
+        self.c_props.append(self._ids(properties))
+        self.c_ifaces.append(self._ids(interfaces))
+        self.c_traits.append(self._ids(traits))
+        self.c_imports.append(tuple((self.intern(k), self.intern(v)) for k, v in (imports or {}).items()))
+        self.c_mstart.append(len(self.m_name))
+        view = ClassView(self, len(self.classes))
+        self.classes.append(view)
+        return view
+
+    def extend(self, classes: Iterable[Any]) -> List["ClassView"]:
+        # copy classes from other stores (remapping their string ids) or from pydantic models into
+        # this one; returns the new views
+        out: List[ClassView] = []
+        remaps: Dict[int, List[int]] = {}
+        for c in classes:
+            if isinstance(c, ClassView):
+                src = c._s
+                remap = remaps.get(id(src))
+                if remap is None:
+                    remap = remaps[id(src)] = [self.intern(s) for s in src.strings]
+                out.append(self._copy(src, c._i, remap))
+                continue
+            for m in c.methods:
+                self.add_method(
+                    m.name, m.file, m.line, [(s.name, s.line, s.args, s.params) for s in m.sinks], m.calls,
+                    m.uses_properties, m.invokes_properties, m.triggers, m.static_calls, m.self_calls, m.property_calls,
+                )
+            out.append(self.add_class(c.name, c.file, c.properties, c.kind, c.namespace, c.parent, c.interfaces, c.traits, c.imports))
+        return out
+
+    def _copy(self, src: "ClassStore", ci: int, remap: List[int]) -> "ClassView":
+        def ids(t: Ids) -> Ids:
+            return tuple([remap[i] for i in t]) if t else ()
+
+        def groups(t):
+            return tuple([(remap[k], ids(v)) for k, v in t]) if t else ()
+
+        def opt(i: int) -> int:
+            return _NONE if i == _NONE else remap[i]
+
+        for mi in range(src.c_mstart[ci], src.c_mstart[ci + 1]):
+            for si in range(src.m_sstart[mi], src.m_sstart[mi + 1]):
+                self.s_name.append(remap[src.s_name[si]])
+                self.s_file.append(remap[src.s_file[si]])
+                self.s_line.append(src.s_line[si])
+                args = src.s_args[si]
+                self.s_args.append(None if args is None else tuple(ids(a) for a in args))
+                self.s_params.append(src.s_params[si])
+                self.sinks.append(SinkView(self, len(self.sinks)))
+            self.m_name.append(remap[src.m_name[mi]])
+            self.m_file.append(remap[src.m_file[mi]])
+            self.m_line.append(src.m_line[mi])
+            self.m_calls.append(ids(src.m_calls[mi]))
+            self.m_uses.append(ids(src.m_uses[mi]))
+            self.m_invokes.append(ids(src.m_invokes[mi]))
+            self.m_triggers.append(groups(src.m_triggers[mi]))
+            self.m_static.append(ids(src.m_static[mi]))
+            self.m_self.append(ids(src.m_self[mi]))
+            self.m_pcalls.append(groups(src.m_pcalls[mi]))
+            self.m_sstart.append(len(self.s_name))
+            self.methods.append(MethodView(self, len(self.methods)))
+        self.c_name.append(remap[src.c_name[ci]])
+        self.c_file.append(remap[src.c_file[ci]])
+        self.c_kind.append(remap[src.c_kind[ci]])
+        self.c_ns.append(opt(src.c_ns[ci]))
+        self.c_parent.append(opt(src.c_parent[ci]))
+        self.c_props.append(ids(src.c_props[ci]))
+        self.c_ifaces.append(ids(src.c_ifaces[ci]))
+        self.c_traits.append(ids(src.c_traits[ci]))
+        self.c_imports.append(tuple((remap[k], remap[v]) for k, v in src.c_imports[ci]))
+        self.c_mstart.append(len(self.m_name))
+        view = ClassView(self, len(self.classes))
+        self.classes.append(view)
+        return view
+
+    # --- pickling / cache rows -----------------------------------------------------------
+
+    def __getstate__(self) -> tuple:
+        # columns only: views are rebuilt on the other side, ids from the string list
+        return tuple(getattr(self, k) for k in _COLUMNS)
+
+    def __setstate__(self, state: tuple) -> None:
+        for k, v in zip(_COLUMNS, state):
+            setattr(self, k, v)
+        self.ids = {s: i for i, s in enumerate(self.strings)}
+        self.classes = [ClassView(self, i) for i in range(len(self.c_name))]
+        self.methods = [MethodView(self, i) for i in range(len(self.m_name))]
+        self.sinks = [SinkView(self, i) for i in range(len(self.s_name))]
+
+    def dump(self) -> List[Any]:
+        # JSON-friendly column dump (arrays as lists, tuples as lists)
+        return [list(v) if isinstance(v, array) else v for v in self.__getstate__()]
+
+    @classmethod
+    def load(cls, data: List[Any]) -> "ClassStore":
+        def tup(x):
+            return tuple(tup(y) for y in x) if isinstance(x, list) else x
+
+        if len(data) != len(_COLUMNS):
+            raise ValueError("column count mismatch")
+        state = []
+        for k, v in zip(_COLUMNS, data):
+            if k == "strings":
+                state.append(list(v))
+            elif k in ("c_props", "c_ifaces", "c_traits", "c_imports", "m_calls", "m_uses", "m_invokes", "m_triggers", "m_static", "m_self", "m_pcalls", "s_args", "s_params"):
+                state.append([tup(x) for x in v])
+            else:
+                state.append(array("i", v))
+        store = cls.__new__(cls)
+        store.__setstate__(tuple(state))
+        return store
+
+
+def _as_model(model: type):
+    # pydantic schema of a view: an instance check in Python, the model's schema for JSON input
+    # and JSON schema, serialized through to_model()
+    def schema(cls, source: Any, handler: Any) -> core_schema.CoreSchema:
+        inner = handler.generate_schema(model)
+        return core_schema.json_or_python_schema(
+            json_schema=inner,
+            python_schema=core_schema.is_instance_schema(cls),
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda v: v.to_model() if isinstance(v, cls) else v, return_schema=inner),
+        )
+
+    return classmethod(schema)
+
+
+class SinkView:
+    __slots__ = ("_s", "_i")
+    __get_pydantic_core_schema__ = _as_model(SinkInfo)
+
+    def __init__(self, store: ClassStore, i: int):
+        self._s = store
+        self._i = i
+
+    @property
+    def name(self) -> str:
+        return self._s.strings[self._s.s_name[self._i]]
+
+    @property
+    def file(self) -> str:
+        return self._s.strings[self._s.s_file[self._i]]
+
+    @property
+    def line(self) -> int:
+        return self._s.s_line[self._i]
+
+    @property
+    def args(self) -> Optional[List[List[str]]]:
+        a = self._s.s_args[self._i]
+        strings = self._s.strings
+        return None if a is None else [[strings[x] for x in arg] for arg in a]
+
+    @property
+    def params(self) -> Optional[List[List[int]]]:
+        p = self._s.s_params[self._i]
+        return None if p is None else [list(x) for x in p]
+
+    def to_model(self) -> SinkInfo:
+        return SinkInfo.model_construct(name=self.name, file=self.file, line=self.line, args=self.args, params=self.params)
+
+    def __repr__(self) -> str:
+        return f"SinkView({self.name!r}, line={self.line})"
+
+
+class MethodView:
+    __slots__ = ("_s", "_i")
+
+    def __init__(self, store: ClassStore, i: int):
+        self._s = store
+        self._i = i
+
+    def _names(self, col: List[Ids]) -> List[str]:
+        strings = self._s.strings
+        return [strings[x] for x in col[self._i]]
+
+    def _groups(self, col) -> Dict[str, List[str]]:
+        strings = self._s.strings
+        return {strings[k]: [strings[x] for x in v] for k, v in col[self._i]}
+
+    @property
+    def name(self) -> str:
+        return self._s.strings[self._s.m_name[self._i]]
+
+    @property
+    def file(self) -> str:
+        return self._s.strings[self._s.m_file[self._i]]
+
+    @property
+    def line(self) -> int:
+        return self._s.m_line[self._i]
+
+    @property
+    def sinks(self) -> List[SinkView]:
+        s = self._s
+        return s.sinks[s.m_sstart[self._i]:s.m_sstart[self._i + 1]]
+
+    @property
+    def calls(self) -> List[str]:
+        return self._names(self._s.m_calls)
+
+    @property
+    def uses_properties(self) -> List[str]:
+        return self._names(self._s.m_uses)
+
+    @property
+    def invokes_properties(self) -> List[str]:
+        return self._names(self._s.m_invokes)
+
+    @property
+    def triggers(self) -> Dict[str, List[str]]:
+        return self._groups(self._s.m_triggers)
+
+    @property
+    def static_calls(self) -> List[str]:
+        return self._names(self._s.m_static)
+
+    @property
+    def self_calls(self) -> List[str]:
+        return self._names(self._s.m_self)
+
+    @property
+    def property_calls(self) -> Dict[str, List[str]]:
+        return self._groups(self._s.m_pcalls)
+
+    def to_model(self) -> MagicMethodInfo:
+        return MagicMethodInfo.model_construct(
+            name=self.name,
+            file=self.file,
+            line=self.line,
+            sinks=[s.to_model() for s in self.sinks],
+            calls=self.calls,
+            uses_properties=self.uses_properties,
+            invokes_properties=self.invokes_properties,
+            triggers=self.triggers,
+            static_calls=self.static_calls,
+            self_calls=self.self_calls,
+            property_calls=self.property_calls,
+        )
+
+    def __repr__(self) -> str:
+        return f"MethodView({self.name!r}, line={self.line})"
+
+
+class ClassView:
+    __slots__ = ("_s", "_i")
+    __get_pydantic_core_schema__ = _as_model(ClassInfo)
+
+    def __init__(self, store: ClassStore, i: int):
+        self._s = store
+        self._i = i
+
+    def _opt(self, col: array) -> Optional[str]:
+        i = col[self._i]
+        return None if i == _NONE else self._s.strings[i]
+
+    def _names(self, col: List[Ids]) -> List[str]:
+        strings = self._s.strings
+        return [strings[x] for x in col[self._i]]
+
+    @property
+    def name(self) -> str:
+        return self._s.strings[self._s.c_name[self._i]]
+
+    @property
+    def file(self) -> str:
+        return self._s.strings[self._s.c_file[self._i]]
+
+    @property
+    def kind(self) -> str:
+        return self._s.strings[self._s.c_kind[self._i]]
+
+    @property
+    def namespace(self) -> Optional[str]:
+        return self._opt(self._s.c_ns)
+
+    @property
+    def parent(self) -> Optional[str]:
+        return self._opt(self._s.c_parent)
+
+    @property
+    def methods(self) -> List[MethodView]:
+        s = self._s
+        return s.methods[s.c_mstart[self._i]:s.c_mstart[self._i + 1]]
+
+    @property
+    def properties(self) -> List[str]:
+        return self._names(self._s.c_props)
+
+    @property
+    def interfaces(self) -> List[str]:
+        return self._names(self._s.c_ifaces)
+
+    @property
+    def traits(self) -> List[str]:
+        return self._names(self._s.c_traits)
+
+    @property
+    def imports(self) -> Dict[str, str]:
+        strings = self._s.strings
+        return {strings[k]: strings[v] for k, v in self._s.c_imports[self._i]}
+
+    def to_model(self) -> ClassInfo:
+        return ClassInfo.model_construct(
+            name=self.name,
+            file=self.file,
+            methods=[m.to_model() for m in self.methods],
+            properties=self.properties,
+            kind=self.kind,
+            namespace=self.namespace,
+            parent=self.parent,
+            interfaces=self.interfaces,
+            traits=self.traits,
+            imports=self.imports,
+        )
+
+    def __repr__(self) -> str:
+        return f"ClassView({self.name!r})"
+
+
+def to_model(x: Any) -> Any:
+    # a view as its pydantic model; models pass through
+    return x.to_model() if isinstance(x, (ClassView, MethodView, SinkView)) else x
+
+
+def to_models(summary: AnalysisSummary) -> AnalysisSummary:
+    # the MCP boundary: a summary whose classes / sinks are views becomes plain pydantic models
+    if not any(isinstance(c, ClassView) for c in summary.classes) and not any(isinstance(s, SinkView) for s in summary.sinks):
+        return summary
+    return AnalysisSummary.model_construct(
+        classes=[to_model(c) for c in summary.classes],
+        sinks=[to_model(s) for s in summary.sinks],
+        files_scanned=summary.files_scanned,
+        packages=summary.packages,
+    )
+
+
+AnalysisSummary.model_rebuild(_types_namespace={"ClassView": ClassView, "SinkView": SinkView})
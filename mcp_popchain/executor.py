@@ -0,0 +1,110 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+from mcp.server.lowlevel.server import request_ctx
+
+
+# event loop of the heavy call running on the current worker thread (see notify)
+_LOOP: "contextvars.ContextVar[Optional[asyncio.AbstractEventLoop]]" = contextvars.ContextVar("popchain_loop", default=None)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class ToolPool:
+    # bounded pool for CPU-heavy tools: at most max_workers run at once, at most max_queue wait,
+    # anything beyond that is rejected immediately instead of piling up behind a large scan. One
+    # client (MCP session) may hold at most per_client of those slots, so a single client cannot
+    # fill the queue ahead of everyone else
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None, per_client: Optional[int] = None):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._by_client: Dict[Any, int] = {}
+        self.configure(max_workers, max_queue, per_client)
+
+    def configure(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None, per_client: Optional[int] = None) -> None:
+        with self._lock:
+            self.max_workers = max_workers or _env_int("POPCHAIN_HEAVY_WORKERS", min(4, os.cpu_count() or 1))
+            self.max_queue = max_queue if max_queue is not None else _env_int("POPCHAIN_HEAVY_QUEUE", 16)
+            self.per_client = per_client or _env_int("POPCHAIN_HEAVY_PER_CLIENT", self.max_workers)
+            old, self._executor = self._executor, None
+        if old is not None:
+            old.shutdown(wait=False)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="popchain-heavy")
+            return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await self.run_for(None, fn, *args, **kwargs)
+
+    async def run_for(self, client: Any, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        # client is any hashable key for the caller; None is not counted against a per-client cap
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                raise RuntimeError(f"server busy: {self._pending} heavy calls running or queued, retry later")
+            if client is not None:
+                mine = self._by_client.get(client, 0)
+                if mine >= self.per_client:
+                    raise RuntimeError(f"server busy: this client already has {mine} heavy calls running or queued, retry later")
+                self._by_client[client] = mine + 1
+            self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = contextvars.copy_context()
+            call.run(_LOOP.set, loop)
+            return await loop.run_in_executor(self._get_executor(), functools.partial(call.run, fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._pending -= 1
+                if client is not None:
+                    left = self._by_client.pop(client) - 1
+                    if left:
+                        self._by_client[client] = left
+
+
+HEAVY = ToolPool()
+
+
+def notify(message: Awaitable[Any]) -> None:
+    # from inside a heavy tool: run a coroutine (an MCP notification through Context) on the server
+    # loop and wait for it, so the client sees it while the tool is still working; outside a heavy
+    # call there is no loop to send on and the message is dropped
+    loop = _LOOP.get()
+    if loop is None:
+        if asyncio.iscoroutine(message):
+            message.close()
+        return
+    asyncio.run_coroutine_threadsafe(message, loop).result()
+
+
+def _session() -> Any:
+    # the MCP session of the request being served; None when a tool is called outside a request
+    try:
+        return request_ctx.get().session
+    except LookupError:
+        return None
+
+
+def heavy(fn: Callable[..., Any]) -> Callable[..., Any]:
+    # turns a sync tool into an async one that runs on HEAVY, counted against the calling session;
+    # wraps() keeps the signature for FastMCP
+    @functools.wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        return await HEAVY.run_for(_session(), fn, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,127 @@
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from .callgraph import get_call_graph
+from .hierarchy import fqcn
+from .index import SummaryIndex
+from .knowledge_base import GadgetDB, get_gadget_db
+from .models import ClassInfo, FingerprintMatch, FingerprintMatches, KBItem, MagicMethodInfo
+
+
+SHAPE_KEYS = ("method", "sinks", "triggers", "property_calls", "self_calls", "static_calls", "invokes")
+
+
+def normalize_shape(shape: Dict[str, Any]) -> Dict[str, Any]:
+    # names that survive a rename (magic method, sinks, framework method names) are kept; class,
+    # namespace and property names are dropped. PHP method names are case-insensitive.
+    out: Dict[str, Any] = {"method": str(shape.get("method", "")).lower()}
+    for key in SHAPE_KEYS[1:-1]:
+        out[key] = sorted({str(x).lower() for x in shape.get(key) or []})
+    out["invokes"] = bool(shape.get("invokes"))
+    return out
+
+
+def method_shape(m: MagicMethodInfo) -> Dict[str, Any]:
+    return normalize_shape(
+        {
+            "method": m.name,
+            "sinks": [s.name for s in m.sinks],
+            "triggers": list(m.triggers),
+            "property_calls": [x for calls in m.property_calls.values() for x in calls],
+            "self_calls": m.self_calls,
+            "static_calls": [s.rsplit("::", 1)[-1] for s in m.static_calls],
+            "invokes": bool(m.invokes_properties),
+        }
+    )
+
+
+def shape_features(shape: Dict[str, Any]) -> FrozenSet[str]:
+    # everything in a normalized shape but the method name, as "key:value" tokens
+    out = {f"{key}:{x}" for key in SHAPE_KEYS[1:-1] for x in shape[key]}
+    if shape["invokes"]:
+        out.add("invokes")
+    return frozenset(out)
+
+
+class FingerprintIndex:
+    # (method, anchor feature) -> [(gadget, position of the shape in its signature, its features)].
+    # A shape matches a method whose features include all of its own, so a renamed or vendored
+    # copy with extra calls still matches; each shape is filed under its feature rarest in the db,
+    # so a method only checks the shapes anchored on one of its features
+    def __init__(self, db: GadgetDB):
+        self.gadgets: List[KBItem] = [it for it in db.items if it.fingerprints]
+        shapes: List[Tuple[int, int, str, FrozenSet[str]]] = []
+        for gi, it in enumerate(self.gadgets):
+            for si, shape in enumerate(it.fingerprints):
+                n = normalize_shape(shape)
+                feats = shape_features(n)
+                if not feats:
+                    raise ValueError(f"gadget {it.name}: fingerprint {shape} has nothing but a method name, which any class matches")
+                shapes.append((gi, si, n["method"], feats))
+        freq = Counter(f for *_, feats in shapes for f in feats)
+        self.by_anchor: Dict[Tuple[str, str], List[Tuple[int, int, FrozenSet[str]]]] = {}
+        for gi, si, method, feats in shapes:
+            anchor = min(feats, key=lambda f: (freq[f], f))
+            self.by_anchor.setdefault((method, anchor), []).append((gi, si, feats))
+
+    def scan(self, classes: List[ClassInfo], index: Optional[SummaryIndex] = None) -> FingerprintMatches:
+        # one pass over the effective magic methods of every concrete class; inherited methods are
+        # reduced to features once. A gadget is reported when every shape of its signature matches
+        # and the matched methods reach its sink through the call graph
+        index = index or SummaryIndex(classes)
+        table = index.table
+        calls = get_call_graph(index)
+        features: Dict[int, FrozenSet[str]] = {}
+        hits: Dict[int, Dict[int, List[Tuple[ClassInfo, MagicMethodInfo]]]] = {}
+        for c in table.concrete():
+            for _, m in table.magic(c).values():
+                feats = features.get(id(m))
+                if feats is None:
+                    feats = features[id(m)] = shape_features(method_shape(m))
+                name = m.name.lower()
+                for f in feats:
+                    for gi, si, need in self.by_anchor.get((name, f), ()):
+                        if need <= feats:
+                            hits.setdefault(gi, {}).setdefault(si, []).append((c, m))
+        items: List[FingerprintMatch] = []
+        for gi, found in hits.items():
+            it = self.gadgets[gi]
+            if len(found) < len(it.fingerprints):
+                continue
+            # per shape, the first match that reaches the sink, else the first match
+            chosen = [next((r for r in found[si] if it.sink in calls.sinks(r[0], r[1].name)), found[si][0]) for si in range(len(it.fingerprints))]
+            if not any(it.sink in calls.sinks(c, m.name) for c, m in chosen):
+                continue
+            items.append(
+                FingerprintMatch(
+                    name=it.name,
+                    framework=it.framework,
+                    package=it.package,
+                    sink=it.sink,
+                    # signatures built from more distinctive shapes rank first
+                    score=round(sum(_weight(s) for s in it.fingerprints), 3),
+                    classes=[f"{fqcn(c)}::{m.name}" for c, m in chosen],
+                )
+            )
+        items.sort(key=lambda x: x.score, reverse=True)
+        return FingerprintMatches(items=items)
+
+
+def _weight(shape: Dict[str, Any]) -> float:
+    n = normalize_shape(shape)
+    return 1.0 + sum(len(n[k]) for k in SHAPE_KEYS[1:-1]) * 0.5 + (0.5 if n["invokes"] else 0.0)
+
+
+_INDEX: Optional[FingerprintIndex] = None
+_INDEX_DB: Optional[GadgetDB] = None
+
+
+def get_fingerprint_index() -> FingerprintIndex:
+    global _INDEX, _INDEX_DB
+    db = get_gadget_db()
+    if _INDEX is None or _INDEX_DB is not db:
+        _INDEX, _INDEX_DB = FingerprintIndex(db), db
+    return _INDEX
+
+
+def fingerprint_gadgets(classes: List[ClassInfo], index: Optional[SummaryIndex] = None) -> FingerprintMatches:
+    return get_fingerprint_index().scan(classes, index)
@@ -1,55 +1,49 @@
-from typing import List
-from .models import GadgetCandidates, GadgetCandidate, ClassInfo
-
-
-STRING_FUNCS = {"preg_match", "preg_replace", "printf", "sprintf"}
-
-
-def sniff_trampolines(classes: List[ClassInfo]) -> GadgetCandidates:
-    items: List[GadgetCandidate] = []
-    for c in classes:
-        props_set = set(c.properties or [])
-        for m in c.methods:
-            # __toString trampoline via string context functions
-            if any(fn in STRING_FUNCS for fn in m.calls):
-                items.append(
-                    GadgetCandidate(
-                        name=f"{c.name}:{m.name}:toString",
-                        class_name=c.name,
-                        method=m.name,
-                        sink="__toString",
-                        file=c.file,
-                        line=m.line,
-                        score=0.6,
-                    )
-                )
-            # __invoke trampoline via callable property invocation
-            if getattr(m, "invokes_properties", []):
-                items.append(
-                    GadgetCandidate(
-                        name=f"{c.name}:{m.name}:invoke",
-                        class_name=c.name,
-                        method=m.name,
-                        sink="__invoke",
-                        file=c.file,
-                        line=m.line,
-                        score=0.7,
-                    )
-                )
-            # __get heuristic: accessing undefined property names
-            undefined_props = [p for p in m.uses_properties if p not in props_set]
-            if undefined_props:
-                items.append(
-                    GadgetCandidate(
-                        name=f"{c.name}:{m.name}:get",
-                        class_name=c.name,
-                        method=m.name,
-                        sink="__get",
-                        file=c.file,
-                        line=m.line,
-                        score=0.5,
-                    )
-                )
-    items.sort(key=lambda x: x.score, reverse=True)
-    return GadgetCandidates(items=items)
+from typing import Callable, Iterator, List, Optional
+from .models import GadgetCandidates, GadgetCandidate, ClassInfo, MagicMethodInfo
+from .analyzer import STRING_CONTEXT_FUNCS
+from .hierarchy import MethodRef, fqcn
+from .index import SummaryIndex
+
+
+# the calls the analyzer treats as a string context (__toString triggers); PHP function names are
+# case-insensitive
+STRING_FUNCS = {s.lower() for s in STRING_CONTEXT_FUNCS}
+
+
+def iter_trampolines(index: SummaryIndex, where: Optional[Callable[[ClassInfo, MagicMethodInfo], bool]] = None) -> Iterator[GadgetCandidate]:
+    # each index list is already in class/method order, so emitting them by descending score
+    # gives the same ordering as a stable sort over the full scan
+    kinds = [
+        # __invoke trampoline via callable property invocation
+        ("invoke", "__invoke", 0.7, index.invoking),
+        # __toString trampoline via string context functions
+        ("toString", "__toString", 0.6, _stringifying(index)),
+        # __get heuristic: accessing undefined property names
+        ("get", "__get", 0.5, index.undefined_readers),
+    ]
+    for suffix, sink, score, refs in kinds:
+        for c, m in refs:
+            if where is not None and not where(c, m):
+                continue
+            yield GadgetCandidate(
+                name=f"{fqcn(c)}:{m.name}:{suffix}",
+                class_name=fqcn(c),
+                method=m.name,
+                sink=sink,
+                file=m.file,
+                line=m.line,
+                score=score,
+            )
+
+
+def _stringifying(index: SummaryIndex) -> List[MethodRef]:
+    # callers of a string-context function, and methods the analyzer saw putting a property in a
+    # string context (the same STRING_CONTEXT_FUNCS, echo, concatenation), in index order
+    refs = {(id(c), id(m)): (c, m) for c, m in index.callers_of_any(n for n in index.by_call if n.lower() in STRING_FUNCS)}
+    refs.update(((id(c), id(m)), (c, m)) for c, m in index.stringifying)
+    return sorted(refs.values(), key=lambda r: index.order[(id(r[0]), id(r[1]))])
+
+
+def sniff_trampolines(classes: List[ClassInfo], index: Optional[SummaryIndex] = None) -> GadgetCandidates:
+    return GadgetCandidates(items=list(iter_trampolines(index or SummaryIndex(classes))))
 
@@ -0,0 +1,120 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+from .callgraph import get_call_graph
+from .hierarchy import fqcn
+from .index import SummaryIndex
+from .models import Chains, ChainCandidate, ChainStep, ClassInfo, MagicMethodInfo
+
+
+ENTRY_METHODS = ("__wakeup", "__unserialize", "__destruct")
+TRIGGER_METHODS = ("__toString", "__get", "__call", "__invoke")
+ENTRY_BONUS = {"__wakeup": 0.5, "__unserialize": 0.5, "__destruct": 0.2}
+HOP_PENALTY = 0.15
+CALL_PENALTY = 0.05
+MAX_PUSHES = 200000
+
+
+class ChainGraph:
+    # nodes are (class, method) pairs; a node holding an object in $this->p can trigger the
+    # matching magic method of *any* class, so edges are stored per trigger kind instead of per pair.
+    # Only concrete classes become nodes, each with its effective (possibly inherited) magic
+    # methods; ordinary methods are folded into them through the call graph's sink summaries.
+    def __init__(self, classes: List[ClassInfo], index: Optional[SummaryIndex] = None):
+        index = index or SummaryIndex(classes)
+        table = index.table
+        self.calls = get_call_graph(index)
+        self.nodes: List[Tuple[ClassInfo, MagicMethodInfo]] = []
+        self.by_method: Dict[str, List[int]] = {}
+        self.out: List[List[Tuple[str, str]]] = []
+        for c in table.concrete():
+            for _, m in table.magic(c).values():
+                nid = len(self.nodes)
+                self.nodes.append((c, m))
+                self.by_method.setdefault(m.name, []).append(nid)
+                self.out.append([(t, m.triggers[t][0]) for t in TRIGGER_METHODS if m.triggers.get(t)])
+
+    def distances(self, sink: str, max_depth: int) -> List[int]:
+        # hops from each node to a method reaching the sink through ordinary calls; unreachable
+        # nodes stay at max_depth (pruned)
+        inf = max_depth
+        dist = [0 if sink in self.calls.sinks(c, m.name) else inf for c, m in self.nodes]
+        for _ in range(max_depth):
+            best = {t: min((dist[n] for n in self.by_method.get(t, [])), default=inf) for t in TRIGGER_METHODS}
+            changed = False
+            for nid, edges in enumerate(self.out):
+                for trig, _ in edges:
+                    d = best[trig] + 1
+                    if d < dist[nid]:
+                        dist[nid] = d
+                        changed = True
+            if not changed:
+                break
+        return dist
+
+    def search(self, sink: str, max_depth: int = 4, top_k: int = 20) -> List[List[Tuple[int, Optional[str]]]]:
+        if max_depth < 1 or top_k < 1:
+            return []
+        dist = self.distances(sink, max_depth)
+        # A* on chain length; ties prefer longer partial paths so complete chains surface before the
+        # frontier fans out across every implementor of a trigger
+        heap: List[Tuple[int, int, int, Tuple[Tuple[int, Optional[str]], ...]]] = []
+        seq = 0
+        for name in ENTRY_METHODS:
+            for nid in self.by_method.get(name, []):
+                if dist[nid] < max_depth:
+                    heapq.heappush(heap, (dist[nid] + 1, -1, seq, ((nid, None),)))
+                    seq += 1
+        found: List[List[Tuple[int, Optional[str]]]] = []
+        while heap and len(found) < top_k and seq < MAX_PUSHES:
+            _, _, _, path = heapq.heappop(heap)
+            nid = path[-1][0]
+            if dist[nid] == 0:
+                found.append(list(path))
+                continue
+            visited: Set[int] = {p[0] for p in path}
+            depth = len(path) + 1
+            for trig, prop in self.out[nid]:
+                note = f"{trig} via $this->{prop}"
+                for nxt in self.by_method.get(trig, []):
+                    if nxt in visited or depth + dist[nxt] > max_depth:
+                        continue
+                    heapq.heappush(heap, (depth + dist[nxt], -depth, seq, path + ((nxt, note),)))
+                    seq += 1
+        return found
+
+
+def call_steps(hops) -> List[ChainStep]:
+    # CallGraph.path() hops after the first as chain steps; a call on another object keeps the
+    # "<what> via $this->p" note form of trigger hops, calls on the same receiver are "self call"
+    steps: List[ChainStep] = []
+    for c, name, edge in hops[1:]:
+        kind, prop, _ = edge
+        note = f"call via $this->{prop}" if kind == "call" else f"{kind} call"
+        steps.append(ChainStep(class_name=fqcn(c), method=name, note=note))
+    return steps
+
+
+def build_graph_chain(classes: List[ClassInfo], sink: str, max_depth: int = 4, top_k: int = 20, index: Optional[SummaryIndex] = None) -> Chains:
+    graph = ChainGraph(classes, index)
+    items: List[ChainCandidate] = []
+    for path in graph.search(sink, max_depth, top_k):
+        steps = []
+        for nid, note in path:
+            c, m = graph.nodes[nid]
+            steps.append(ChainStep(class_name=fqcn(c), method=m.name, note=note))
+        # then the ordinary calls from the last magic method down to the one calling the sink
+        c, m = graph.nodes[path[-1][0]]
+        calls = call_steps(graph.calls.path(c, m.name, sink) or [])
+        entry = steps[0].method
+        score = 1.0 + ENTRY_BONUS.get(entry, 0.0) - HOP_PENALTY * (len(steps) - 1) - CALL_PENALTY * len(calls)
+        steps.extend(calls)
+        items.append(
+            ChainCandidate(
+                id=">".join(f"{s.class_name}:{s.method}" for s in steps) + f":{sink}",
+                steps=steps,
+                sink=sink,
+                score=round(score, 3),
+            )
+        )
+    items.sort(key=lambda x: x.score, reverse=True)
+    return Chains(items=items)
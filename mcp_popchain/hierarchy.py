@@ -0,0 +1,134 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from .models import ClassInfo, MagicMethodInfo
+
+
+MethodRef = Tuple[ClassInfo, MagicMethodInfo]
+MAGIC_METHODS = {"__wakeup", "__unserialize", "__destruct", "__toString", "__get", "__call", "__invoke"}
+_USE_HEAD_RE = re.compile(r"^\s*use\s+(?:(function|const)\s+)?", re.IGNORECASE)
+_USE_ITEM_RE = re.compile(r"^(?:(function|const)\s+)?\\?([\w\\]+?)(?:\s+as\s+(\w+))?$", re.IGNORECASE)
+
+
+def fqcn(c: ClassInfo) -> str:
+    return f"{c.namespace}\\{c.name}" if c.namespace else c.name
+
+
+def parse_use(stmt: str) -> List[Tuple[str, str]]:
+    # `use A\B, C as D;` and `use A\{B, C\D as E};` -> [(lowercased alias, FQCN)]; function and
+    # const imports are skipped
+    head = _USE_HEAD_RE.match(stmt)
+    if not head or head.group(1):
+        return []
+    body = stmt[head.end():].strip().rstrip(";").strip()
+    prefix = ""
+    if "{" in body:
+        prefix, _, body = body.partition("{")
+        body = body.rstrip("}")
+    out: List[Tuple[str, str]] = []
+    for part in body.split(","):
+        item = _USE_ITEM_RE.match(part.strip())
+        if not item or item.group(1):
+            continue
+        name = (prefix.strip() + item.group(2)).strip("\\")
+        out.append(((item.group(3) or name.rsplit("\\", 1)[-1]).lower(), name))
+    return out
+
+
+def qualify(name: str, namespace: Optional[str] = None, imports: Optional[Dict[str, str]] = None) -> str:
+    # PHP name resolution for class references: absolute, imported alias, then current namespace
+    name = name.strip()
+    if name.startswith("\\"):
+        return name[1:]
+    head, sep, rest = name.partition("\\")
+    target = (imports or {}).get(head.lower())
+    if target:
+        return target + sep + rest
+    return f"{namespace}\\{name}" if namespace else name
+
+
+class ClassTable:
+    # fully qualified class table with parent / trait links; each class is linearized once and its
+    # effective methods are memoized, so resolving an inherited magic method is a dict lookup
+    def __init__(self, classes: List[ClassInfo]):
+        self.classes = classes
+        # PHP class names are case-insensitive; the first declaration of a name wins
+        self.by_fqcn: Dict[str, ClassInfo] = {}
+        self._short: Dict[str, List[str]] = {}
+        for c in classes:
+            key = fqcn(c).lower()
+            if key not in self.by_fqcn:
+                self.by_fqcn[key] = c
+                self._short.setdefault(c.name.lower(), []).append(key)
+        self._mro: Dict[int, List[ClassInfo]] = {}
+        self._methods: Dict[int, Dict[str, MethodRef]] = {}
+        self._magic: Dict[int, Dict[str, MethodRef]] = {}
+        self._props: Dict[int, List[str]] = {}
+
+    def lookup(self, name: str, namespace: Optional[str] = None, imports: Optional[Dict[str, str]] = None) -> Optional[ClassInfo]:
+        # the resolved name first; then, for code whose imports we could not see (global classes,
+        # conditional declarations), the global name and finally a short name unique in the tree
+        name = name.strip()
+        c = self.by_fqcn.get(qualify(name, namespace, imports).lower())
+        if c is not None or name.startswith("\\"):
+            return c
+        c = self.by_fqcn.get(name.lower())
+        if c is not None:
+            return c
+        keys = self._short.get(name.rsplit("\\", 1)[-1].lower(), [])
+        return self.by_fqcn[keys[0]] if len(keys) == 1 else None
+
+    def parent_of(self, c: ClassInfo) -> Optional[ClassInfo]:
+        return self.lookup(c.parent, c.namespace, c.imports) if c.parent else None
+
+    def linearize(self, c: ClassInfo) -> List[ClassInfo]:
+        # method lookup order: the class itself, its traits (and theirs), then the parent's order
+        hit = self._mro.get(id(c))
+        if hit is not None:
+            return hit
+        # placeholder so an inheritance cycle stops here instead of recursing forever
+        self._mro[id(c)] = [c]
+        order = [c]
+        seen = {id(c)}
+        links = [self.lookup(t, c.namespace, c.imports) for t in c.traits] + [self.parent_of(c)]
+        for link in links:
+            if link is None:
+                continue
+            for x in self.linearize(link):
+                if id(x) not in seen:
+                    seen.add(id(x))
+                    order.append(x)
+        self._mro[id(c)] = order
+        return order
+
+    def methods(self, c: ClassInfo) -> Dict[str, MethodRef]:
+        # effective methods by name -> (declaring class, method); own methods override trait
+        # methods, which override inherited ones
+        hit = self._methods.get(id(c))
+        if hit is None:
+            hit = {}
+            for owner in reversed(self.linearize(c)):
+                for m in owner.methods:
+                    hit[m.name] = (owner, m)
+            self._methods[id(c)] = hit
+        return hit
+
+    def magic(self, c: ClassInfo) -> Dict[str, MethodRef]:
+        # the effective magic methods only: the entry points and triggers chains are built from
+        hit = self._magic.get(id(c))
+        if hit is None:
+            hit = self._magic[id(c)] = {k: v for k, v in self.methods(c).items() if k in MAGIC_METHODS}
+        return hit
+
+    def resolve(self, c: ClassInfo, method: str) -> Optional[MethodRef]:
+        return self.methods(c).get(method)
+
+    def properties(self, c: ClassInfo) -> List[str]:
+        hit = self._props.get(id(c))
+        if hit is None:
+            hit = list(dict.fromkeys(p for owner in self.linearize(c) for p in owner.properties))
+            self._props[id(c)] = hit
+        return hit
+
+    def concrete(self) -> List[ClassInfo]:
+        # traits and interfaces cannot be instantiated, so they never start a chain
+        return [c for c in self.classes if c.kind == "class"]
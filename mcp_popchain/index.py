@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, List, Tuple
+from .hierarchy import ClassTable, MethodRef
+from .models import AnalysisSummary, ClassInfo
+
+
+class SummaryIndex:
+    # inverted indexes built in one pass; every list keeps class/method order so query results
+    # come out in the same order as the nested scans they replace. Refs pair a concrete class with
+    # its *effective* magic methods, so a subclass inheriting a parent's __destruct is indexed too.
+    def __init__(self, classes: List[ClassInfo]):
+        self.classes = classes
+        self.table = ClassTable(classes)
+        self.order: Dict[Tuple[int, int], int] = {}
+        self.by_sink: Dict[str, List[MethodRef]] = {}
+        self.by_call: Dict[str, List[MethodRef]] = {}
+        self.by_magic: Dict[str, List[MethodRef]] = {}
+        self.magic_classes: Dict[str, List[int]] = {}
+        self.prop_readers: Dict[str, List[MethodRef]] = {}
+        self.prop_invokers: Dict[str, List[MethodRef]] = {}
+        self.invoking: List[MethodRef] = []
+        # methods putting a property in a string context (a __toString trigger)
+        self.stringifying: List[MethodRef] = []
+        self.undefined_readers: List[MethodRef] = []
+        for ci, c in enumerate(classes):
+            if c.kind != "class":
+                continue
+            props = set(self.table.properties(c))
+            for _, m in self.table.magic(c).values():
+                ref = (c, m)
+                self.order[(id(c), id(m))] = len(self.order)
+                self.by_magic.setdefault(m.name, []).append(ref)
+                self.magic_classes.setdefault(m.name, []).append(ci)
+                for s in dict.fromkeys(x.name for x in m.sinks):
+                    self.by_sink.setdefault(s, []).append(ref)
+                for fn in dict.fromkeys(m.calls):
+                    self.by_call.setdefault(fn, []).append(ref)
+                for p in m.uses_properties:
+                    self.prop_readers.setdefault(p, []).append(ref)
+                for p in m.invokes_properties:
+                    self.prop_invokers.setdefault(p, []).append(ref)
+                if m.invokes_properties:
+                    self.invoking.append(ref)
+                if m.triggers.get("__toString"):
+                    self.stringifying.append(ref)
+                if any(p not in props for p in m.uses_properties):
+                    self.undefined_readers.append(ref)
+
+    def callers_of_any(self, names: Iterable[str]) -> List[MethodRef]:
+        refs = {(id(r[0]), id(r[1])): r for n in names for r in self.by_call.get(n, [])}
+        return sorted(refs.values(), key=lambda r: self.order[(id(r[0]), id(r[1]))])
+
+    def classes_with_any(self, magic: Iterable[str]) -> List[ClassInfo]:
+        pos = {ci for name in magic for ci in self.magic_classes.get(name, [])}
+        return [self.classes[ci] for ci in sorted(pos)]
+
+
+def get_index(summary: AnalysisSummary) -> SummaryIndex:
+    idx = summary._index
+    if idx is None or idx.classes is not summary.classes:
+        if summary._loader is not None:
+            # a lazy summary first loads the vendor classes gadget queries can reach
+            from .analyzer import expand_lazy
+
+            expand_lazy(summary)
+        idx = SummaryIndex(summary.classes)
+        summary._index = idx
+    return idx
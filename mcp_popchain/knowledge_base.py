@@ -1,42 +1,103 @@
-from typing import List
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
 from .models import KBItem, KBMatches, AnalysisSummary
+from .semver import Interval, overlaps, parse_constraint, parse_version
 
 
-KB: List[KBItem] = [
-    KBItem(framework="Laravel", version=None, name="MonologHandler", sink="system"),
-    KBItem(framework="Symfony", version=None, name="YamlParse", sink="eval"),
-    KBItem(framework="ThinkPHP", version=None, name="LogGadget", sink="file_put_contents"),
-]
+DB_FORMAT = 1
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "data", "gadgets.json")
 
-PKG_MAP = {
-    "laravel/framework": "Laravel",
-    "symfony/yaml": "Symfony",
-    "topthink/framework": "ThinkPHP",
-}
+
+class GadgetDB:
+    # gadget signatures with their version constraints compiled once at load time; matching a
+    # package list is one dict lookup per package plus interval checks against its signatures
+    def __init__(self, items: Iterable[KBItem] = ()):
+        self.items: List[KBItem] = []
+        self.by_package: Dict[str, List[Tuple[Optional[Tuple[Interval, ...]], KBItem]]] = {}
+        self.revisions: List[str] = []
+        self.extend(items)
+
+    def extend(self, items: Iterable[KBItem]) -> None:
+        for it in items:
+            self.items.append(it)
+            if it.package:
+                ranges = parse_constraint(it.versions) if it.versions else None
+                self.by_package.setdefault(it.package.lower(), []).append((ranges, it))
+
+    def load(self, path: str) -> None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        fmt = data.get("format")
+        if fmt != DB_FORMAT:
+            raise ValueError(f"{path}: unsupported gadget db format {fmt!r}, expected {DB_FORMAT}")
+        self.revisions.append(str(data.get("revision", "")))
+        self.extend(
+            KBItem(
+                framework=g.get("framework") or g["package"],
+                name=g["id"],
+                sink=g["sink"],
+                note=g.get("note"),
+                package=g.get("package"),
+                versions=g.get("versions"),
+                entry_class=g.get("entry_class"),
+                trigger=g.get("trigger"),
+                properties=g.get("properties") or {},
+                fingerprints=g.get("fingerprints") or [],
+            )
+            for g in data.get("gadgets", [])
+        )
+
+    def search(self, keyword: str, version: Optional[str] = None) -> List[KBItem]:
+        kw = keyword.lower()
+        wanted = parse_constraint(version) if version else None
+        out = []
+        for it in self.items:
+            if kw not in it.framework.lower() and kw not in it.name.lower() and kw not in (it.package or "").lower():
+                continue
+            if version is None or overlaps(wanted, parse_constraint(it.versions) if it.versions else None):
+                out.append(it)
+        return out
+
+    def match(self, packages: Iterable[Tuple[str, Optional[str]]]) -> List[KBItem]:
+        # packages are (name, installed version or composer constraint); an installed version
+        # (vendor/composer/installed.json) beats the composer.json constraint for the same package,
+        # unknown versions match everything
+        versions: Dict[str, List[Optional[str]]] = {}
+        for name, version in packages:
+            if name.lower() in self.by_package:
+                versions.setdefault(name.lower(), []).append(version)
+        out: List[KBItem] = []
+        for name, vs in versions.items():
+            exact = [v for v in vs if v and parse_version(v)]
+            seen = set()
+            for version in exact or vs:
+                have = parse_constraint(version) if version else None
+                for ranges, it in self.by_package[name]:
+                    if id(it) not in seen and overlaps(have, ranges):
+                        seen.add(id(it))
+                        out.append(it.model_copy(update={"version": version}))
+        return out
+
+
+_DB: Optional[GadgetDB] = None
+
+
+def get_gadget_db() -> GadgetDB:
+    # the bundled database plus any extra files listed in POPCHAIN_GADGET_DB (os.pathsep separated)
+    global _DB
+    if _DB is None:
+        db = GadgetDB()
+        db.load(DEFAULT_DB)
+        for path in filter(None, os.environ.get("POPCHAIN_GADGET_DB", "").split(os.pathsep)):
+            db.load(path)
+        _DB = db
+    return _DB
 
 
 def kb_search(keyword: str, version: str | None) -> KBMatches:
-    items = []
-    for it in KB:
-        if keyword.lower() in it.framework.lower() or keyword.lower() in it.name.lower():
-            if version is None or it.version == version:
-                items.append(it)
-    return KBMatches(items=items)
+    return KBMatches(items=get_gadget_db().search(keyword, version))
 
 
 def kb_match_by_packages(summary: AnalysisSummary) -> KBMatches:
-    items = []
-    seen = set()
-    for p in summary.packages:
-        fw = PKG_MAP.get(p.name)
-        if not fw:
-            continue
-        for it in KB:
-            if it.framework == fw:
-                key = (it.framework, it.name, it.version)
-                if key in seen:
-                    continue
-                if it.version is None or p.version == it.version:
-                    items.append(it)
-                    seen.add(key)
-    return KBMatches(items=items)
+    return KBMatches(items=get_gadget_db().match((p.name, p.version) for p in summary.packages))
@@ -1,11 +1,18 @@
-from typing import Any, Dict, List, Optional
-from pydantic import BaseModel
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from pydantic import BaseModel, PrivateAttr
+
+if TYPE_CHECKING:
+    from .compact import ClassView, SinkView
 
 
 class SinkInfo(BaseModel):
     name: str
     file: str
     line: int
+    # per argument: the $this properties / method parameter indices whose value reaches it
+    # (None when the call was not analyzed)
+    args: Optional[List[List[str]]] = None
+    params: Optional[List[List[int]]] = None
 
 
 class MagicMethodInfo(BaseModel):
@@ -16,6 +23,10 @@ class MagicMethodInfo(BaseModel):
     calls: List[str]
     uses_properties: List[str] = []
     invokes_properties: List[str] = []
+    triggers: Dict[str, List[str]] = {}
+    static_calls: List[str] = []
+    self_calls: List[str] = []
+    property_calls: Dict[str, List[str]] = {}
 
 
 class ClassInfo(BaseModel):
@@ -23,6 +34,12 @@ class ClassInfo(BaseModel):
     file: str
     methods: List[MagicMethodInfo]
     properties: List[str]
+    kind: str = "class"
+    namespace: Optional[str] = None
+    parent: Optional[str] = None
+    interfaces: List[str] = []
+    traits: List[str] = []
+    imports: Dict[str, str] = {}
 
 
 class ComposerPackage(BaseModel):
@@ -31,10 +48,37 @@ class ComposerPackage(BaseModel):
 
 
 class AnalysisSummary(BaseModel):
-    classes: List[ClassInfo]
-    sinks: List[SinkInfo]
+    # classes / sinks are compact.ClassView / SinkView rows for analyzer output, snapshots and
+    # merged summaries, and pydantic models for a summary a client sends inline; a view validates
+    # and serializes as the model it stands for
+    classes: List[Union[ClassInfo, "ClassView"]]
+    sinks: List[Union[SinkInfo, "SinkView"]]
     files_scanned: int
     packages: List[ComposerPackage] = []
+    _index: Any = PrivateAttr(default=None)
+    _loader: Any = PrivateAttr(default=None)
+    # the compact.ClassStore that classes added later (lazy loads) are copied into, when the
+    # summary has one of its own
+    _store: Any = PrivateAttr(default=None)
+
+
+class SummaryHandle(BaseModel):
+    summary_id: str
+    files_scanned: int
+    classes: int
+    sinks: int
+    packages: int
+
+
+class SnapshotInfo(BaseModel):
+    path: str
+    size: int
+    analyzer: str
+    compressed: bool
+    classes: int
+    methods: int
+    sinks: int
+    files_scanned: int
 
 
 class ConstraintInput(BaseModel):
@@ -56,6 +100,9 @@ class GadgetCandidate(BaseModel):
 
 class GadgetCandidates(BaseModel):
     items: List[GadgetCandidate]
+    # set by paginated tool calls: matches across all pages, cursor of the next page
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
 
 
 class SourceSpec(BaseModel):
@@ -82,6 +129,14 @@ class ChainCandidate(BaseModel):
 
 class Chains(BaseModel):
     items: List[ChainCandidate]
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class MagicMethodPage(BaseModel):
+    items: List[MagicMethodInfo]
+    total: int
+    next_cursor: Optional[str] = None
 
 
 class PayloadSpec(BaseModel):
@@ -94,6 +149,14 @@ class PayloadResult(BaseModel):
     structure: Dict[str, Any]
 
 
+class PayloadValidation(BaseModel):
+    valid: bool
+    size: int
+    error: Optional[str] = None
+    offset: Optional[int] = None
+    structure: Optional[Any] = None
+
+
 class SimulationEvent(BaseModel):
     step: str
     detail: str
@@ -102,6 +165,21 @@ class SimulationEvent(BaseModel):
 class SimulationReport(BaseModel):
     events: List[SimulationEvent]
     reached_sink: bool
+    sink: Optional[str] = None
+    path: List[str] = []
+    steps: int = 0
+    truncated: bool = False
+
+
+class VerifiedChain(BaseModel):
+    chain: ChainCandidate
+    payload: str
+    structure: Any
+    report: SimulationReport
+
+
+class VerifiedChains(BaseModel):
+    items: List[VerifiedChain]
 
 
 class EnvHints(BaseModel):
@@ -126,7 +204,30 @@ class KBItem(BaseModel):
     name: str
     sink: str
     note: Optional[str] = None
+    package: Optional[str] = None
+    versions: Optional[str] = None
+    entry_class: Optional[str] = None
+    trigger: Optional[str] = None
+    properties: Dict[str, Any] = {}
+    fingerprints: List[Dict[str, Any]] = []
 
 
 class KBMatches(BaseModel):
     items: List[KBItem]
+
+
+class FingerprintMatch(BaseModel):
+    name: str
+    framework: str
+    package: Optional[str] = None
+    sink: str
+    score: float
+    classes: List[str]
+
+
+class FingerprintMatches(BaseModel):
+    items: List[FingerprintMatch]
+
+
+# AnalysisSummary is completed by compact.py once the view types exist
+from . import compact as _compact  # noqa: E402,F401
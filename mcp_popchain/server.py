@@ -1,13 +1,16 @@
+import os
+from operator import itemgetter
 from typing import List, Dict, Any
 from mcp.server.fastmcp import FastMCP, Context
 from mcp.server.session import ServerSession
 from .models import (
     AnalysisSummary,
-    MagicMethodInfo,
+    GadgetCandidate,
     GadgetCandidates,
     Chains,
     PayloadSpec,
     PayloadResult,
+    PayloadValidation,
     SimulationReport,
     EnvHints,
     ConstraintIssue,
@@ -16,56 +19,199 @@ from .models import (
     SinkSpec,
     SourceSpec,
     ClassInfo,
+    SummaryHandle,
+    SnapshotInfo,
+    MagicMethodPage,
+    FingerprintMatches,
+    VerifiedChain,
+    VerifiedChains,
 )
-from .analyzer import analyze_php_repo, find_classes_ast, find_classes, PHPFile
-from .gadgets import sniff_trampolines
-from .solver import build_chain as build_chain_impl, build_trampoline_chain as build_trampoline_chain_impl
-from .payload import php_serialize_object, generate_payload_script
+from .analyzer import analyze_php_repo, find_classes_ast, find_classes, load_classes, PHPFile
+from .gadgets import iter_trampolines
+from .graph import build_graph_chain
+from .pipeline import verify_chains_all
+from .fingerprint import fingerprint_gadgets
+from .solver import chain_candidate, score_chains, build_trampoline_chain as build_trampoline_chain_impl
+from .payload import php_serialize_object, generate_payload_script, iter_payloads_ndjson, decode_payload, to_spec
+from .unserialize import UnserializeError, php_unserialize
 from .simulator import simulate_unserialize as simulate_impl
 from .knowledge_base import kb_search as kb_search_impl, kb_match_by_packages as kb_match_by_packages_impl
+from .store import SUMMARIES, resolve_summary, summary_key
+from .snapshot import save_snapshot, load_snapshot, merge_summaries
+from .index import get_index
+from .callgraph import get_call_graph
+from .compact import to_model
+from .paging import ResultFilter, page
+from .hierarchy import MAGIC_METHODS, fqcn
+from .executor import HEAVY, heavy, notify
 
 
 mcp = FastMCP("CTFPopChain")
 
 
 @mcp.tool()
-def analyze_php_repo_tool(rootPath: str, includes: List[str] | None = None) -> AnalysisSummary:
+@heavy
+def analyze_php_repo_tool(
+    rootPath: str,
+    includes: List[str] | None = None,
+    workers: int = 0,
+    cacheDir: str | None = None,
+    maxFileSize: int | None = None,
+    skipMinified: bool = False,
+    returnHandle: bool = False,
+    lazy: bool = False,
+) -> AnalysisSummary | SummaryHandle:
     inc = includes or []
-    return analyze_php_repo(rootPath, inc)
+    summary = analyze_php_repo(
+        rootPath, inc, workers=workers, cache_dir=cacheDir, max_file_size=maxFileSize, skip_minified=skipMinified, lazy=lazy
+    )
+    if not returnHandle:
+        return summary
+    return _handle(SUMMARIES.put(summary), summary)
+
+
+def _handle(summary_id: str, summary: AnalysisSummary) -> SummaryHandle:
+    return SummaryHandle(
+        summary_id=summary_id,
+        files_scanned=summary.files_scanned,
+        classes=len(summary.classes),
+        sinks=len(summary.sinks),
+        packages=len(summary.packages),
+    )
+
+
+@mcp.tool()
+@heavy
+def load_classes_tool(classNames: List[str], summaryId: str) -> SummaryHandle:
+    # classNames: FQCNs or namespace prefixes ending in "\\"; only for summaries analyzed with lazy=True
+    summary = resolve_summary(None, summaryId)
+    load_classes(summary, classNames)
+    return _handle(summaryId, summary)
+
+
+@mcp.tool()
+def release_summary_tool(summaryId: str) -> bool:
+    return SUMMARIES.drop(summaryId)
 
 
 @mcp.tool()
-def list_magic_methods_tool(summary: AnalysisSummary) -> List[MagicMethodInfo]:
-    items: List[MagicMethodInfo] = []
-    for c in summary.classes:
-        items.extend(c.methods)
-    return items
+@heavy
+def save_snapshot_tool(path: str, summary: AnalysisSummary | None = None, summaryId: str | None = None, compress: bool = True) -> SnapshotInfo:
+    return save_snapshot(resolve_summary(summary, summaryId), path, compress=compress)
 
 
 @mcp.tool()
-def find_gadgets_tool(summary: AnalysisSummary, targetSink: str) -> GadgetCandidates:
-    items = []
-    for c in summary.classes:
-        for m in c.methods:
-            if targetSink in m.calls:
-                score = 1.0
-                items.append(
-                    {
-                        "name": f"{c.name}:{m.name}",
-                        "class_name": c.name,
-                        "method": m.name,
-                        "sink": targetSink,
-                        "file": c.file,
-                        "line": m.line,
-                        "score": score,
-                    }
-                )
-    return GadgetCandidates(items=items)
+@heavy
+def load_snapshot_tool(
+    snapshots: List[str],
+    rootPath: str | None = None,
+    includes: List[str] | None = None,
+    workers: int = 0,
+    cacheDir: str | None = None,
+    skipVendor: bool = True,
+) -> SummaryHandle:
+    # snapshots are merged in order; rootPath, when given, is scanned (without vendor/ unless
+    # skipVendor=False) and merged last, so its files override the same files in the snapshots
+    parts = [load_snapshot(p) for p in snapshots]
+    if rootPath:
+        exclude = [os.path.join(rootPath, "vendor")] if skipVendor else []
+        parts.append(analyze_php_repo(rootPath, includes or [], workers=workers, cache_dir=cacheDir, exclude_dirs=exclude))
+    summary = merge_summaries(parts)
+    return _handle(SUMMARIES.put(summary), summary)
 
 
 @mcp.tool()
-def build_chain_tool(summary: AnalysisSummary, sources: SourceSpec, sink: SinkSpec) -> Chains:
-    return build_chain_impl(summary.classes, sources, sink)
+def list_magic_methods_tool(
+    summary: AnalysisSummary | None = None,
+    summaryId: str | None = None,
+    magic: List[str] | None = None,
+    sink: str | None = None,
+    pathPrefix: str | None = None,
+    namespace: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> MagicMethodPage:
+    # without limit every match comes back as one page; otherwise pass next_cursor to continue
+    key = summary_key(summary, summaryId)
+    summary = resolve_summary(summary, summaryId)
+    f = ResultFilter(magic=magic, sink=sink, path_prefix=pathPrefix, namespace=namespace)
+    refs = (m for c in summary.classes for m in c.methods if m.name in MAGIC_METHODS and f.ref(c, m))
+    items, total, nxt = page(refs, limit, cursor, query=["magic", key, f.query()])
+    return MagicMethodPage(items=[to_model(m) for m in items], total=total, next_cursor=nxt)
+
+
+@mcp.tool()
+@heavy
+def find_gadgets_tool(
+    summary: AnalysisSummary | None = None,
+    targetSink: str = ...,
+    summaryId: str | None = None,
+    magic: List[str] | None = None,
+    minScore: float | None = None,
+    pathPrefix: str | None = None,
+    namespace: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> GadgetCandidates:
+    # the original (summary, targetSink) order is kept; targetSink defaults to ..., which the MCP
+    # schema renders as required
+    key = summary_key(summary, summaryId)
+    summary = resolve_summary(summary, summaryId)
+    index = get_index(summary)
+    f = ResultFilter(magic=magic, min_score=minScore, path_prefix=pathPrefix, namespace=namespace)
+    direct = {(id(c), id(m)) for c, m in index.by_call.get(targetSink, [])}
+
+    def candidates():
+        # magic methods calling the sink themselves, or reaching it through ordinary method calls
+        for c, m in get_call_graph(index).reaching(targetSink) or index.by_call.get(targetSink, []):
+            if not f.ref(c, m):
+                continue
+            yield GadgetCandidate(
+                name=f"{fqcn(c)}:{m.name}",
+                class_name=fqcn(c),
+                method=m.name,
+                sink=targetSink,
+                file=m.file,
+                line=m.line,
+                score=1.0 if (id(c), id(m)) in direct else 0.8,
+            )
+
+    items, total, nxt = page(
+        candidates(), limit, cursor, query=["gadgets", key, targetSink, f.query()], score=lambda x: x.score, min_score=minScore
+    )
+    return GadgetCandidates(items=items, total=total, next_cursor=nxt)
+
+
+@mcp.tool()
+@heavy
+def build_chain_tool(
+    summary: AnalysisSummary | None = None,
+    sources: SourceSpec = ...,
+    sink: SinkSpec = ...,
+    summaryId: str | None = None,
+    magic: List[str] | None = None,
+    minScore: float | None = None,
+    pathPrefix: str | None = None,
+    namespace: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Chains:
+    # limit=20 gives the 20 best chains; filters on the entry method / its class apply before the
+    # call paths are searched. sources and sink default to ..., i.e. required, after the optional
+    # summary
+    key = summary_key(summary, summaryId)
+    summary = resolve_summary(summary, summaryId)
+    f = ResultFilter(magic=magic, min_score=minScore, path_prefix=pathPrefix, namespace=namespace)
+    scored, total, nxt = page(
+        score_chains(get_index(summary), sink, where=f.ref),
+        limit,
+        cursor,
+        query=["chains", key, sink.name, f.query()],
+        score=itemgetter(0),
+        min_score=minScore,
+    )
+    # models only for the page
+    return Chains(items=[chain_candidate(x, sink) for x in scored], total=total, next_cursor=nxt)
 
 
 @mcp.tool()
@@ -75,8 +221,43 @@ def generate_payload_tool(className: str, properties: Dict[str, Any]) -> Payload
 
 
 @mcp.tool()
-def simulate_unserialize_tool(spec: PayloadSpec) -> SimulationReport:
-    return simulate_impl(spec)
+@heavy
+def generate_payload_batch_tool(
+    className: str,
+    properties: Dict[str, Any],
+    variants: Dict[str, List[Any]],
+    encoding: str | None = None,
+    offset: int = 0,
+    limit: int = 1000,
+) -> str:
+    # NDJSON, one payload per line; page through large matrices with offset / limit
+    return "".join(iter_payloads_ndjson(className, properties, variants, encoding, offset, limit))
+
+
+@mcp.tool()
+@heavy
+def parse_payload_tool(serialized: str, encoding: str | None = None) -> PayloadValidation:
+    data = decode_payload(serialized, encoding)
+    try:
+        value = php_unserialize(data)
+    except UnserializeError as e:
+        return PayloadValidation(valid=False, size=len(data), error=str(e), offset=e.offset)
+    return PayloadValidation(valid=True, size=len(data), structure=to_spec(value))
+
+
+@mcp.tool()
+@heavy
+def simulate_unserialize_tool(
+    spec: PayloadSpec | None = None,
+    serialized: str | None = None,
+    encoding: str | None = None,
+    summary: AnalysisSummary | None = None,
+    summaryId: str | None = None,
+    sink: str | None = None,
+    maxSteps: int = 2000,
+) -> SimulationReport:
+    index = get_index(resolve_summary(summary, summaryId)) if summary is not None or summaryId else None
+    return simulate_impl(spec, index=index, serialized=serialized, encoding=encoding, sink=sink, max_steps=maxSteps)
 
 
 @mcp.tool()
@@ -108,28 +289,93 @@ def run():
     mcp.run()
 
 
-def run_http():
+def run_http(workers: int | None = None, queue: int | None = None, per_client: int | None = None):
+    if workers or queue is not None or per_client:
+        HEAVY.configure(workers, queue, per_client)
     mcp.run(transport="streamable-http")
 
 
 if __name__ == "__main__":
     run()
 @mcp.tool()
-def kb_match_by_packages_tool(summary: AnalysisSummary) -> KBMatches:
-    return kb_match_by_packages_impl(summary)
+def kb_match_by_packages_tool(summary: AnalysisSummary | None = None, summaryId: str | None = None) -> KBMatches:
+    return kb_match_by_packages_impl(resolve_summary(summary, summaryId))
 @mcp.tool()
 def parse_code_structure_tool(code: str) -> List[ClassInfo]:
     f = PHPFile(path="snippet.php", text=code)
     cs = find_classes_ast(f)
     if not cs:
         cs = find_classes(f)
-    return cs
+    return [to_model(c) for c in cs]
 @mcp.tool()
-def sniff_trampolines_tool(summary: AnalysisSummary) -> GadgetCandidates:
-    return sniff_trampolines(summary.classes)
+@heavy
+def sniff_trampolines_tool(
+    summary: AnalysisSummary | None = None,
+    summaryId: str | None = None,
+    magic: List[str] | None = None,
+    sink: str | None = None,
+    minScore: float | None = None,
+    pathPrefix: str | None = None,
+    namespace: str | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> GadgetCandidates:
+    key = summary_key(summary, summaryId)
+    summary = resolve_summary(summary, summaryId)
+    f = ResultFilter(magic=magic, sink=sink, min_score=minScore, path_prefix=pathPrefix, namespace=namespace)
+    items, total, nxt = page(iter_trampolines(get_index(summary), where=f.ref), limit, cursor, query=["trampolines", key, f.query()], score=lambda x: x.score, min_score=minScore)
+    return GadgetCandidates(items=items, total=total, next_cursor=nxt)
 @mcp.tool()
 def generate_payload_script_tool(className: str, properties: Dict[str, Any]) -> str:
     return generate_payload_script(className, properties)
 @mcp.tool()
-def build_trampoline_chain_tool(summary: AnalysisSummary) -> Chains:
-    return build_trampoline_chain_impl(summary.classes)
+@heavy
+def build_trampoline_chain_tool(summary: AnalysisSummary | None = None, summaryId: str | None = None) -> Chains:
+    summary = resolve_summary(summary, summaryId)
+    return build_trampoline_chain_impl(summary.classes, index=get_index(summary))
+@mcp.tool()
+@heavy
+def build_graph_chain_tool(sink: SinkSpec, summary: AnalysisSummary | None = None, summaryId: str | None = None, maxDepth: int = 4, topK: int = 20) -> Chains:
+    summary = resolve_summary(summary, summaryId)
+    return build_graph_chain(summary.classes, sink.name, max_depth=maxDepth, top_k=topK, index=get_index(summary))
+@mcp.tool()
+@heavy
+def fingerprint_gadgets_tool(summary: AnalysisSummary | None = None, summaryId: str | None = None) -> FingerprintMatches:
+    summary = resolve_summary(summary, summaryId)
+    return fingerprint_gadgets(summary.classes, index=get_index(summary))
+@mcp.tool()
+@heavy
+def verify_chains_tool(
+    sink: SinkSpec,
+    summary: AnalysisSummary | None = None,
+    summaryId: str | None = None,
+    maxDepth: int = 4,
+    topK: int = 50,
+    command: str = "id",
+    encoding: str | None = None,
+    maxSteps: int = 2000,
+    limit: int | None = None,
+    workers: int = 0,
+    ctx: Context | None = None,
+) -> VerifiedChains:
+    # each confirmed chain is also sent right away as an "info" log notification (the VerifiedChain
+    # as JSON, logger "popchain.verify_chains"), so clients can use hits before the search ends
+    summary = resolve_summary(summary, summaryId)
+
+    def stream(hit: VerifiedChain) -> None:
+        if ctx is not None:
+            notify(ctx.log("info", hit.model_dump_json(), logger_name="popchain.verify_chains"))
+
+    return verify_chains_all(
+        summary.classes,
+        sink.name,
+        index=get_index(summary),
+        limit=limit,
+        on_hit=stream,
+        max_depth=maxDepth,
+        top_k=topK,
+        command=command,
+        encoding=encoding,
+        max_steps=maxSteps,
+        workers=workers,
+    )
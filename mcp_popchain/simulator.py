@@ -1,9 +1,215 @@
-from .models import PayloadSpec, SimulationEvent, SimulationReport
+import weakref
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .analyzer import SINKS
+from .hierarchy import MethodRef, fqcn
+from .index import SummaryIndex
+from .models import ClassInfo, MagicMethodInfo, PayloadSpec, SimulationEvent, SimulationReport
+from .payload import PHPObject, PHPRef, decode_payload, from_spec
+from .taint import sink_controlled
+from .unserialize import php_unserialize
 
 
-def simulate_unserialize(spec: PayloadSpec) -> SimulationReport:
-    events = []
-    events.append(SimulationEvent(step="unserialize", detail=spec.class_name))
-    events.append(SimulationEvent(step="__wakeup", detail=spec.class_name))
-    events.append(SimulationEvent(step="__destruct", detail=spec.class_name))
-    return SimulationReport(events=events, reached_sink=False)
+DEFAULT_MAX_STEPS = 2000
+_SINK_NAMES = {s.lower(): s for s in SINKS}
+# (kind, property, method): "self" $this->m(), "call" $this->p->m(), "magic" a magic method of the
+# object in $this->p, "invoke" ($this->p)() / call_user_func($this->p), "scoped" self::m() /
+# parent::m() / static::m() on the same object (the scope keyword in place of the property)
+Edge = Tuple[str, Optional[str], Optional[str]]
+Effects = Tuple[Tuple[str, ...], Tuple[Edge, ...]]
+
+
+def load_payload(spec: Optional[PayloadSpec] = None, serialized: Optional[str] = None, encoding: Optional[str] = None) -> Any:
+    if serialized is not None:
+        return php_unserialize(decode_payload(serialized, encoding))
+    if spec is None:
+        raise ValueError("either a payload spec or a serialized payload is required")
+    return PHPObject(spec.class_name, from_spec(spec.properties))
+
+
+def _bare(key: Any) -> str:
+    # "\0*\0name", "\0Class\0name", "protected:name" and "private:Class:name" -> "name"
+    key = str(key)
+    if key.startswith("\0"):
+        return key.rsplit("\0", 1)[-1]
+    vis, sep, rest = key.partition(":")
+    return rest.rsplit(":", 1)[-1] if sep and vis in ("protected", "private") else key
+
+
+def _deref(v: Any) -> Any:
+    return v.target if isinstance(v, PHPRef) else v
+
+
+class Simulator:
+    # abstract interpretation of unserialize() over the analyzed classes: objects in the payload
+    # are concrete, everything a method does is taken from its (memoized) effect summary, so a run
+    # costs one step per (object, method) pair actually reached
+    def __init__(self, index: SummaryIndex):
+        self.index = index
+        self.table = index.table
+        self._effects: Dict[int, Effects] = {}
+
+    def effects(self, m: MagicMethodInfo) -> Effects:
+        hit = self._effects.get(id(m))
+        if hit is None:
+            edges: List[Edge] = [("self", None, name) for name in dict.fromkeys(m.self_calls)]
+            for call in dict.fromkeys(m.static_calls):
+                scope, _, name = call.rpartition("::")
+                if scope.lower() in ("self", "parent", "static"):
+                    edges.append(("scoped", scope.lower(), name))
+            for prop, names in m.property_calls.items():
+                edges.extend(("call", prop, name) for name in dict.fromkeys(names))
+            for magic in ("__toString", "__get", "__call"):
+                for prop in m.triggers.get(magic, []):
+                    if magic != "__call" or prop not in m.property_calls:
+                        edges.append(("magic", prop, magic))
+            edges.extend(("invoke", prop, None) for prop in dict.fromkeys(m.invokes_properties))
+            # a sink whose arguments are all constants cannot be steered by the payload
+            sinks = tuple(dict.fromkeys(s.name for s in m.sinks if sink_controlled(s)))
+            hit = self._effects[id(m)] = (sinks, tuple(edges))
+        return hit
+
+    def _class(self, obj: Any) -> Optional[ClassInfo]:
+        return self.table.lookup("\\" + obj.class_name.lstrip("\\")) if isinstance(obj, PHPObject) else None
+
+    def _dispatch(self, obj: Any, name: str) -> Optional[Tuple[MethodRef, str]]:
+        # the method itself, or __call when the class does not declare it
+        c = self._class(obj)
+        if c is None:
+            return None
+        ref = self.table.resolve(c, name)
+        if ref is not None:
+            return ref, name
+        if not name.startswith("__"):
+            ref = self.table.resolve(c, "__call")
+            if ref is not None:
+                return ref, f"__call({name})"
+        return None
+
+    def run(self, root: Any, sink: Optional[str] = None, max_steps: int = DEFAULT_MAX_STEPS) -> SimulationReport:
+        wanted = sink.lower() if sink else None
+        events = [SimulationEvent(step="unserialize", detail=root.class_name if isinstance(root, PHPObject) else type(root).__name__)]
+        objects = _objects(root)
+        for obj in objects:
+            if self._class(obj) is None:
+                events.append(SimulationEvent(step="unknown_class", detail=obj.class_name))
+        # PHP calls __unserialize (or else __wakeup) on every object once parsing is done, and
+        # __destruct when the payload goes out of scope
+        entries: List[Tuple[Any, str]] = []
+        for obj in objects:
+            entries.append((obj, "__unserialize" if self._dispatch(obj, "__unserialize") else "__wakeup"))
+        entries.extend((obj, "__destruct") for obj in objects)
+        visited: Set[Tuple[int, int]] = set()
+        props: Dict[int, Dict[str, Any]] = {}
+        steps = 0
+        for entry, magic in entries:
+            hit = self._dispatch(entry, magic)
+            if hit is None:
+                # without class info PHP still runs the entry points; report them as before, with
+                # nothing to follow (a known class without the method has no such event)
+                if isinstance(entry, PHPObject) and self._class(entry) is None:
+                    events.append(SimulationEvent(step=magic, detail=entry.class_name))
+                continue
+            stack: List[Tuple[Any, MethodRef, str, Tuple[str, ...]]] = [(entry, hit[0], magic, ())]
+            while stack:
+                obj, (owner, m), via, path = stack.pop()
+                key = (id(obj), id(m))
+                if key in visited:
+                    continue
+                visited.add(key)
+                steps += 1
+                if steps > max_steps:
+                    events.append(SimulationEvent(step="budget", detail=f"stopped after {max_steps} steps"))
+                    return SimulationReport(events=events, reached_sink=False, steps=max_steps, truncated=True)
+                here = f"{obj.class_name}::{m.name}"
+                path = path + (here,)
+                events.append(SimulationEvent(step=m.name, detail=f"{here} via {via}" if via != m.name else here))
+                sinks, edges = self.effects(m)
+                for s in sinks:
+                    if wanted is None or s.lower() == wanted:
+                        events.append(SimulationEvent(step="sink", detail=f"{s} in {fqcn(owner)}::{m.name}"))
+                        return SimulationReport(events=events, reached_sink=True, sink=s, path=list(path), steps=steps)
+                values = props.get(id(obj))
+                if values is None:
+                    values = props[id(obj)] = {_bare(k): _deref(v) for k, v in obj.properties.items()}
+                nxt: List[Tuple[Any, MethodRef, str, Tuple[str, ...]]] = []
+                for kind, prop, name in edges:
+                    if kind == "scoped":
+                        base = self._class(obj) if prop == "static" else (self.table.parent_of(owner) if prop == "parent" else owner)
+                        ref = self.table.resolve(base, name) if base is not None else None
+                        if ref is not None:
+                            nxt.append((obj, ref, f"{prop}::{name}()", path))
+                        continue
+                    target = obj if kind == "self" else values.get(prop)
+                    if kind == "invoke":
+                        if isinstance(target, str):
+                            s = _SINK_NAMES.get(target.lstrip("\\").lower())
+                            if s is not None and (wanted is None or s.lower() == wanted):
+                                events.append(SimulationEvent(step="sink", detail=f"{s} via $this->{prop} in {here}"))
+                                return SimulationReport(events=events, reached_sink=True, sink=s, path=list(path), steps=steps)
+                            continue
+                        if isinstance(target, (dict, list)) and len(target) == 2:
+                            pair = list(target.values()) if isinstance(target, dict) else target
+                            callee, method = _deref(pair[0]), _deref(pair[1])
+                            hit = self._dispatch(callee, method) if isinstance(method, str) else None
+                            if hit is not None:
+                                nxt.append((callee, hit[0], f"[$this->{prop}[0], '{method}']()", path))
+                            continue
+                        name = "__invoke"
+                    hit = self._dispatch(target, name)
+                    if hit is not None:
+                        label = {
+                            "self": f"$this->{name}()",
+                            "call": f"$this->{prop}->{name}()",
+                            "magic": f"$this->{prop}",
+                            "invoke": f"($this->{prop})()",
+                        }[kind]
+                        if hit[1] != name:
+                            label += " -> __call"
+                        nxt.append((target, hit[0], label, path))
+                # depth-first in source order
+                stack.extend(reversed(nxt))
+        return SimulationReport(events=events, reached_sink=False, steps=steps)
+
+
+def _objects(root: Any) -> List[PHPObject]:
+    # every object in the payload once, in serialization order
+    out: List[PHPObject] = []
+    seen: Set[int] = set()
+    stack = [root]
+    while stack:
+        v = _deref(stack.pop())
+        if isinstance(v, PHPObject):
+            if id(v) in seen:
+                continue
+            seen.add(id(v))
+            out.append(v)
+            stack.extend(reversed(list(v.properties.values())))
+        elif isinstance(v, dict):
+            stack.extend(reversed(list(v.values())))
+        elif isinstance(v, (list, tuple)):
+            stack.extend(reversed(v))
+    return out
+
+
+_SIMULATORS: "weakref.WeakKeyDictionary[SummaryIndex, Simulator]" = weakref.WeakKeyDictionary()
+
+
+def get_simulator(index: SummaryIndex) -> Simulator:
+    # one simulator (and so one effect memo) per summary index
+    sim = _SIMULATORS.get(index)
+    if sim is None:
+        sim = _SIMULATORS[index] = Simulator(index)
+    return sim
+
+
+def simulate_unserialize(
+    spec: Optional[PayloadSpec] = None,
+    index: Optional[SummaryIndex] = None,
+    serialized: Optional[str] = None,
+    encoding: Optional[str] = None,
+    sink: Optional[str] = None,
+    max_steps: int = DEFAULT_MAX_STEPS,
+) -> SimulationReport:
+    root = load_payload(spec, serialized, encoding)
+    sim = get_simulator(index) if index is not None else Simulator(SummaryIndex([]))
+    return sim.run(root, sink=sink, max_steps=max_steps)
@@ -0,0 +1,350 @@
+import json
+import mmap
+import os
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .analyzer import analyzer_version
+from .compact import _COLUMNS, ClassStore, ClassView, MethodView, SinkView
+from .models import AnalysisSummary, ComposerPackage, SnapshotInfo
+
+
+# Binary snapshot of an analysis summary: the compact.ClassStore columns written section by
+# section after a small JSON header.
+#
+#   b"PCSNAP" FORMAT:u8 pad:u8 header_len:u32le header(JSON) pad-to-8 sections...
+#
+# Fixed-width columns are little-endian int32 arrays. A list column is CSR encoded: an offsets
+# array plus one flat value array, with a second level of offsets (and keys) for the nested
+# columns. Strings are one NUL-joined UTF-8 blob. Sections are zlib-compressed by default; the
+# loader maps the file and only inflates a section the first time a column is used, and an
+# uncompressed snapshot is read in place. Rows are decoded when a view asks for them, so
+# opening a snapshot costs the header, the string table and one view per class.
+
+MAGIC = b"PCSNAP"
+FORMAT = 1
+_ALIGN = 8
+_INTS = ("c_name", "c_file", "c_kind", "c_ns", "c_parent", "c_mstart", "m_name", "m_file", "m_line", "m_sstart", "s_name", "s_file", "s_line")
+_FLAT = ("c_props", "c_ifaces", "c_traits", "m_calls", "m_uses", "m_invokes", "m_static", "m_self")
+_PAIRS = ("c_imports",)
+_KEYED = ("m_triggers", "m_pcalls")
+
+
+def _ints(values: Iterable[int]) -> bytes:
+    a = array("i", values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _view(buf) -> Any:
+    # int32 column over a bytes-like object, without a copy where the byte order allows it
+    if sys.byteorder == "little":
+        return memoryview(buf).cast("B").cast("i")
+    a = array("i")
+    a.frombytes(bytes(buf))
+    a.byteswap()
+    return a
+
+
+class _Flat:
+    # row i -> tuple of ints (or of (k, v) pairs)
+    __slots__ = ("off", "vals", "pairs")
+
+    def __init__(self, off, vals, pairs: bool = False):
+        self.off = off
+        self.vals = vals
+        self.pairs = pairs
+
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def __getitem__(self, i: int) -> tuple:
+        a, b = self.off[i], self.off[i + 1]
+        if a == b:
+            return ()
+        row = self.vals[a:b]
+        return tuple(zip(row[0::2], row[1::2])) if self.pairs else tuple(row)
+
+
+class _Nested:
+    # row i -> tuple of groups; a group is (key, tuple of ints) for keyed columns, a tuple of ints
+    # otherwise; rows flagged in `nulls` are None
+    __slots__ = ("off", "keys", "goff", "vals", "nulls")
+
+    def __init__(self, off, keys, goff, vals, nulls):
+        self.off = off
+        self.keys = keys
+        self.goff = goff
+        self.vals = vals
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.off) - 1
+
+    def __getitem__(self, i: int) -> Optional[tuple]:
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        out = []
+        for g in range(self.off[i], self.off[i + 1]):
+            vals = tuple(self.vals[self.goff[g]:self.goff[g + 1]])
+            out.append((self.keys[g], vals) if self.keys is not None else vals)
+        return tuple(out)
+
+
+def _encode(name: str, col: Sequence[Any]) -> Dict[str, bytes]:
+    if name in _INTS:
+        return {name: _ints(col)}
+    if name in _FLAT or name in _PAIRS:
+        off = [0]
+        vals: List[int] = []
+        for row in col:
+            for x in row:
+                if name in _PAIRS:
+                    vals.extend(x)
+                else:
+                    vals.append(x)
+            off.append(len(vals))
+        return {f"{name}.off": _ints(off), f"{name}.val": _ints(vals)}
+    keyed = name in _KEYED
+    off, keys, goff, vals, nulls = [0], [], [0], [], []
+    for row in col:
+        nulls.append(1 if row is None else 0)
+        for group in row or ():
+            if keyed:
+                keys.append(group[0])
+                group = group[1]
+            vals.extend(group)
+            goff.append(len(vals))
+        off.append(len(goff) - 1)
+    out = {f"{name}.off": _ints(off), f"{name}.goff": _ints(goff), f"{name}.val": _ints(vals)}
+    if keyed:
+        out[f"{name}.key"] = _ints(keys)
+    else:
+        out[f"{name}.null"] = bytes(nulls)
+    return out
+
+
+def save_snapshot(summary: AnalysisSummary, path: str, compress: bool = True) -> SnapshotInfo:
+    # the summary's classes (views of any store, or models) are first copied into one store so
+    # every string is written once
+    store = ClassStore()
+    store.extend(summary.classes)
+    if any("\0" in s for s in store.strings):
+        raise ValueError("cannot snapshot a summary with NUL bytes in names")
+    blobs: Dict[str, bytes] = {"strings": "\0".join(store.strings).encode("utf-8", "surrogateescape")}
+    for name in _COLUMNS[1:]:
+        blobs.update(_encode(name, getattr(store, name)))
+    sections: Dict[str, List[Any]] = {}
+    body: List[bytes] = []
+    pos = 0
+    for name, raw in blobs.items():
+        data = zlib.compress(raw, 6) if compress else raw
+        sections[name] = [pos, len(data), "zlib" if compress else "raw"]
+        body.append(data)
+        pos += len(data)
+        pad = -pos % _ALIGN
+        body.append(b"\0" * pad)
+        pos += pad
+    header = json.dumps(
+        {
+            "analyzer": analyzer_version(),
+            "counts": [len(store.c_name), len(store.m_name), len(store.s_name)],
+            "strings": len(store.strings),
+            "files_scanned": summary.files_scanned,
+            "packages": [p.model_dump() for p in summary.packages],
+            "sections": sections,
+        },
+        separators=(",", ":"),
+    ).encode()
+    head = MAGIC + bytes([FORMAT, 0]) + len(header).to_bytes(4, "little") + header
+    head += b"\0" * (-len(head) % _ALIGN)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(head)
+        for chunk in body:
+            f.write(chunk)
+    os.replace(tmp, path)
+    return _info(path, json.loads(header))
+
+
+def _read_header(f) -> Tuple[Dict[str, Any], int]:
+    pre = f.read(len(MAGIC) + 6)
+    if len(pre) < len(MAGIC) + 6 or pre[: len(MAGIC)] != MAGIC:
+        raise ValueError("not a popchain snapshot")
+    if pre[len(MAGIC)] != FORMAT:
+        raise ValueError(f"snapshot format {pre[len(MAGIC)]} is not supported (expected {FORMAT})")
+    n = int.from_bytes(pre[len(MAGIC) + 2:], "little")
+    header = json.loads(f.read(n))
+    # the version names the parser backend too ("6:ast" / "6:regex"), as for the analysis cache
+    if header.get("analyzer") != analyzer_version():
+        raise ValueError(f"snapshot was built by analyzer version {header.get('analyzer')}, this is {analyzer_version()}; rebuild it")
+    end = len(MAGIC) + 6 + n
+    return header, end + (-end % _ALIGN)
+
+
+def _info(path: str, header: Dict[str, Any]) -> SnapshotInfo:
+    classes, methods, sinks = header["counts"]
+    return SnapshotInfo(
+        path=path,
+        size=os.path.getsize(path),
+        analyzer=header["analyzer"],
+        compressed=any(s[2] == "zlib" for s in header["sections"].values()),
+        classes=classes,
+        methods=methods,
+        sinks=sinks,
+        files_scanned=header["files_scanned"],
+    )
+
+
+def snapshot_info(path: str) -> SnapshotInfo:
+    with open(path, "rb") as f:
+        header, _ = _read_header(f)
+    return _info(path, header)
+
+
+class MappedStore(ClassStore):
+    # a read-only ClassStore over a mapped snapshot; each slot is filled on first access
+    __slots__ = ("_mm", "_base", "_sections", "_counts", "header")
+
+    def __init__(self, path: str):
+        # the mapping stays open for the store's lifetime: mapped columns are views into it
+        with open(path, "rb") as f:
+            header, base = _read_header(f)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = header
+        self._base = base
+        self._sections = header["sections"]
+        self._counts = header["counts"]
+        raw = bytes(self._section("strings"))
+        self.strings = raw.decode("utf-8", "surrogateescape").split("\0") if header["strings"] else []
+
+    def close(self) -> None:
+        # unmaps the snapshot (its file can then be replaced, on Windows too); views of a closed
+        # store cannot be read. Columns still referenced elsewhere keep the mapping alive until
+        # they are released
+        mm = getattr(self, "_mm", None)
+        if mm is None:
+            return
+        for name in _COLUMNS[1:]:
+            try:
+                delattr(self, name)
+            except AttributeError:
+                pass
+        self._mm = None
+        try:
+            mm.close()
+        except BufferError:
+            pass
+
+    def __del__(self):
+        self.close()
+
+    def _section(self, name: str):
+        if self._mm is None:
+            raise ValueError("snapshot store is closed")
+        off, size, codec = self._sections[name]
+        start = self._base + off
+        if codec == "zlib":
+            return zlib.decompress(self._mm[start:start + size])
+        return memoryview(self._mm)[start:start + size]
+
+    def _column(self, name: str) -> Any:
+        if name in _INTS:
+            return _view(self._section(name))
+        off = _view(self._section(f"{name}.off"))
+        vals = _view(self._section(f"{name}.val"))
+        if name in _FLAT or name in _PAIRS:
+            return _Flat(off, vals, pairs=name in _PAIRS)
+        goff = _view(self._section(f"{name}.goff"))
+        if name in _KEYED:
+            return _Nested(off, _view(self._section(f"{name}.key")), goff, vals, None)
+        return _Nested(off, None, goff, vals, self._section(f"{name}.null"))
+
+    def __getattr__(self, name: str) -> Any:
+        # only reached for slots that are still empty
+        if name.startswith("_"):
+            raise AttributeError(name)
+        classes, methods, sinks = self._counts
+        if name in _COLUMNS:
+            value = self._column(name)
+        elif name == "ids":
+            value = {s: i for i, s in enumerate(self.strings)}
+        elif name == "classes":
+            value = [ClassView(self, i) for i in range(classes)]
+        elif name == "methods":
+            value = [MethodView(self, i) for i in range(methods)]
+        elif name == "sinks":
+            value = [SinkView(self, i) for i in range(sinks)]
+        else:
+            raise AttributeError(name)
+        setattr(self, name, value)
+        return value
+
+    def __reduce__(self):
+        # pickles as a plain ClassStore with every column materialized
+        state = []
+        for name in _COLUMNS:
+            col = getattr(self, name)
+            if name == "strings":
+                state.append(list(col))
+            elif name in _INTS:
+                state.append(array("i", col))
+            else:
+                state.append([col[i] for i in range(len(col))])
+        return (_restore, (tuple(state),))
+
+
+def _restore(state: tuple) -> ClassStore:
+    store = ClassStore.__new__(ClassStore)
+    store.__setstate__(state)
+    return store
+
+
+def load_snapshot(path: str) -> AnalysisSummary:
+    # a summary backed by the mapped snapshot; the class table, indexes and call graph are built
+    # on first query as for a fresh scan
+    store = MappedStore(path)
+    summary = AnalysisSummary.model_construct(
+        classes=list(store.classes),
+        sinks=list(store.sinks),
+        files_scanned=store.header["files_scanned"],
+        packages=[ComposerPackage(**p) for p in store.header["packages"]],
+    )
+    summary._store = store
+    return summary
+
+
+def close_snapshots(summary: AnalysisSummary) -> int:
+    # closes the mapped snapshots behind a summary (a loaded or merged one) once it is no longer
+    # used; returns how many were open
+    stores = {id(s): s for s in [summary._store] + [getattr(c, "_s", None) for c in summary.classes] if isinstance(s, MappedStore)}
+    n = 0
+    for store in stores.values():
+        if store._mm is not None:
+            store.close()
+            n += 1
+    return n
+
+
+def merge_summaries(summaries: Sequence[AnalysisSummary]) -> AnalysisSummary:
+    # later summaries win: classes an earlier summary took from a file that a later one covers are
+    # dropped, so a fresh app scan overrides the same files in a prebuilt vendor snapshot.
+    # Views are shared, not copied
+    files: List[set] = [{c.file for c in s.classes} for s in summaries]
+    classes: List[Any] = []
+    sinks: List[Any] = []
+    scanned = 0
+    # every (package, version) is kept, as read_composer_packages does for composer.json and
+    # installed.json: GadgetDB.match prefers an installed version over a constraint by itself
+    packages: Dict[Tuple[str, Optional[str]], ComposerPackage] = {}
+    for i, s in enumerate(summaries):
+        later = set().union(*files[i + 1:]) if i + 1 < len(summaries) else set()
+        keep = [c for c in s.classes if c.file not in later]
+        classes.extend(keep)
+        sinks.extend(x for x in s.sinks if x.file not in later)
+        scanned += s.files_scanned - len(files[i] & later)
+        for p in s.packages:
+            packages.setdefault((p.name.lower(), p.version), p)
+    return AnalysisSummary.model_construct(classes=classes, sinks=sinks, files_scanned=scanned, packages=list(packages.values()))
@@ -1,61 +1,92 @@
-from typing import List
-from .models import Chains, ChainCandidate, ChainStep, SinkSpec, SourceSpec, ClassInfo
+from typing import Callable, Iterator, List, Optional, Tuple
+from .models import Chains, ChainCandidate, ChainStep, SinkSpec, SourceSpec, ClassInfo, MagicMethodInfo
+from .analyzer import STRING_CONTEXT_FUNCS
+from .hierarchy import fqcn
+from .index import SummaryIndex
+from .callgraph import get_call_graph
+from .graph import CALL_PENALTY, call_steps
+from .taint import sink_controlled
 
 
-def build_chain(classes: List[ClassInfo], sources: SourceSpec, sink: SinkSpec) -> Chains:
-    items: List[ChainCandidate] = []
-    for c in classes:
-        for m in c.methods:
-            if sink.name in m.calls:
-                base_score = 1.0
-                if m.name == "__wakeup":
-                    base_score += 0.5
-                if m.name == "__destruct":
-                    base_score += 0.2
-                if c.properties:
-                    base_score += 0.1
-                steps = [ChainStep(class_name=c.name, method=m.name)]
-                items.append(
-                    ChainCandidate(
-                        id=f"{c.name}:{m.name}:{sink.name}",
-                        steps=steps,
-                        sink=sink.name,
-                        score=base_score,
-                    )
-                )
+# (score, entry class, entry magic method, CallGraph.path() hops to the sink call)
+ScoredChain = Tuple[float, ClassInfo, MagicMethodInfo, list]
+
+
+def score_chains(index: SummaryIndex, sink: SinkSpec, where: Optional[Callable[[ClassInfo, MagicMethodInfo], bool]] = None) -> Iterator[ScoredChain]:
+    # one entry per magic method reaching the sink, in index order, without building its model;
+    # `where` drops entries before their call path is searched
+    calls = get_call_graph(index)
+    for c, m in calls.reaching(sink.name):
+        if where is not None and not where(c, m):
+            continue
+        base_score = 1.0
+        if m.name == "__wakeup":
+            base_score += 0.5
+        if m.name == "__destruct":
+            base_score += 0.2
+        if index.table.properties(c):
+            base_score += 0.1
+        # the sink is reached through ordinary method calls: rank the chain lower per call
+        hops = calls.path(c, m.name, sink.name) or []
+        last = index.table.resolve(hops[-1][0], hops[-1][1]) if len(hops) > 1 else (c, m)
+        base_score -= CALL_PENALTY * max(len(hops) - 1, 0)
+        # no argument of any matching call is fed by a property or parameter: system('ls')
+        if last is None or not any(sink_controlled(s) for s in last[1].sinks if s.name == sink.name):
+            base_score -= 0.9
+        yield round(base_score, 3), c, m, hops
+
+
+def chain_candidate(scored: ScoredChain, sink: SinkSpec) -> ChainCandidate:
+    score, c, m, hops = scored
+    name = fqcn(c)
+    return ChainCandidate(
+        id=f"{name}:{m.name}:{sink.name}",
+        steps=[ChainStep(class_name=name, method=m.name)] + call_steps(hops),
+        sink=sink.name,
+        score=score,
+    )
+
+
+def build_chain(classes: List[ClassInfo], sources: SourceSpec, sink: SinkSpec, index: Optional[SummaryIndex] = None) -> Chains:
+    items = [chain_candidate(x, sink) for x in score_chains(index or SummaryIndex(classes), sink)]
     items.sort(key=lambda x: x.score, reverse=True)
     return Chains(items=items)
 
 
-def build_trampoline_chain(classes: List[ClassInfo]) -> Chains:
+def build_trampoline_chain(classes: List[ClassInfo], index: Optional[SummaryIndex] = None) -> Chains:
+    index = index or SummaryIndex(classes)
     items: List[ChainCandidate] = []
-    str_funcs = {"preg_match", "preg_replace", "printf", "sprintf"}
-    for c in classes:
+    str_funcs = {s.lower() for s in STRING_CONTEXT_FUNCS}
+    for c in index.classes_with_any(("__wakeup", "__toString", "__get", "__invoke")):
         steps: List[ChainStep] = []
         score = 0.0
-        by_name = {m.name: m for m in c.methods}
+        name = fqcn(c)
+        by_name = {k: m for k, (_, m) in index.table.methods(c).items()}
         wakeup = by_name.get("__wakeup")
         tostr = by_name.get("__toString")
         getm = by_name.get("__get")
         invoke = by_name.get("__invoke")
-        if wakeup and any(fn in str_funcs for fn in wakeup.calls):
-            steps.append(ChainStep(class_name=c.name, method="__wakeup", note="string_context"))
+        # a property put in a string context (STRING_CONTEXT_FUNCS calls, echo, concatenation) as
+        # the analyzer detects it for __toString triggers
+        if wakeup and (wakeup.triggers.get("__toString") or any(fn.lower() in str_funcs for fn in wakeup.calls)):
+            steps.append(ChainStep(class_name=name, method="__wakeup", note="string_context"))
             score += 0.3
         if tostr:
-            undefined = [p for p in tostr.uses_properties if p not in set(c.properties or [])]
+            props = set(index.table.properties(c))
+            undefined = [p for p in tostr.uses_properties if p not in props]
             if undefined:
-                steps.append(ChainStep(class_name=c.name, method="__toString", note="access_undefined_property"))
+                steps.append(ChainStep(class_name=name, method="__toString", note="access_undefined_property"))
                 score += 0.3
         if getm and getattr(getm, "invokes_properties", []):
-            steps.append(ChainStep(class_name=c.name, method="__get", note="returns_callable_property"))
+            steps.append(ChainStep(class_name=name, method="__get", note="returns_callable_property"))
             score += 0.2
         if invoke:
-            steps.append(ChainStep(class_name=c.name, method="__invoke"))
+            steps.append(ChainStep(class_name=name, method="__invoke"))
             score += 0.2
         if steps:
             items.append(
                 ChainCandidate(
-                    id=f"{c.name}:trampoline",
+                    id=f"{name}:trampoline",
                     steps=steps,
                     sink="__invoke",
                     score=score,
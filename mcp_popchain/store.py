@@ -0,0 +1,82 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+from .models import AnalysisSummary
+
+
+class SummaryStore:
+    # LRU + TTL store so tools can pass a short summary id instead of the whole AnalysisSummary
+    def __init__(self, max_items: int = 16, ttl: float = 3600.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: "OrderedDict[str, Tuple[float, AnalysisSummary]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, summary: AnalysisSummary) -> str:
+        sid = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._items[sid] = (time.monotonic(), summary)
+            self._evict()
+        return sid
+
+    def get(self, summary_id: str) -> Optional[AnalysisSummary]:
+        with self._lock:
+            self._evict()
+            ent = self._items.get(summary_id)
+            if ent is None:
+                return None
+            self._items[summary_id] = (time.monotonic(), ent[1])
+            self._items.move_to_end(summary_id)
+            return ent[1]
+
+    def drop(self, summary_id: str) -> bool:
+        # an explicit release also unmaps the snapshots behind the summary (outside the lock);
+        # eviction only drops the reference, since a running tool call may still hold the summary,
+        # and the mapping goes away with its last user
+        with self._lock:
+            ent = self._items.pop(summary_id, None)
+        if ent is None:
+            return False
+        from .snapshot import close_snapshots
+
+        close_snapshots(ent[1])
+        return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict()
+            return len(self._items)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._items:
+            sid, (ts, _) = next(iter(self._items.items()))
+            if len(self._items) > self.max_items or now - ts > self.ttl:
+                del self._items[sid]
+            else:
+                break
+
+
+SUMMARIES = SummaryStore()
+
+
+def resolve_summary(summary: Optional[AnalysisSummary], summary_id: Optional[str]) -> AnalysisSummary:
+    if summary is not None:
+        return summary
+    if not summary_id:
+        raise ValueError("either summary or summaryId is required")
+    found = SUMMARIES.get(summary_id)
+    if found is None:
+        raise ValueError(f"unknown or expired summaryId: {summary_id}")
+    return found
+
+
+def summary_key(summary: Optional[AnalysisSummary], summary_id: Optional[str]) -> Optional[str]:
+    # what a listing cursor is bound to: a digest of an inline summary's content (it wins over
+    # summary_id in resolve_summary), else the store id, which is never reused
+    if summary is not None:
+        return hashlib.sha256(summary.model_dump_json().encode()).hexdigest()[:16]
+    return summary_id
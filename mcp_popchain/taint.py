@@ -0,0 +1,234 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+
+# sources of one expression: ($this properties read directly, local variables read)
+Sources = Tuple[Set[str], Set[str]]
+# what reaches one sink argument: (properties, indices of the method's parameters)
+Flow = Tuple[List[str], List[int]]
+
+_CACHE_SIZE = 4096
+_cache: "OrderedDict[Tuple[str, bytes], List[List[Flow]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(kind: str, key: bytes, compute) -> List[List[Flow]]:
+    # per-method summaries keyed by a digest of the method source: vendored copies and re-scans
+    # of unchanged methods are solved once per process
+    digest = (kind, hashlib.sha1(key).digest())
+    with _cache_lock:
+        hit = _cache.get(digest)
+        if hit is not None:
+            _cache.move_to_end(digest)
+            return hit
+    hit = compute()
+    with _cache_lock:
+        _cache[digest] = hit
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return hit
+
+
+def sink_controlled(sink) -> bool:
+    # a sink call is attacker-controlled when some argument is fed by a property or parameter;
+    # calls that were never analyzed (args is None) are assumed to be
+    if sink.args is None:
+        return True
+    return any(sink.args) or any(sink.params or [])
+
+
+def solve(params: Sequence[str], assigns: Sequence[Tuple[Sequence[str], Sources]], sites: Sequence[Sequence[Sources]]) -> List[List[Flow]]:
+    # flow-insensitive intra-procedural taint: every local is the union of everything ever assigned
+    # to it (loops and branches included), iterated to a fixpoint. Parameters are sources "#i"
+    env: Dict[str, Set[str]] = {p: {f"#{i}"} for i, p in enumerate(params)}
+    changed = True
+    while changed:
+        changed = False
+        for targets, (props, names) in assigns:
+            value = set(props)
+            for n in names:
+                value |= env.get(n, set())
+            for t in targets:
+                cur = env.setdefault(t, set())
+                if not value <= cur:
+                    cur |= value
+                    changed = True
+    out: List[List[Flow]] = []
+    for args in sites:
+        flows: List[Flow] = []
+        for props, names in args:
+            value = set(props)
+            for n in names:
+                value |= env.get(n, set())
+            flows.append(
+                (
+                    sorted(v for v in value if not v.startswith("#")),
+                    sorted(int(v[1:]) for v in value if v.startswith("#")),
+                )
+            )
+        out.append(flows)
+    return out
+
+
+# --- tree-sitter backend -------------------------------------------------------------------
+
+_PARAMS = ("simple_parameter", "variadic_parameter", "property_promotion_parameter")
+
+
+def _var(b: bytes, node) -> Optional[str]:
+    if node.type != "variable_name":
+        return None
+    name = b[node.start_byte + 1:node.end_byte].decode(errors="ignore")
+    return None if name == "this" else name
+
+
+def _sources(b: bytes, node) -> Sources:
+    # every $this->p and local variable read anywhere under node; closures are not told apart
+    props: Set[str] = set()
+    names: Set[str] = set()
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        t = n.type
+        if t == "member_access_expression":
+            obj = n.child_by_field_name("object")
+            if obj is not None and obj.type == "variable_name" and b[obj.start_byte:obj.end_byte] == b"$this":
+                name = n.child_by_field_name("name")
+                if name is not None and name.type == "name":
+                    props.add(b[name.start_byte:name.end_byte].decode(errors="ignore"))
+                continue
+        elif t == "variable_name":
+            v = _var(b, n)
+            if v is not None:
+                names.add(v)
+            continue
+        stack.extend(n.named_children)
+    return props, names
+
+
+def _targets(b: bytes, node) -> List[str]:
+    # locals written by an assignment target: $x, $x[..] / $x->y (weakly) and list() / [] patterns
+    while node.type in ("subscript_expression", "member_access_expression") and node.named_child_count:
+        node = node.named_child(0)
+    if node.type == "variable_name":
+        v = _var(b, node)
+        return [v] if v else []
+    if node.type in ("list_literal", "array_creation_expression"):
+        _, names = _sources(b, node)
+        return sorted(names)
+    return []
+
+
+def ast_flows(b: bytes, method, sink_nodes: Sequence) -> List[List[Flow]]:
+    # method: a method_declaration node; sink_nodes: its sink calls / include expressions in order
+    if not sink_nodes:
+        return []
+
+    def compute() -> List[List[Flow]]:
+        params: List[str] = []
+        plist = method.child_by_field_name("parameters")
+        for p in plist.named_children if plist is not None else []:
+            if p.type in _PARAMS:
+                name = p.child_by_field_name("name")
+                v = _var(b, name) if name is not None else None
+                params.append(v or "")
+        assigns: List[Tuple[List[str], Sources]] = []
+        body = method.child_by_field_name("body")
+        stack = [body] if body is not None else []
+        while stack:
+            n = stack.pop()
+            t = n.type
+            if t in ("assignment_expression", "augmented_assignment_expression", "reference_assignment_expression"):
+                left, right = n.child_by_field_name("left"), n.child_by_field_name("right")
+                if left is not None and right is not None:
+                    targets = _targets(b, left)
+                    if targets:
+                        assigns.append((targets, _sources(b, right)))
+            elif t == "foreach_statement":
+                kids = [c for c in n.named_children if c != n.child_by_field_name("body")]
+                if len(kids) >= 2:
+                    _, names = _sources(b, kids[1])
+                    assigns.append((sorted(names), _sources(b, kids[0])))
+            stack.extend(n.named_children)
+        sites: List[List[Sources]] = []
+        for node in sink_nodes:
+            args = node.child_by_field_name("arguments")
+            if args is not None:
+                sites.append([_sources(b, a) for a in args.named_children if a.type in ("argument", "variadic_unpacking")])
+            else:
+                # include / require take one expression
+                sites.append([_sources(b, node.named_child(0))] if node.named_child_count else [])
+        return solve(params, assigns, sites)
+
+    key = b[method.start_byte:method.end_byte] + b"\0" + b",".join(b"%d" % (n.start_byte - method.start_byte) for n in sink_nodes)
+    return _cached("ast", key, compute)
+
+
+# --- regex backend -------------------------------------------------------------------------
+
+_STRIP_RE = re.compile(r"'(?:[^'\\]|\\.)*'|//[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL)
+_THIS_RE = re.compile(r"\$this\s*\??->\s*([A-Za-z_]\w*)")
+_VAR_RE = re.compile(r"\$([A-Za-z_]\w*)")
+_ASSIGN_RE = re.compile(r"(?:(?:\blist\s*\(|\[)([^=;]*?)[\])]|\$([A-Za-z_]\w*)(?:\s*\[[^\]=]*\])*)\s*(?:\.|\+|-|\*|\?\?)?=(?![=>])\s*&?([^;]*)")
+_FOREACH_RE = re.compile(r"\bforeach\s*\((.*?)\s+as\s+([^)]*)\)", re.IGNORECASE | re.DOTALL)
+
+
+def _text_sources(s: str) -> Sources:
+    props = set(_THIS_RE.findall(s))
+    names = {n for n in _VAR_RE.findall(_THIS_RE.sub("", s)) if n != "this"}
+    return props, names
+
+
+def split_args(text: str, start: int) -> Tuple[List[str], int]:
+    # top-level arguments of the call whose "(" is just before `start`, and the end position
+    depth = 0
+    args: List[str] = []
+    cur = start
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "'\"":
+            j = i + 1
+            while j < n and text[j] != ch:
+                j += 2 if text[j] == "\\" else 1
+            i = j + 1
+            continue
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            if depth == 0:
+                if text[cur:i].strip():
+                    args.append(text[cur:i])
+                return args, i + 1
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(text[cur:i])
+            cur = i + 1
+        i += 1
+    return args, n
+
+
+def text_flows(params: str, body: str, sites: Sequence[Sequence[str]]) -> List[List[Flow]]:
+    # the same solver fed from source text: assignments and foreach headers found by regex,
+    # single-quoted strings and comments blanked first
+    if not sites:
+        return []
+
+    def compute() -> List[List[Flow]]:
+        clean = _STRIP_RE.sub("''", body)
+        assigns: List[Tuple[List[str], Sources]] = []
+        for m in _ASSIGN_RE.finditer(clean):
+            targets = sorted(_text_sources(m.group(1))[1]) if m.group(1) is not None else [m.group(2)]
+            if targets and targets != ["this"]:
+                assigns.append((targets, _text_sources(m.group(3))))
+        for m in _FOREACH_RE.finditer(clean):
+            assigns.append((sorted(_text_sources(m.group(2))[1]), _text_sources(m.group(1))))
+        names = [v for v in _VAR_RE.findall(_STRIP_RE.sub("''", params))]
+        return solve(names, assigns, [[_text_sources(_STRIP_RE.sub("''", a)) for a in args] for args in sites])
+
+    key = (params + "\0" + body + "\0" + "\1".join("\2".join(a) for a in sites)).encode("utf-8", "surrogateescape")
+    return _cached("text", key, compute)
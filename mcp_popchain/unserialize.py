@@ -0,0 +1,191 @@
+import re
+from typing import Any, Dict, List, Union
+from .payload import PHPCustom, PHPEnum, PHPObject, PHPRef, _text
+
+
+Buffer = Union[bytes, bytearray, memoryview, str]
+
+# tokens are matched in place on the input buffer; only string bodies are ever copied out
+_INT_RE = re.compile(rb"i:([+-]?[0-9]+);")
+_FLOAT_RE = re.compile(rb"d:((?:[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?)|-?INF|NAN);")
+_BOOL_RE = re.compile(rb"b:([01]);")
+_REF_RE = re.compile(rb"([rR]):([0-9]+);")
+_LEN_RE = re.compile(rb"[sOCaE]:([0-9]+):")
+_COUNT_RE = re.compile(rb":([0-9]+):\{")
+_NOKEY = object()
+
+
+class UnserializeError(ValueError):
+    def __init__(self, message: str, offset: int):
+        super().__init__(f"{message} at offset {offset}")
+        self.offset = offset
+
+
+class _Frame:
+    __slots__ = ("target", "left", "key", "is_object", "start")
+
+    def __init__(self, target: Any, left: int, is_object: bool, start: int):
+        self.target = target
+        self.left = left
+        self.key: Any = _NOKEY
+        self.is_object = is_object
+        self.start = start
+
+
+class _Parser:
+    def __init__(self, data: Buffer):
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogateescape")
+        self.buf = memoryview(data).cast("B") if not isinstance(data, bytes) else data
+        self.size = len(self.buf)
+        # slot -> value; every value except keys and R: takes a slot, as in php_var_unserialize
+        self.slots: List[Any] = [None]
+
+    def fail(self, message: str, offset: int) -> UnserializeError:
+        return UnserializeError(message, offset)
+
+    def expect(self, pos: int, ch: bytes, what: str) -> int:
+        if pos >= self.size:
+            raise self.fail(f"unexpected end of input, expected {what}", pos)
+        if self.buf[pos] != ch[0]:
+            raise self.fail(f"expected {what}, got {bytes(self.buf[pos:pos + 1])!r}", pos)
+        return pos + 1
+
+    def sized(self, pos: int, kind: str) -> tuple:
+        # `<t>:<len>:"<len bytes>"` -> (bytes, position after the closing quote)
+        m = _LEN_RE.match(self.buf, pos)
+        if m is None:
+            raise self.fail(f"malformed {kind} length", pos)
+        n = int(m.group(1))
+        start = self.expect(m.end(), b'"', "'\"'")
+        end = start + n
+        if end > self.size:
+            raise self.fail(f"{kind} length {n} runs past the end of input ({self.size - start} bytes left)", m.start(1))
+        if end >= self.size or self.buf[end] != 0x22:
+            raise self.fail(f"{kind} length {n} does not match the data, no closing '\"' after {n} bytes", m.start(1))
+        return bytes(self.buf[start:end]), end + 1
+
+    def key(self, pos: int) -> tuple:
+        t = self.buf[pos] if pos < self.size else -1
+        if t == 0x69:  # i
+            m = _INT_RE.match(self.buf, pos)
+            if m is None:
+                raise self.fail("malformed integer key", pos)
+            return int(m.group(1)), m.end()
+        if t == 0x73:  # s
+            raw, end = self.sized(pos, "string")
+            return _text(raw), self.expect(end, b";", "';'")
+        raise self.fail("array key must be an integer or a string", pos)
+
+    def value(self, pos: int) -> tuple:
+        # -> (value, position after it, frame for a container still to be filled or None)
+        buf = self.buf
+        if pos >= self.size:
+            raise self.fail("unexpected end of input", pos)
+        t = buf[pos]
+        if t == 0x4E:  # N
+            return None, self.expect(pos + 1, b";", "';'"), None
+        if t == 0x69:
+            m = _INT_RE.match(buf, pos)
+            if m is None:
+                raise self.fail("malformed integer", pos)
+            return int(m.group(1)), m.end(), None
+        if t == 0x62:
+            m = _BOOL_RE.match(buf, pos)
+            if m is None:
+                raise self.fail("malformed boolean", pos)
+            return m.group(1) == b"1", m.end(), None
+        if t == 0x64:
+            m = _FLOAT_RE.match(buf, pos)
+            if m is None:
+                raise self.fail("malformed float", pos)
+            return float(m.group(1).replace(b"INF", b"inf").replace(b"NAN", b"nan")), m.end(), None
+        if t == 0x73:
+            raw, end = self.sized(pos, "string")
+            return _text(raw), self.expect(end, b";", "';'"), None
+        if t == 0x61:
+            m = _LEN_RE.match(buf, pos)
+            if m is None or buf[m.end():m.end() + 1] != b"{":
+                raise self.fail("malformed array header", pos)
+            arr: Dict[Any, Any] = {}
+            return arr, m.end() + 1, _Frame(arr, int(m.group(1)), False, pos)
+        if t == 0x4F:
+            name, end = self.sized(pos, "class name")
+            m = _COUNT_RE.match(buf, end)
+            if m is None:
+                raise self.fail("malformed object property count", end)
+            obj = PHPObject(_text(name))
+            return obj, m.end(), _Frame(obj.properties, int(m.group(1)), True, pos)
+        if t == 0x43:
+            name, end = self.sized(pos, "class name")
+            m = _COUNT_RE.match(buf, end)
+            if m is None:
+                raise self.fail("malformed custom data length", end)
+            start = m.end()
+            n = int(m.group(1))
+            if start + n >= self.size or buf[start + n] != 0x7D:
+                raise self.fail(f"custom data length {n} does not match the data, no closing '}}' after {n} bytes", m.start(1))
+            return PHPCustom(_text(name), _text(bytes(buf[start:start + n]))), start + n + 1, None
+        if t == 0x45:
+            raw, end = self.sized(pos, "enum")
+            cls, sep, case = _text(raw).partition(":")
+            if not sep:
+                raise self.fail("enum name must be Class:Case", pos)
+            return PHPEnum(cls, case), self.expect(end, b";", "';'"), None
+        if t in (0x72, 0x52):
+            m = _REF_RE.match(buf, pos)
+            if m is None:
+                raise self.fail("malformed reference", pos)
+            n = int(m.group(2))
+            if not 0 < n < len(self.slots):
+                raise self.fail(f"reference to slot {n}, only {len(self.slots) - 1} defined", pos)
+            target = self.slots[n]
+            return (PHPRef(target) if t == 0x52 else target), m.end(), None
+        raise self.fail(f"unknown type {bytes(buf[pos:pos + 1])!r}", pos)
+
+    def parse(self, pos: int = 0) -> tuple:
+        stack: List[_Frame] = []
+        root: Any = None
+        while True:
+            if stack:
+                top = stack[-1]
+                if top.left == 0:
+                    if pos >= self.size or self.buf[pos] != 0x7D:
+                        kind = "object" if top.is_object else "array"
+                        raise self.fail(f"{kind} at offset {top.start} has more elements than its count", pos)
+                    pos += 1
+                    stack.pop()
+                    if not stack:
+                        return root, pos
+                    continue
+                if top.key is _NOKEY:
+                    if pos < self.size and self.buf[pos] == 0x7D:
+                        kind = "object" if top.is_object else "array"
+                        raise self.fail(f"{kind} at offset {top.start} ends {top.left} element(s) early", pos)
+                    top.key, pos = self.key(pos)
+                    continue
+            is_r = pos < self.size and self.buf[pos] == 0x52
+            value, pos, frame = self.value(pos)
+            if not is_r:
+                self.slots.append(value)
+            if stack:
+                top = stack[-1]
+                top.target[top.key] = value
+                top.key = _NOKEY
+                top.left -= 1
+            else:
+                root = value
+            if frame is not None:
+                stack.append(frame)
+            elif not stack:
+                return root, pos
+
+
+def php_unserialize(data: Buffer, allow_trailing: bool = False) -> Any:
+    # iterative parser for PHP serialize() output into the payload object graph (PHPObject,
+    # PHPCustom, PHPEnum, PHPRef, dict for arrays); raises UnserializeError with the byte offset
+    parser = _Parser(data)
+    value, end = parser.parse()
+    if not allow_trailing and end != parser.size:
+        raise UnserializeError("trailing data after the serialized value", end)
+    return value
@@ -1,4 +1,6 @@
+import asyncio
 import os
+import pytest
 from mcp_popchain.analyzer import analyze_php_repo
 from mcp_popchain.models import SinkSpec, SourceSpec
 from mcp_popchain.solver import build_chain
@@ -23,3 +25,946 @@ def test_chain():
 def test_payload():
     s = php_serialize_object("A", {"x": "id"})
     assert s.startswith("O:")
+
+
+def test_serializer_graph_references_and_bytes():
+    from mcp_popchain.payload import PHPObject, PHPRef, from_spec, php_serialize
+
+    # __destruct on A reaches B, whose __toString goes back to A
+    a = PHPObject("A")
+    b = PHPObject("B", {"owner": a, "protected:name": "héllo", "private:id": 1})
+    a.properties = {"next": b, "alias": PHPRef(b), "tags": {"7": "x", "07": "y"}}
+    assert php_serialize(a) == (
+        b'O:1:"A":3:{s:4:"next";O:1:"B":3:{s:5:"owner";r:1;s:7:"\x00*\x00name";s:6:"h\xc3\xa9llo";'
+        b's:5:"\x00B\x00id";i:1;}s:5:"alias";R:2;s:4:"tags";a:2:{i:7;s:1:"x";s:2:"07";s:1:"y";}}'
+    )
+    spec = from_spec({"__class__": "A", "__id__": "a", "next": {"__class__": "B", "owner": {"__ref__": "a"}}})
+    assert php_serialize(spec) == b'O:1:"A":1:{s:4:"next";O:1:"B":1:{s:5:"owner";r:1;}}'
+
+    deep = None
+    for i in range(5000):
+        deep = PHPObject("N", {"next": deep})
+    assert php_serialize(deep).count(b'O:1:"N"') == 5000
+
+
+def test_payload_batch_matrix():
+    import base64
+    import json
+    from mcp_popchain.payload import iter_payloads, iter_payloads_ndjson
+
+    template = {"hook": ["x", "y"], "cmd": "id"}
+    variants = {"cmd": ["id", "ls -la"], "path": ["/tmp", "/var"], "n": [1]}
+    rows = list(iter_payloads("A", template, variants))
+    assert len(rows) == 4
+    for variant, payload in rows:
+        assert payload == php_serialize_object("A", {**template, **variant})
+    lines = list(iter_payloads_ndjson("A", template, variants, encoding="base64", offset=1, limit=2))
+    first = json.loads(lines[0])
+    assert [json.loads(x)["index"] for x in lines] == [1, 2]
+    assert base64.b64decode(first["payload"]).decode() == php_serialize_object("A", {**template, **first["variant"]})
+    with pytest.raises(ValueError):
+        next(iter_payloads("A", {}, {}, encoding="hex"))
+
+
+def test_batch_payloads_match_single_serialization():
+    from mcp_popchain.payload import iter_payloads
+
+    # nested object specs are objects in batch mode too, and refs resolve inside one property
+    inner = {"__class__": "B", "__id__": "b", "cmd": "id", "self": {"__ref__": "b"}}
+    ((variant, payload),) = list(iter_payloads("A", {"inner": inner}, {"x": [1]}))
+    assert payload == php_serialize_object("A", {"inner": inner, "x": 1})
+    assert payload.startswith('O:1:"A":2:{s:5:"inner";O:1:"B":')
+    # object specs as variants, each row the same bytes as the single-payload tool
+    rows = list(iter_payloads("A", {"cmd": "id"}, {"inner": [inner, "plain", [inner, {"k": inner}]]}))
+    assert len(rows) == 3
+    for variant, payload in rows:
+        assert payload == php_serialize_object("A", {"cmd": "id", **variant})
+    with pytest.raises(ValueError, match="within one property"):
+        next(iter_payloads("A", {"inner": inner}, {"other": [{"__ref__": "b"}]}))
+
+
+def test_unserialize_round_trip_and_errors():
+    from mcp_popchain.payload import PHPObject, PHPRef, php_serialize
+    from mcp_popchain.unserialize import UnserializeError, php_unserialize
+
+    raw = (
+        b'O:1:"A":5:{s:1:"b";O:1:"B":1:{s:5:"owner";r:1;}s:1:"c";C:3:"Foo":4:{abcd}s:1:"e";E:6:"Suit:H";'
+        b's:1:"r";R:2;s:7:"\x00*\x00name";a:2:{i:0;d:0.5;s:1:"k";s:2:"\xc3\xa9";}}'
+    )
+    a = php_unserialize(memoryview(raw))
+    assert isinstance(a, PHPObject) and a.properties["b"].properties["owner"] is a
+    assert isinstance(a.properties["r"], PHPRef) and a.properties["r"].target is a.properties["b"]
+    assert a.properties["\x00*\x00name"] == {0: 0.5, "k": "é"}
+    assert php_serialize(a) == raw
+
+    nested = b"a:1:{i:0;" * 20000 + b"N;" + b"}" * 20000
+    assert php_serialize(php_unserialize(nested)) == nested
+
+    for bad, offset in [(b's:5:"abc";', 2), (b'a:2:{i:0;i:1;}', 13), (b"r:3;", 0), (b'O:1:"A":0:{}x', 12)]:
+        with pytest.raises(UnserializeError) as err:
+            php_unserialize(bad)
+        assert err.value.offset == offset
+
+
+def test_simulator_walks_triggered_magic(tmp_path):
+    from mcp_popchain.index import SummaryIndex
+    from mcp_popchain.models import PayloadSpec
+    from mcp_popchain.simulator import simulate_unserialize
+
+    (tmp_path / "chain.php").write_text(
+        """<?php
+namespace App;
+class Start { public $name; public function __destruct() { echo "bye " . $this->name; } }
+class Mid { public $conn; public function __toString() { return $this->conn->query("x"); } }
+class Proxy { public $fn, $arg; public function __call($m, $a) { return ($this->fn)($this->arg); } }
+class Loop { public $other; public function __toString() { return "" . $this->other; } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    idx = SummaryIndex(summary.classes)
+    spec = PayloadSpec(
+        class_name="App\\Start",
+        properties={"name": {"__class__": "App\\Mid", "conn": {"__class__": "App\\Proxy", "fn": "system", "arg": "id"}}},
+    )
+    report = simulate_unserialize(spec, index=idx)
+    assert report.reached_sink and report.sink == "system"
+    assert report.path == ["App\\Start::__destruct", "App\\Mid::__toString", "App\\Proxy::__call"]
+    assert any(e.step == "__call" and "$this->conn->query() -> __call" in e.detail for e in report.events)
+
+    # the same chain as a serialized string; a harmless callable does not reach the sink
+    serialized = 'O:9:"App\\Start":1:{s:4:"name";O:7:"App\\Mid":1:{s:7:"\\0*\\0conn";O:9:"App\\Proxy":1:{s:2:"fn";s:6:"strlen";}}}'
+    report = simulate_unserialize(index=idx, serialized=serialized.replace("\\0", "\0"))
+    assert not report.reached_sink and report.steps == 3
+
+    # a __toString cycle terminates and the step budget is honoured
+    loop = {"__class__": "App\\Loop", "__id__": "l", "other": {"__class__": "App\\Loop", "other": {"__ref__": "l"}}}
+    report = simulate_unserialize(PayloadSpec(class_name="App\\Start", properties={"name": loop}), index=idx)
+    assert not report.reached_sink and not report.truncated
+    report = simulate_unserialize(spec, index=idx, max_steps=2)
+    assert report.truncated and not report.reached_sink
+
+    # without an index every object is an unknown class, but its entry points still show up
+    report = simulate_unserialize(PayloadSpec(class_name="App\\Start", properties={"name": {"__class__": "App\\Mid"}}))
+    assert [(e.step, e.detail) for e in report.events if e.step in ("__wakeup", "__destruct")] == [
+        ("__wakeup", "App\\Start"),
+        ("__wakeup", "App\\Mid"),
+        ("__destruct", "App\\Start"),
+        ("__destruct", "App\\Mid"),
+    ]
+    assert report.events[0].step == "unserialize" and not report.reached_sink and report.steps == 0
+
+
+def test_verify_chains_pipeline(tmp_path):
+    from mcp_popchain.pipeline import verify_chains, verify_chains_all
+    from mcp_popchain.unserialize import php_unserialize
+
+    (tmp_path / "chain.php").write_text(
+        """<?php
+class Start { public $name; public function __destruct() { echo $this->name; } }
+class Wake { public $obj; public function __wakeup() { $this->obj->run(); } }
+class Mid { public $conn; public function __toString() { return $this->conn->query("x"); } }
+class Proxy { public $cmd; public function __call($m, $a) { system($this->cmd); } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    hits = list(verify_chains(summary.classes, "system", workers=2))
+    ids = [h.chain.id for h in hits]
+    assert ids[0] == "Wake:__wakeup>Proxy:__call:system"
+    assert "Start:__destruct>Mid:__toString>Proxy:__call:system" in ids
+    deep = hits[ids.index("Start:__destruct>Mid:__toString>Proxy:__call:system")]
+    root = php_unserialize(deep.payload)
+    assert root.properties["name"].properties["conn"].properties["cmd"] == "id"
+    assert deep.report.path == ["Start::__destruct", "Mid::__toString", "Proxy::__call"]
+    assert len(verify_chains_all(summary.classes, "system", limit=1, workers=1).items) == 1
+    assert [h.chain.id for h in verify_chains(summary.classes, "system")] == ids
+
+
+def test_verify_chains_tool_streams_each_hit(tmp_path):
+    import json
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from mcp_popchain import server
+
+    (tmp_path / "chain.php").write_text(
+        """<?php
+class Wake { public $obj; public function __wakeup() { $this->obj->run(); } }
+class Proxy { public $cmd; public function __call($m, $a) { system($this->cmd); } }
+"""
+    )
+    sid = server.SUMMARIES.put(analyze_php_repo(str(tmp_path), []))
+    logged = []
+
+    async def on_log(params):
+        logged.append((params.logger, json.loads(params.data)["chain"]["id"]))
+
+    async def run():
+        async with create_connected_server_and_client_session(server.mcp, logging_callback=on_log) as client:
+            result = await client.call_tool("verify_chains_tool", {"sink": {"name": "system"}, "summaryId": sid})
+            return [h["chain"]["id"] for h in result.structuredContent["items"]]
+
+    ids = asyncio.run(run())
+    assert ids == ["Wake:__wakeup>Proxy:__call:system"]
+    assert logged == [("popchain.verify_chains", ids[0])]
+
+
+def test_synthesize_payload_static_call_has_no_instance(tmp_path):
+    from mcp_popchain.graph import build_graph_chain
+    from mcp_popchain.index import SummaryIndex
+    from mcp_popchain.payload import to_spec
+    from mcp_popchain.pipeline import synthesize_payload
+
+    (tmp_path / "a.php").write_text(
+        """<?php
+class Kick { public $h; public function __destruct() { $this->h->shutdown(); } }
+class Proc { public $cmd; public function shutdown() { Shell::run($this->cmd); } }
+class Shell { public $mode; public static function run($c) { system($c); } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    idx = SummaryIndex(summary.classes)
+    (chain,) = build_graph_chain(summary.classes, "system", index=idx).items
+    assert chain.steps[-1].note == "static call"
+    # Shell::run reads nothing from Proc; the argument comes from Proc's own property
+    assert to_spec(synthesize_payload(chain, idx)) == {"__class__": "Kick", "h": {"__class__": "Proc", "cmd": "id"}}
+
+
+def test_call_graph_reaches_sinks_through_ordinary_methods(tmp_path):
+    from mcp_popchain.callgraph import get_call_graph
+    from mcp_popchain.index import SummaryIndex
+    from mcp_popchain.pipeline import verify_chains
+
+    (tmp_path / "log.php").write_text(
+        """<?php
+class Logger { public $handler; public function __destruct() { $this->handler->close(); } }
+class Base { public function flush() { file_put_contents($this->file, $this->data); } }
+class FileHandler extends Base {
+    public $file, $data, $next;
+    public function close() { $this->write(); }
+    public function write() { if ($this->next) { $this->close(); } parent::flush(); }
+    public function flush() { }
+}
+class Idle { public function __destruct() { $this->tidy(); } public function tidy() { } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    idx = SummaryIndex(summary.classes)
+    calls = get_call_graph(idx)
+    logger, handler = (idx.table.lookup(n) for n in ("Logger", "FileHandler"))
+    # close <-> write is a cycle; parent::flush reaches the overridden Base::flush
+    assert calls.sinks(handler, "close") == calls.sinks(handler, "write") == {"file_put_contents"}
+    assert calls.sinks(handler, "flush") == set()
+    assert calls.sinks(logger, "__destruct") == {"file_put_contents"}
+    assert calls.properties(handler, "close") == {"file", "data", "next"}
+    assert calls.properties(logger, "__destruct") == {"handler"}
+    assert [c.name for c, _ in calls.reaching("file_put_contents")] == ["Logger"]
+
+    (chain,) = build_chain(summary.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="file_put_contents"), idx).items
+    assert [(s.class_name, s.method, s.note) for s in chain.steps] == [
+        ("Logger", "__destruct", None),
+        ("FileHandler", "close", "call via $this->handler"),
+        ("FileHandler", "write", "self call"),
+        ("FileHandler", "flush", "self call"),
+    ]
+    (hit,) = list(verify_chains(summary.classes, "file_put_contents", index=idx, workers=1))
+    assert hit.report.path[:2] == ["Logger::__destruct", "FileHandler::close"]
+
+
+def test_call_graph_method_names_are_case_insensitive(tmp_path):
+    from mcp_popchain.callgraph import get_call_graph
+    from mcp_popchain.index import SummaryIndex
+
+    (tmp_path / "a.php").write_text(
+        """<?php
+class Job { public $cmd; public function __destruct() { $this->Run(); self::CLEAN(); } public function run() { system($this->cmd); } public function clean() { } }
+class Hook { public $job; public function __wakeup() { $this->job->RUN(); } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    idx = SummaryIndex(summary.classes)
+    calls = get_call_graph(idx)
+    job = idx.table.lookup("Job")
+    assert calls.sinks(job, "__destruct") == calls.sinks(job, "RUN") == {"system"}
+    assert calls.properties(job, "__destruct") == {"cmd"}
+    assert [c.name for c, _ in calls.reaching("system")] == ["Job", "Hook"]
+    # steps name the method as declared
+    assert [h[1] for h in calls.path(job, "__destruct", "system")] == ["__destruct", "run"]
+    chains = build_chain(summary.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system"), idx).items
+    steps = {c.steps[0].class_name: [(s.class_name, s.method) for s in c.steps] for c in chains}
+    assert steps == {"Job": [("Job", "__destruct"), ("Job", "run")], "Hook": [("Hook", "__wakeup"), ("Job", "run")]}
+
+
+def test_analyze_parallel_matches_serial(tmp_path):
+    for i in range(12):
+        (tmp_path / f"c{i}.php").write_text(
+            f"<?php\nclass C{i} {{\n    public $p;\n    function __destruct() {{\n        exec($this->p);\n    }}\n}}\n"
+        )
+    serial = analyze_php_repo(str(tmp_path), [])
+    parallel = analyze_php_repo(str(tmp_path), [], workers=2)
+    assert parallel.model_dump() == serial.model_dump()
+    assert parallel.files_scanned == 12
+
+
+def test_analyze_cache_rescans_only_changed(tmp_path, monkeypatch):
+    import json
+    import mcp_popchain.analyzer as analyzer
+
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    for i in range(3):
+        (repo / f"c{i}.php").write_text(f"<?php\nclass C{i} {{\n    function __destruct() {{\n        system('id');\n    }}\n}}\n")
+    cache_dir = str(tmp_path / "cache")
+    first = analyze_php_repo(str(repo), [], cache_dir=cache_dir)
+
+    scanned = []
+    real_scan = analyzer.scan_file
+    monkeypatch.setattr(analyzer, "scan_file", lambda f: scanned.append(f.path) or real_scan(f))
+    warm = analyze_php_repo(str(repo), [], cache_dir=cache_dir)
+    assert scanned == []
+    assert warm.model_dump() == first.model_dump()
+
+    (repo / "c1.php").write_text("<?php\nclass D1 {\n    function __wakeup() {\n        eval('1');\n    }\n}\n")
+    (repo / "c2.php").unlink()
+    updated = analyze_php_repo(str(repo), [], cache_dir=cache_dir)
+    assert scanned == [str(repo / "c1.php")]
+    assert sorted(c.name for c in updated.classes) == ["C0", "D1"]
+    assert updated.files_scanned == 2
+
+    # an entry that still matches the file but does not decode is rescanned and rewritten
+    (cache_file,) = (tmp_path / "cache").iterdir()
+    data = json.loads(cache_file.read_text())
+    data["files"][str(repo / "c0.php")][2] = {"broken": True}
+    cache_file.write_text(json.dumps(data))
+    scanned.clear()
+    again = analyze_php_repo(str(repo), [], cache_dir=cache_dir)
+    assert scanned == [str(repo / "c0.php")]
+    assert again.model_dump() == updated.model_dump()
+    scanned.clear()
+    analyze_php_repo(str(repo), [], cache_dir=cache_dir)
+    assert scanned == []
+
+
+def test_analyze_skip_policy(tmp_path):
+    (tmp_path / "ok.php").write_text("<?php\nclass Ok {\n    function __destruct() {\n        system('id');\n    }\n}\n")
+    (tmp_path / "big.php").write_text("<?php\nclass Big {}\n" + "// pad\n" * 2000)
+    (tmp_path / "min.php").write_text("<?php class Min { function __wakeup() { eval('1'); } }" + " " * 8000)
+    (tmp_path / "bin.php").write_bytes(b"<?php class Bin {}\x00\x01\x02")
+    summary = analyze_php_repo(str(tmp_path), [], max_file_size=12000, skip_minified=True)
+    assert [c.name for c in summary.classes] == ["Ok"]
+    assert summary.files_scanned == 1
+
+
+def test_compact_store_round_trips_models():
+    import pickle
+    from mcp_popchain.analyzer import PHPFile, find_classes
+    from mcp_popchain.compact import ClassStore, ClassView, to_models
+
+    code = """<?php
+namespace App;
+use Lib\\Base;
+class Job extends Base implements \\Countable {
+    public $cmd, $h;
+    public function __destruct() { $this->h->close(); system($this->cmd); }
+    public function run($x) { exec($x); }
+}
+"""
+    classes = find_classes(PHPFile("a.php", code))
+    models = [c.to_model() for c in classes]
+    assert isinstance(classes[0], ClassView)
+    assert models[0].imports == {"base": "Lib\\Base"} and models[0].methods[1].sinks[0].params == [[0]]
+    # a second file shares the merged store's strings; pydantic input is accepted too
+    store = ClassStore()
+    merged = store.extend(classes) + store.extend(find_classes(PHPFile("b.php", code.replace("Job", "Task")))) + store.extend(models)
+    assert [c.name for c in merged] == ["Job", "Task", "Job"]
+    assert merged[2].to_model() == merged[0].to_model() == models[0]
+    assert store.strings.count("system") == 1
+    for copy in (pickle.loads(pickle.dumps(store)), ClassStore.load(store.dump())):
+        assert [c.to_model() for c in copy.classes] == [c.to_model() for c in merged]
+        assert [s.name for s in copy.sinks] == ["system", "exec"] * 3
+
+    summary = analyze_php_repo(os.path.join(os.path.dirname(__file__), "..", "fixtures", "php"), [])
+    assert summary.model_dump() == to_models(summary).model_dump()
+    # views and inline models mix in one summary; both serialize as ClassInfo / SinkInfo, and the
+    # advertised schema only knows the models
+    from mcp_popchain.models import AnalysisSummary
+    from mcp_popchain.snapshot import merge_summaries
+
+    inline = AnalysisSummary(classes=[models[0].model_dump()], sinks=[], files_scanned=1)
+    mixed = merge_summaries([summary, inline])
+    assert mixed._store is None and isinstance(mixed.classes[-1], type(models[0]))
+    dumped = AnalysisSummary.model_validate_json(mixed.model_dump_json())
+    assert dumped.model_dump() == mixed.model_dump() and dumped.classes[-1] == models[0]
+    assert AnalysisSummary.model_json_schema()["properties"]["classes"]["items"] == {"$ref": "#/$defs/ClassInfo"}
+
+
+def test_ast_parser_is_cached():
+    from mcp_popchain import php_ast
+
+    php_ast.reset_parser_cache()
+    first = php_ast._get_parser()
+    assert php_ast._get_parser() is first
+    assert php_ast._UNAVAILABLE == (first is None)
+
+
+def test_find_classes_attributes_by_scope():
+    from mcp_popchain.analyzer import PHPFile, find_classes
+
+    code = """<?php
+// class Fake { function __destruct() { system('x'); } }
+class A {
+    public $x;
+    protected static ?array $opts = [];
+    public function __destruct() {
+        $s = "class Nope { }";
+        system($this->x);
+        ($this->cb)();
+    }
+    function helper() { eval($this->opts); }
+}
+class B {
+    private $y;
+    function __wakeup() { exec($this->y); }
+}
+"""
+    classes = find_classes(PHPFile("t.php", code))
+    assert [c.name for c in classes] == ["A", "B"]
+    a, b = classes
+    assert a.properties == ["x", "opts"]
+    assert b.properties == ["y"]
+    destruct, helper = a.methods
+    assert destruct.line == 6
+    assert (helper.name, [s.name for s in helper.sinks]) == ("helper", ["eval"])
+    assert [(s.name, s.line) for s in destruct.sinks] == [("system", 8)]
+    assert destruct.uses_properties == ["x"]
+    assert destruct.invokes_properties == ["cb"]
+    assert b.methods[0].calls == ["exec"]
+
+
+def test_extraction_structure_both_backends():
+    from mcp_popchain.analyzer import PHPFile, find_classes, find_classes_ast
+
+    code = """<?php
+namespace App\\Log;
+
+interface Sink extends \\Countable {}
+trait Buffered { public function __toString() { return Helper::drain($this->buf); } }
+class Handler extends Base implements Sink, \\Stringable {
+    use Buffered;
+    public $writer, $cb;
+    public function __destruct() {
+        $this->writer->write("x");
+        call_user_func($this->cb, 1);
+        $this->close();
+        echo $this->name;
+    }
+}
+"""
+    f = PHPFile("t.php", code)
+    backends = [find_classes(f)]
+    ast = find_classes_ast(f)
+    if ast:
+        backends.append(ast)
+    for classes in backends:
+        iface, trait, cls = classes
+        assert (iface.kind, iface.interfaces) == ("interface", ["\\Countable"])
+        assert trait.kind == "trait" and trait.methods[0].static_calls == ["Helper::drain"]
+        assert cls.namespace == "App\\Log"
+        assert (cls.parent, cls.interfaces, cls.traits) == ("Base", ["Sink", "\\Stringable"], ["Buffered"])
+        assert cls.properties == ["writer", "cb"]
+        (m,) = cls.methods
+        assert m.property_calls == {"writer": ["write"]}
+        assert m.self_calls == ["close"]
+        assert m.invokes_properties == ["cb"]
+        assert m.triggers == {"__toString": ["name"], "__call": ["writer"], "__invoke": ["cb"]}
+        assert "call_user_func" in [s.name for s in m.sinks]
+
+
+def test_sink_argument_taint_both_backends(tmp_path):
+    from mcp_popchain.analyzer import PHPFile, find_classes, find_classes_ast
+
+    code = """<?php
+class Job {
+    public $cmd, $q, $list;
+    public function __call($name, $args) {
+        $a = $this->cmd;
+        $b = "x " . $a;
+        system($b, $unused);
+        foreach ($this->list as $it) { $y = 'const'; exec($it, $y); }
+        [$u, $v] = $this->q;
+        passthru($v);
+        shell_exec($args[0]);
+    }
+}
+class Quiet { public function __destruct() { system('ls'); } }
+class Loud { public $cmd; public function __destruct() { system($this->cmd); } }
+"""
+    f = PHPFile("t.php", code)
+    backends = [find_classes(f)]
+    ast = find_classes_ast(f)
+    if ast:
+        backends.append(ast)
+    for classes in backends:
+        sinks = {s.name: s for s in classes[0].methods[0].sinks}
+        assert sinks["system"].args == [["cmd"], []]
+        assert sinks["exec"].args == [["list"], []]
+        assert sinks["passthru"].args == [["q"]]
+        assert (sinks["shell_exec"].args, sinks["shell_exec"].params) == ([[]], [[1]])
+        assert classes[1].methods[0].sinks[0].args == [[]]
+
+    (tmp_path / "a.php").write_text(code)
+    summary = analyze_php_repo(str(tmp_path), [])
+    chains = build_chain(summary.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system")).items
+    assert [c.steps[0].class_name for c in chains][-1] == "Quiet"
+    assert chains[0].score > chains[-1].score
+
+
+def test_class_table_resolves_inherited_magic(tmp_path):
+    from mcp_popchain.graph import build_graph_chain
+    from mcp_popchain.index import SummaryIndex
+    from mcp_popchain.solver import build_chain as solve
+
+    (tmp_path / "a.php").write_text(
+        "<?php\nnamespace A;\nclass Logger { public $cmd; public function __destruct() { system($this->cmd); } }\n"
+    )
+    (tmp_path / "b.php").write_text(
+        """<?php
+namespace B;
+trait Printable { public function __toString() { return $this->fn->run(); } }
+class Logger { use Printable; public $fn; }
+class FileLogger extends \\A\\Logger {}
+class Tail extends FileLogger {}
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    idx = SummaryIndex(summary.classes)
+    table = idx.table
+    tail = table.lookup("B\\Tail")
+    owner, m = table.resolve(tail, "__destruct")
+    assert (owner.namespace, owner.name, m.name) == ("A", "Logger", "__destruct")
+    assert table.properties(tail) == ["cmd"]
+    assert table.resolve(table.lookup("Logger", "B"), "__toString")[0].kind == "trait"
+    assert table.lookup("Logger") is None  # ambiguous short name
+
+    chains = solve(summary.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system"), index=idx)
+    assert sorted(c.id for c in chains.items) == ["A\\Logger:__destruct:system", "B\\FileLogger:__destruct:system", "B\\Tail:__destruct:system"]
+    assert [(c.namespace, c.name) for c, _ in idx.by_magic["__toString"]] == [("B", "Logger")]
+    graph = build_graph_chain(summary.classes, "system", index=idx)
+    assert all(s.class_name != "B\\Printable" for c in graph.items for s in c.steps)
+
+
+def test_lazy_analysis_follows_autoload(tmp_path):
+    from mcp_popchain.analyzer import load_classes
+
+    src = tmp_path / "vendor" / "acme" / "lib" / "src"
+    src.mkdir(parents=True)
+    (tmp_path / "vendor" / "composer").mkdir()
+    (tmp_path / "app").mkdir()
+    (tmp_path / "vendor" / "composer" / "autoload_psr4.php").write_text(
+        """<?php
+$vendorDir = dirname(__DIR__);
+$baseDir = dirname($vendorDir);
+return array(
+    'Vendor\\\\Lib\\\\' => array($vendorDir . '/acme/lib/src'),
+    'App\\\\' => array($baseDir . '/app'),
+);
+"""
+    )
+    (src / "Base.php").write_text(
+        "<?php\nnamespace Vendor\\Lib;\nclass Base { use Loggable; public $cmd; public function __destruct() { system($this->cmd); } }\n"
+    )
+    (src / "Loggable.php").write_text("<?php\nnamespace Vendor\\Lib;\ntrait Loggable { public $log; }\n")
+    (src / "Other.php").write_text("<?php\nnamespace Vendor\\Lib;\nclass Other { public function __toString() { return $this->x; } }\n")
+    (tmp_path / "app" / "Job.php").write_text("<?php\nnamespace App;\nuse Vendor\\Lib\\Base;\nclass Job extends Base {}\n")
+
+    full = analyze_php_repo(str(tmp_path), [])
+    lazy = analyze_php_repo(str(tmp_path), [], lazy=True)
+    assert (full.files_scanned, lazy.files_scanned) == (5, 3)  # full also scans autoload_psr4.php
+    assert "Other" not in {c.name for c in lazy.classes}
+    chains = build_chain(lazy.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system"))
+    assert "App\\Job:__destruct:system" in [c.id for c in chains.items]
+    assert load_classes(lazy, ["Vendor\\Lib\\"]) == 1
+    assert load_classes(lazy, ["Vendor\\Lib\\Other"]) == 0
+    assert "Other" in {c.name for c in lazy.classes}
+    with pytest.raises(ValueError):
+        load_classes(full, ["Vendor\\Lib\\Other"])
+
+
+def test_lazy_summary_finds_chains_living_in_vendor(tmp_path):
+    from mcp_popchain import server
+
+    src = tmp_path / "vendor" / "acme" / "lib" / "src"
+    src.mkdir(parents=True)
+    (tmp_path / "vendor" / "composer").mkdir()
+    (tmp_path / "vendor" / "composer" / "autoload_psr4.php").write_text(
+        "<?php\n$vendorDir = dirname(__DIR__);\nreturn array(\n    'Vendor\\\\Lib\\\\' => array($vendorDir . '/acme/lib/src'),\n);\n"
+    )
+    (src / "Kick.php").write_text("<?php\nnamespace Vendor\\Lib;\nclass Kick { public $h; function __destruct() { $this->h->shutdown(); } }\n")
+    (src / "Proc.php").write_text("<?php\nnamespace Vendor\\Lib;\nclass Proc { public $cmd; function shutdown() { Shell::run($this->cmd); } }\n")
+    (src / "Shell.php").write_text("<?php\nnamespace Vendor\\Lib;\nclass Shell { static function run($c) { system($c); } }\n")
+    (src / "Noise.php").write_text("<?php\nnamespace Vendor\\Lib;\nclass Noise { function other() { system('id'); } }\n")
+    (tmp_path / "index.php").write_text("<?php\nclass Home { function show() { echo 'hi'; } }\n")
+
+    handle = asyncio.run(server.analyze_php_repo_tool(str(tmp_path), returnHandle=True, lazy=True))
+    assert handle.classes == 1
+    chains = asyncio.run(server.build_chain_tool(sources=SourceSpec(entry="unserialize", controllable_properties={}), sink=SinkSpec(name="system"), summaryId=handle.summary_id))
+    assert [c.id for c in chains.items] == ["Vendor\\Lib\\Kick:__destruct:system"]
+    summary = server.SUMMARIES.get(handle.summary_id)
+    # magic-method classes, the hub target and its static callee are loaded; Noise is not
+    assert sorted(c.name for c in summary.classes) == ["Home", "Kick", "Proc", "Shell"]
+
+
+def test_gadget_db_semver_matching(tmp_path):
+    import json
+    from mcp_popchain.knowledge_base import GadgetDB, kb_match_by_packages
+    from mcp_popchain.models import AnalysisSummary, ComposerPackage
+    from mcp_popchain.semver import satisfies
+
+    assert satisfies("8.5.2", "^8.0") and not satisfies("9.0.0-beta1", "^8.0")
+    assert satisfies("1.2.9", "~1.2.3") and not satisfies("1.3.0", "~1.2.3")
+    assert satisfies("^8.0", ">=5.4 <9.0") and not satisfies("^9.0", ">=5.4 <9.0")
+    assert satisfies("1.5", ">=1.4.1 <=1.6.0 || >=1.17.2") and not satisfies("1.10", ">=1.4.1 <=1.6.0 || >=1.17.2")
+    assert satisfies("2.0.5", "1.0 - 2.0") and satisfies("dev-master", "^1.0")
+
+    gadgets = [
+        {"id": f"Acme/G{i}", "package": f"acme/p{i % 50}", "versions": f">={i % 7}.0 <{i % 7 + 1}.0", "sink": "system"}
+        for i in range(2000)
+    ]
+    path = tmp_path / "db.json"
+    path.write_text(json.dumps({"format": 1, "revision": "t", "gadgets": gadgets}))
+    db = GadgetDB()
+    db.load(str(path))
+    hits = db.match([("acme/p3", "^3.1"), ("acme/p3", "v3.2.0"), ("other/x", "1.0")])
+    assert hits and all(h.package == "acme/p3" and h.version == "v3.2.0" and h.versions == ">=3.0 <4.0" for h in hits)
+    summary = AnalysisSummary(classes=[], sinks=[], files_scanned=0, packages=[ComposerPackage(name="laravel/framework", version="^8.0")])
+    assert [i.name for i in kb_match_by_packages(summary).items] == ["Laravel/RCE2"]
+
+
+def test_fingerprint_matches_renamed_gadgets(tmp_path):
+    from mcp_popchain.fingerprint import fingerprint_gadgets
+
+    # a vendored ThinkPHP with every class, namespace and property renamed, and an extra call
+    # in the entry destructor
+    code = """<?php
+namespace Shop\\Io;
+abstract class Pipe { protected $list = []; }
+class Cleaner extends Pipe {
+    public $path;
+    public function __destruct() { $this->close(); $this->log(); $this->removeFiles(); }
+    public function close() { }
+    public function log() { }
+    public function removeFiles() { file_put_contents($this->path, ""); }
+}
+trait Export { public function __toString() { return $this->toJson(); } }
+class Record { use Export; protected $payload; public function toJson() { return $this->payload->render(); } }
+class View { public $cb, $arg; public function render() { return call_user_func($this->cb, $this->arg); } }
+class Noise { public function __destruct() { $this->flush(); } }
+"""
+    (tmp_path / "lib.php").write_text(code)
+    summary = analyze_php_repo(str(tmp_path), [])
+    items = fingerprint_gadgets(summary.classes).items
+    names = [i.name for i in items]
+    assert names.index("ThinkPHP/RCE1") < names.index("ThinkPHP/FW1")
+    rce = items[names.index("ThinkPHP/RCE1")]
+    assert rce.classes == ["Shop\\Io\\Cleaner::__destruct", "Shop\\Io\\Record::__toString"]
+    assert "Yii2/RCE1" not in names and "Guzzle/FW1" not in names
+    # Cleaner::__destruct also contains Monolog's close() shape, but reaches no call_user_func
+    assert "Monolog/RCE1" not in names
+
+
+def test_fingerprints_ignore_generic_destructors(tmp_path):
+    from mcp_popchain.fingerprint import FingerprintIndex, fingerprint_gadgets
+    from mcp_popchain.knowledge_base import GadgetDB
+    from mcp_popchain.models import KBItem
+
+    (tmp_path / "io.php").write_text(
+        """<?php
+class FileHandle { public $fp; function close() { fclose($this->fp); } function __destruct() { $this->close(); } }
+class Tmp { function __destruct() { } }
+"""
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    assert fingerprint_gadgets(summary.classes).items == []
+    bare = KBItem(framework="X", name="X/1", sink="system", fingerprints=[{"method": "__destruct"}])
+    with pytest.raises(ValueError, match="nothing but a method name"):
+        FingerprintIndex(GadgetDB([bare]))
+
+
+def test_summary_store_lru_and_ttl(monkeypatch):
+    import mcp_popchain.store as store
+    from mcp_popchain.models import AnalysisSummary
+
+    now = [0.0]
+    monkeypatch.setattr(store.time, "monotonic", lambda: now[0])
+    s = store.SummaryStore(max_items=2, ttl=10.0)
+    empty = AnalysisSummary(classes=[], sinks=[], files_scanned=0)
+    a, b = s.put(empty), s.put(empty)
+    assert s.get(a) is empty
+    c = s.put(empty)
+    assert s.get(b) is None
+    assert s.get(a) is empty and s.get(c) is empty
+    now[0] = 11.0
+    assert s.get(a) is None and len(s) == 0
+
+
+def test_tools_accept_summary_id():
+    pytest.importorskip("mcp")
+    from mcp_popchain import server
+
+    root = os.path.join(os.path.dirname(__file__), "..", "fixtures", "php")
+    handle = asyncio.run(server.analyze_php_repo_tool(root, returnHandle=True))
+    assert handle.classes >= 1
+    inline = asyncio.run(server.analyze_php_repo_tool(root))
+    by_id = asyncio.run(server.find_gadgets_tool(targetSink="system", summaryId=handle.summary_id))
+    # the original positional order (summary first) still works
+    assert by_id == asyncio.run(server.find_gadgets_tool(inline, "system"))
+    src, sink = SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system")
+    assert asyncio.run(server.build_chain_tool(inline, src, sink)) == asyncio.run(
+        server.build_chain_tool(sources=src, sink=sink, summaryId=handle.summary_id)
+    )
+    # the arguments that were required still are, in the advertised schemas and at the MCP boundary
+    tools = {t.name: t for t in asyncio.run(server.mcp.list_tools())}
+    assert tools["find_gadgets_tool"].inputSchema["required"] == ["targetSink"]
+    assert tools["build_chain_tool"].inputSchema["required"] == ["sources", "sink"]
+    with pytest.raises(Exception, match="targetSink"):
+        asyncio.run(server.mcp.call_tool("find_gadgets_tool", {"summaryId": handle.summary_id}))
+    assert len(by_id.items) >= 1
+    assert server.release_summary_tool(handle.summary_id)
+    with pytest.raises(ValueError):
+        server.list_magic_methods_tool(summaryId=handle.summary_id)
+
+
+def test_paginated_filtered_tools(tmp_path):
+    from mcp_popchain import server
+
+    for i in range(12):
+        ns = "App\\Jobs" if i % 2 else "Lib"
+        sub = "app" if i % 2 else "vendor/lib"
+        (tmp_path / sub).mkdir(parents=True, exist_ok=True)
+        magic = "__wakeup" if i % 3 == 0 else "__destruct"
+        (tmp_path / sub / f"C{i}.php").write_text(
+            f"<?php\nnamespace {ns};\nclass C{i} {{\n    public $cmd;\n    function {magic}() {{ system($this->cmd); }}\n    function __invoke() {{ ($this->cmd)(); }}\n}}\n"
+        )
+    handle = asyncio.run(server.analyze_php_repo_tool(str(tmp_path), returnHandle=True))
+    sid = handle.summary_id
+    src, sink = SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system")
+    full = asyncio.run(server.build_chain_tool(sources=src, sink=sink, summaryId=sid))
+    assert full.total == 12 and full.next_cursor is None
+    got, cursor = [], None
+    while True:
+        chunk = asyncio.run(server.build_chain_tool(sources=src, sink=sink, summaryId=sid, limit=5, cursor=cursor))
+        assert chunk.total == 12
+        got += chunk.items
+        cursor = chunk.next_cursor
+        if cursor is None:
+            break
+    assert got == full.items and [c.steps[0].method for c in got[:4]] == ["__wakeup"] * 4
+
+    wakeups = asyncio.run(server.build_chain_tool(sources=src, sink=sink, summaryId=sid, magic=["__wakeup"], namespace="\\App", limit=20))
+    assert sorted(c.id for c in wakeups.items) == ["App\\Jobs\\C3:__wakeup:system", "App\\Jobs\\C9:__wakeup:system"]
+    gadgets = asyncio.run(server.find_gadgets_tool(targetSink="system", summaryId=sid, pathPrefix="vendor/lib", limit=2))
+    assert gadgets.total == 6 and all(g.class_name.startswith("Lib\\") for g in gadgets.items) and gadgets.next_cursor
+    listed = server.list_magic_methods_tool(summaryId=sid, sink="system", namespace="Lib", limit=4)
+    assert listed.total == 6 and len(listed.items) == 4
+    # without limit the tool still returns one page, holding every match
+    everything = server.list_magic_methods_tool(summaryId=sid)
+    assert everything.total == len(everything.items) == 24 and everything.next_cursor is None
+    assert asyncio.run(server.sniff_trampolines_tool(summaryId=sid, minScore=0.7)).total == 12
+    # sink keeps trampolines that call the sink themselves; the __invoke ones do not
+    assert asyncio.run(server.sniff_trampolines_tool(summaryId=sid, sink="system")).items == []
+    with pytest.raises(ValueError):
+        asyncio.run(server.find_gadgets_tool(targetSink="system", summaryId=sid, cursor=gadgets.next_cursor))
+    # inline summaries bind the cursor to their content: a page of one is not a page of another
+    inline = server.SUMMARIES.get(sid)
+    first = server.list_magic_methods_tool(summary=inline, limit=4)
+    assert server.list_magic_methods_tool(summary=inline.model_copy(), cursor=first.next_cursor, limit=4).items
+    other = inline.model_copy(update={"classes": inline.classes[1:]})
+    with pytest.raises(ValueError, match="different query"):
+        server.list_magic_methods_tool(summary=other, cursor=first.next_cursor, limit=4)
+
+
+def test_graph_chain_multi_hop():
+    from mcp_popchain.graph import build_graph_chain
+
+    root = os.path.join(os.path.dirname(__file__), "..", "fixtures", "php")
+    summary = analyze_php_repo(root, [])
+    chains = build_graph_chain(summary.classes, "system", max_depth=4, top_k=10)
+    paths = [[(s.class_name, s.method) for s in c.steps] for c in chains.items]
+    assert [("A", "__destruct")] in paths
+    assert [("Start", "__destruct"), ("Middle", "__toString"), ("Finish", "__call")] in paths
+    assert all(len(c.steps) <= 2 for c in build_graph_chain(summary.classes, "system", max_depth=2).items)
+
+
+def test_trampolines_use_the_analyzer_string_contexts(tmp_path):
+    from mcp_popchain.gadgets import sniff_trampolines
+    from mcp_popchain.solver import build_trampoline_chain
+
+    # strtolower() is a string context for the analyzer's __toString triggers, so it is one for
+    # the trampoline solver too, in any case
+    (tmp_path / "a.php").write_text(
+        "<?php\nclass Tag { public $name; public function __wakeup() { $this->name = StrToLower($this->name); } }\n"
+    )
+    summary = analyze_php_repo(str(tmp_path), [])
+    (chain,) = build_trampoline_chain(summary.classes).items
+    assert [(s.method, s.note) for s in chain.steps] == [("__wakeup", "string_context")]
+    # and for the trampoline sniffer
+    sniffed = sniff_trampolines(summary.classes).items
+    assert [(g.class_name, g.method, g.sink) for g in sniffed] == [("Tag", "__wakeup", "__toString")]
+
+
+def test_summary_index_lookups():
+    from mcp_popchain.gadgets import sniff_trampolines
+    from mcp_popchain.index import get_index
+
+    root = os.path.join(os.path.dirname(__file__), "..", "fixtures", "php")
+    summary = analyze_php_repo(root, [])
+    idx = get_index(summary)
+    assert get_index(summary) is idx
+    assert [(c.name, m.name) for c, m in idx.by_sink["system"]] == [
+        (c.name, m.name) for c in summary.classes for m in c.methods if "system" in m.calls
+    ]
+    assert {c.name for c, _ in idx.by_magic["__toString"]} == {"Middle"}
+    assert [m.name for _, m in idx.prop_readers["cmd"]] == ["__call"]
+    assert [c.name for c in idx.classes_with_any(["__call", "__destruct"])] == [
+        c.name for c in summary.classes if any(m.name in ("__call", "__destruct") for m in c.methods)
+    ]
+    scores = [g.score for g in sniff_trampolines(summary.classes, index=idx).items]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_tool_pool_bounds_queue():
+    import threading
+    from mcp_popchain.executor import ToolPool
+
+    pool = ToolPool(max_workers=1, max_queue=1)
+    gate = threading.Event()
+
+    async def scenario():
+        slow = asyncio.ensure_future(pool.run(gate.wait, 5))
+        queued = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(RuntimeError):
+            await pool.run(lambda: "rejected")
+        gate.set()
+        return await slow, await queued
+
+    assert asyncio.run(scenario()) == (True, "queued")
+    assert pool.pending == 0
+
+
+def test_tool_pool_caps_each_client(monkeypatch):
+    import threading
+    from mcp.server.fastmcp import FastMCP
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from mcp_popchain import executor
+
+    monkeypatch.setattr(executor, "HEAVY", executor.ToolPool(max_workers=2, max_queue=2, per_client=1))
+    gate = threading.Event()
+    app = FastMCP("t")
+
+    @app.tool()
+    @executor.heavy
+    def slow() -> str:
+        gate.wait(5)
+        return "done"
+
+    async def scenario():
+        async with create_connected_server_and_client_session(app) as a, create_connected_server_and_client_session(app) as b:
+            first = asyncio.ensure_future(a.call_tool("slow", {}))
+            await asyncio.sleep(0.1)
+            again = await a.call_tool("slow", {})
+            other = asyncio.ensure_future(b.call_tool("slow", {}))
+            await asyncio.sleep(0.1)
+            gate.set()
+            return await first, again, await other
+
+    first, again, other = asyncio.run(scenario())
+    assert again.isError and "this client already has 1" in again.content[0].text
+    assert not first.isError and not other.isError
+    assert executor.HEAVY.pending == 0
+
+
+def test_snapshot_round_trip_and_merge(tmp_path, monkeypatch):
+    import pickle
+    from mcp_popchain import snapshot
+    from mcp_popchain.analyzer import analyzer_version
+    from mcp_popchain.compact import to_models
+    from mcp_popchain.snapshot import load_snapshot, merge_summaries, save_snapshot, snapshot_info
+
+    (tmp_path / "vendor" / "lib").mkdir(parents=True)
+    (tmp_path / "vendor" / "lib" / "A.php").write_text(
+        "<?php\nnamespace Lib;\nuse X\\Y as Z;\nclass A {\n    public $cb, $x;\n    function __destruct() { $f = $this->cb; $f($this->x); eval($this->x); }\n}\n"
+    )
+    (tmp_path / "vendor" / "lib" / "Old.php").write_text("<?php\nclass App { function __wakeup() { system('id'); } }\n")
+    (tmp_path / "app.php").write_text("<?php\nclass B extends \\Lib\\A { function __toString() { return system($this->x); } }\n")
+    full = analyze_php_repo(str(tmp_path), [])
+    for compress in (True, False):
+        path = str(tmp_path / f"full{compress}.snap")
+        info = save_snapshot(full, path, compress=compress)
+        assert info == snapshot_info(path) and info.classes == 3 and info.compressed == compress
+        loaded = load_snapshot(path)
+        assert loaded.model_dump() == to_models(full).model_dump()
+        assert [c.to_model() for c in pickle.loads(pickle.dumps(loaded._store)).classes] == [c.to_model() for c in full.classes]
+    chains = build_chain(loaded.classes, SourceSpec(entry="unserialize", controllable_properties={}), SinkSpec(name="system"))
+    assert any(c.id.startswith("B:") for c in chains.items)
+
+    # a vendor snapshot plus a fresh app scan; the later part wins for a file both cover
+    vendor = str(tmp_path / "vendor.snap")
+    save_snapshot(analyze_php_repo(str(tmp_path / "vendor"), []), vendor)
+    (tmp_path / "vendor" / "lib" / "Old.php").write_text("<?php\nclass Newer {}\n")
+    app = analyze_php_repo(str(tmp_path), [], exclude_dirs=[str(tmp_path / "vendor")])
+    assert [c.name for c in app.classes] == ["B"]
+    merged = merge_summaries([load_snapshot(vendor), app])
+    assert sorted(c.name for c in merged.classes) == ["A", "App", "B"] and merged.files_scanned == 3
+    rescanned = merge_summaries([load_snapshot(vendor), analyze_php_repo(str(tmp_path / "vendor" / "lib"), ["Old.php"])])
+    assert sorted(c.name for c in rescanned.classes) == ["A", "Newer"]
+
+    (tmp_path / "bad.snap").write_bytes(b"nope")
+    with pytest.raises(ValueError):
+        load_snapshot(str(tmp_path / "bad.snap"))
+    # a snapshot from the other parser backend is rejected like a stale analysis cache
+    other = "regex" if analyzer_version().endswith(":ast") else "ast"
+    monkeypatch.setattr(snapshot, "analyzer_version", lambda: analyzer_version().split(":")[0] + ":" + other)
+    with pytest.raises(ValueError, match="rebuild"):
+        load_snapshot(vendor)
+
+    # the vendor snapshot's installed version still beats the app's composer.json constraint
+    from mcp_popchain.knowledge_base import kb_match_by_packages
+    from mcp_popchain.models import AnalysisSummary, ComposerPackage
+
+    def with_packages(*pkgs):
+        return AnalysisSummary(classes=[], sinks=[], files_scanned=0, packages=[ComposerPackage(name="monolog/monolog", version=v) for v in pkgs])
+
+    installed = with_packages("1.10.0")
+    merged = merge_summaries([installed, with_packages("^1.0")])
+    assert kb_match_by_packages(merged) == kb_match_by_packages(installed)
+    assert len(kb_match_by_packages(with_packages("^1.0")).items) > len(kb_match_by_packages(installed).items)
+
+
+def test_snapshot_store_is_unmapped_when_released(tmp_path):
+    pytest.importorskip("mcp")
+    from mcp_popchain import server
+    from mcp_popchain.snapshot import close_snapshots, load_snapshot, save_snapshot
+    from mcp_popchain.store import SUMMARIES, SummaryStore
+
+    (tmp_path / "a.php").write_text("<?php\nclass A { public $x; function __destruct() { system($this->x); } }\n")
+    path = str(tmp_path / "a.snap")
+    save_snapshot(analyze_php_repo(str(tmp_path), []), path, compress=False)
+    loaded = load_snapshot(path)
+    assert [m.name for m in loaded.classes[0].methods] == ["__destruct"]
+    assert close_snapshots(loaded) == 1 and close_snapshots(loaded) == 0
+    with pytest.raises(ValueError, match="closed"):
+        loaded.classes[0].properties
+    # nothing maps the file any more, so it can be replaced in place
+    save_snapshot(analyze_php_repo(str(tmp_path), []), path)
+
+    # releasing a handle unmaps the snapshots merged into it
+    handle = asyncio.run(server.load_snapshot_tool([path]))
+    store = SUMMARIES.get(handle.summary_id).classes[0]._s
+    assert store._mm is not None
+    assert server.release_summary_tool(handle.summary_id)
+    assert store._mm is None
+    # eviction only drops the store's reference: a caller still using the summary can read it
+    small = SummaryStore(max_items=1)
+    in_use = small.get(small.put(load_snapshot(path)))
+    small.put(load_snapshot(path))
+    assert len(small) == 1
+    assert in_use._store._mm is not None
+    assert in_use.model_dump()["classes"][0]["name"] == "A"